@@ -19,6 +19,8 @@ import asyncio
 import signal
 import importlib
 
+from veles.db.backend import (
+    DbBackend, DB_BINDATA_PAGE_SIZE, DB_BINDATA_CODECS)
 from veles.server.conn import AsyncLocalConnection
 from veles.server.proto import (create_unix_server, create_tcp_server,
                                 create_ssl_server)
@@ -34,6 +36,19 @@ parser.add_argument(
 parser.add_argument(
     'database', nargs='?',
     help='path to database file, in-memory will be used if empty')
+parser.add_argument(
+    '--page-size', type=int, default=DB_BINDATA_PAGE_SIZE,
+    help='page size of newly stored binary data, in octets')
+parser.add_argument(
+    '--codec', choices=sorted(DB_BINDATA_CODECS),
+    help='compress newly stored binary data with the given codec')
+parser.add_argument(
+    '--dedup', action='store_true',
+    help='deduplicate identical pages of newly stored binary data')
+parser.add_argument(
+    '--file-size', type=int,
+    help='store binary data at least this many octets long in external '
+         'files next to the database')
 parser.add_argument('--plugin', action='append',
                     help='name plugin module to load')
 parser.add_argument(
@@ -48,7 +63,10 @@ logging.basicConfig(level=logging.getLevelName(args.log_level))
 logging.info('Świtezianka server is starting up...')
 loop = asyncio.get_event_loop()
 logging.info('Opening database...')
-conn = AsyncLocalConnection(loop, args.database)
+conn = AsyncLocalConnection(loop, DbBackend(
+    args.database, bindata_page_size=args.page_size,
+    bindata_codec=args.codec, bindata_dedup=args.dedup,
+    bindata_file_size=args.file_size))
 logging.info('Loading plugins...')
 if args.plugin is not None:
     for pname in args.plugin:
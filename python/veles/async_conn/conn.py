@@ -100,7 +100,7 @@ class AsyncConnection:
         to the given signature.  Returns an awaitable of the result.
         """
         params = sig.params.dump(params)
-        aresult = self.get_query_raw(node, sig.query, params, checks)
+        aresult = self.get_query_raw(node, sig.name, params, checks)
 
         async def get_result():
             result = await aresult
@@ -138,7 +138,7 @@ class AsyncConnection:
         according to the given signature.  Returns an awaitable of the result.
         """
         params = sig.params.dump(params)
-        aresult = self.run_method_raw(node, sig.method, params)
+        aresult = self.run_method_raw(node, sig.name, params)
 
         async def get_result():
             result = await aresult
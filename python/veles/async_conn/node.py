@@ -233,6 +233,22 @@ class AsyncNode:
             )
         ])
 
+    def transform_bindata(self, key, transform, start=0, end=None):
+        """
+        Applies a Transform to a range of binary data associated with this
+        object, on the server.  The transform must not change the size
+        of the data.  Returns an awaitable of None.
+        """
+        return self.conn.transaction([], [
+            operation.OperationTransformBinData(
+                node=self.id,
+                key=key,
+                start=start,
+                end=end,
+                transform=transform,
+            )
+        ])
+
     def run_method_raw(self, method, params):
         """
         Runs a method on the object.  Returns an awaitable of the result.
@@ -12,12 +12,121 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import mmap
 import operator
+import os
+import sys
+import weakref
+import zlib
 
+import six
 from six.moves import range
 
 from veles.compatibility.int_bytes import int_to_bytes, int_from_bytes
 
+from .search import SEARCH_CHUNK, SearchPattern
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# PyBUF_WRITABLE flag of the buffer protocol, see PEP 688.
+_PYBUF_WRITABLE = 0x1
+
+# Maps item sizes to unsigned array.array typecodes.
+_ARRAY_TYPECODES = {}
+for _typecode in 'QLIHB':
+    try:
+        _ARRAY_TYPECODES[array.array(_typecode).itemsize] = _typecode
+    except ValueError:
+        # No 'Q' on Python 2.
+        pass
+
+_ARRAY_INT_TYPECODES = 'bBhHiIlLqQ'
+
+
+def _numpy_dtype(ope):
+    """
+    Returns the NumPy dtype used to represent elements of the given size
+    in octets - a little-endian unsigned integer when there is one of
+    matching size, or a structured type with a single ``octets`` field
+    containing the raw little-endian octets otherwise.
+    """
+    if numpy is None:
+        raise ImportError('NumPy is required for NumPy interoperability')
+    if ope in (1, 2, 4, 8):
+        return numpy.dtype('<u{}'.format(ope))
+    return numpy.dtype([('octets', numpy.uint8, (ope,))])
+
+
+def _pack_elements(width, data):
+    """
+    Packs an iterable of ints into raw data for the given width, checking
+    that they are in range.  Everything but the final conversion of
+    over-64-bit elements is done by bulk operations on whole arrays.
+    """
+    ope = (width + 7) // 8
+    if isinstance(data, array.array) and data.typecode in _ARRAY_INT_TYPECODES:
+        elements = data
+    else:
+        elements = list(map(operator.index, data))
+    if len(elements) and (min(elements) < 0 or max(elements) >> width):
+        raise ValueError('BinData element out of range for width')
+    if ope == 1:
+        if isinstance(elements, array.array) and elements.itemsize != 1:
+            # bytearray() would take the raw octets of wider items.
+            elements = list(elements)
+        return bytearray(elements)
+    if ope > 8:
+        res = bytearray()
+        for x in elements:
+            res += int_to_bytes(x, ope, 'little')
+        return res
+    size = ope if ope in _ARRAY_TYPECODES else 8
+    packed = array.array(_ARRAY_TYPECODES[size], elements)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    packed = bytearray(packed.tobytes() if six.PY3 else packed.tostring())
+    if size == ope:
+        return packed
+    # Drop the high octets of every element.
+    res = bytearray(len(elements) * ope)
+    for i in range(ope):
+        res[i::ope] = packed[i::size]
+    return res
+
+
+def _octet_slice(start, stride, num, ope, octet):
+    """
+    Returns a slice selecting the given octet of ``num`` elements taken
+    with an extended slice (already resolved to ``start`` and ``stride``)
+    from raw data with ``ope`` octets per element.
+    """
+    if num == 0:
+        return slice(0, 0)
+    first = start * ope + octet
+    last = (start + (num - 1) * stride) * ope + octet
+    stop = last + 1 if stride > 0 else last - 1
+    return slice(first, stop if stop >= 0 else None, stride * ope)
+
+
+def _check_unused_bits(width, raw):
+    """
+    Raises ValueError if any element in the given raw data has non-zero
+    bits above ``width``.  Only the most significant octet of each element
+    has to be examined - they are extracted by a strided slice, and
+    the allowed values deleted with a single ``translate`` call.
+    """
+    if width % 8 == 0:
+        return
+    ope = (width + 7) // 8
+    allowed = bytes(bytearray(range(1 << (width % 8))))
+    if bytearray(raw[ope - 1::ope]).translate(None, allowed):
+        raise ValueError('raw data with non-zero unused bits')
+
 
 class BinData(object):
     """
@@ -33,6 +142,17 @@ class BinData(object):
     that fit in the range of ``width``-bit unsigned numbers.
 
     To create a copy of a BinData instance, use slicing: ``x[:]``.
+
+    The raw data is usually kept in a bytearray, but can also live in
+    memory shared with another object (see ``from_numpy``) or in a mapped
+    file (see ``from_file``).
+
+    Slices are views: they share the raw data of the sliced instance
+    (the owner) until either of them is modified, at which point
+    the modified one makes a private copy (copy-on-write).  The owner only
+    copies if any of its views are still alive.  Raw data that can be
+    written from outside (memory shared with a NumPy array, or exported
+    as a writable buffer) is never shared - slices of it are copies.
     """
 
     def __init__(self, width, data=()):
@@ -43,21 +163,31 @@ class BinData(object):
           in range for a ``width``-bit unsigned number.
         - an int: this creates a zero-filled BinData instance of the given
           size.
+
+        Arrays (``array.array`` or NumPy) and long iterables are packed
+        and range-checked in bulk, without a Python-level loop over
+        the elements (except for widths above 64 bits).
         """
         width = operator.index(width)
         if width <= 0:
             raise ValueError('BinData width must be positive')
         self._width = width
+        # For views, the instance whose raw data is shared.
+        self._owner = None
+        # For owners, a weak dict of views by id (created on first use).
+        self._views = None
+        # Set if the raw data can be written from outside, and thus can't
+        # be shared with views.
+        self._external = False
         ope = self.octets_per_element()
         if isinstance(data, int):
             self._raw_data = bytearray(data * ope)
+        elif (numpy is not None and isinstance(data, numpy.ndarray) and
+                data.dtype.kind in 'iu' and width <= 64):
+            self._raw_data = bytearray(
+                BinData.from_numpy(width, data).raw_view)
         else:
-            self._raw_data = bytearray()
-            for x in data:
-                x = operator.index(x)
-                if x >= (1 << width) or x < 0:
-                    raise ValueError('BinData element out of range for width')
-                self._raw_data += int_to_bytes(x, ope, 'little')
+            self._raw_data = _pack_elements(width, data)
 
     @classmethod
     def from_spaced_hex(cls, width, data):
@@ -81,14 +211,187 @@ class BinData(object):
         self._raw_data = bytearray(data)
         if len(self._raw_data) % self.octets_per_element() != 0:
             raise ValueError('raw data length not a multiple of element size')
+        _check_unused_bits(self._width, self._raw_data)
+        return self
+
+    @classmethod
+    def from_numpy(cls, width, data):
+        """
+        Creates a BinData instance from a one-dimensional NumPy array.
+        If the array already has the type returned by ``to_numpy`` for
+        the given width and is C-contiguous, no copy is made - the new
+        instance shares memory with the array, and modifying one is
+        visible in the other.  Otherwise, the array is converted first.
+        Integer arrays are accepted as long as all elements are in range
+        for a ``width``-bit unsigned number.
+        """
+        self = cls(width)
+        dtype = _numpy_dtype(self.octets_per_element())
+        data = numpy.asanyarray(data)
+        if data.ndim != 1:
+            raise ValueError('BinData can only be made from 1-d arrays')
+        if data.dtype.kind in 'iu':
+            if data.size and data.min() < 0:
+                raise ValueError('BinData element out of range for width')
+            if (data.size and width < data.dtype.itemsize * 8 and
+                    data.max() >> width):
+                raise ValueError('BinData element out of range for width')
+            if dtype.kind == 'V':
+                # No integer type of this size - cut the octets out of
+                # 64-bit little-endian integers.
+                ope = self.octets_per_element()
+                wide = data.astype('<u8').view(numpy.uint8).reshape(-1, 8)
+                raw = numpy.zeros((data.size, ope), dtype=numpy.uint8)
+                raw[:, :min(ope, 8)] = wide[:, :ope]
+                data = raw.view(dtype).reshape(-1)
+            data = numpy.ascontiguousarray(data, dtype=dtype)
+        elif data.dtype != dtype:
+            raise TypeError('array type not compatible with BinData width')
+        else:
+            data = numpy.ascontiguousarray(data)
+            # Integer arrays were already checked above.
+            _check_unused_bits(width, memoryview(data.view(numpy.uint8)))
+        raw = data.view(numpy.uint8)
+        self._raw_data = memoryview(raw)
+        self._external = True
+        return self
+
+    @classmethod
+    def from_file(cls, width, path, offset=0, length=None):
+        """
+        Creates a BinData instance backed by a memory-mapped file.  The raw
+        data starts at octet ``offset`` of the file and contains ``length``
+        elements (or everything up to the end of the file if ``length`` is
+        None - the remaining size must then be a multiple of element size).
+
+        Only the parts of the file that are actually accessed are read.
+        The mapping is private: modifications are not written back to
+        the file, and only the modified pages are copied to memory.
+        Note that for widths that are not a multiple of 8, the unused bits
+        are checked here, which reads the whole range once.
+        """
+        self = cls(width)
         ope = self.octets_per_element()
-        if self._width % 8 != 0:
-            to_check = self._raw_data[ope-1::ope]
-            correct = range(1 << (self._width % 8))
-            if not all(x in correct for x in to_check):
-                raise ValueError('raw data with non-zero unused bits')
+        offset = operator.index(offset)
+        if offset < 0:
+            raise ValueError('offset cannot be negative')
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            file_size = f.tell()
+            if offset > file_size:
+                raise ValueError('offset past the end of file')
+            if length is None:
+                size = file_size - offset
+                if size % ope != 0:
+                    raise ValueError(
+                        'file data length not a multiple of element size')
+            else:
+                length = operator.index(length)
+                if length < 0:
+                    raise ValueError('length cannot be negative')
+                size = length * ope
+                if offset + size > file_size:
+                    raise ValueError('not enough data in file')
+            if size == 0:
+                return self
+            # mmap offsets need to be aligned.
+            base = offset - offset % mmap.ALLOCATIONGRANULARITY
+            mapping = mmap.mmap(f.fileno(), offset + size - base,
+                                access=mmap.ACCESS_COPY, offset=base)
+        start = offset - base
+        self._raw_data = memoryview(mapping)[start:start + size]
+        _check_unused_bits(width, self._raw_data)
         return self
 
+    def to_numpy(self, writable=False):
+        """
+        Returns the elements as a one-dimensional NumPy array sharing memory
+        with this instance.  Elements of 1, 2, 4 or 8 octets are returned
+        as little-endian unsigned integers of that size; for all other
+        sizes, a structured type with a single ``octets`` field (an array
+        of raw little-endian octets) is used.
+
+        The array is read-only, unless ``writable`` is set - writes to
+        a writable array are visible in this instance, and it is the
+        caller's responsibility to keep the elements in range for
+        the width.  Operations that change the length of this instance
+        detach it from all arrays returned so far.
+        """
+        dtype = _numpy_dtype(self.octets_per_element())
+        if writable:
+            self._make_writable()
+        self._flatten()
+        if writable:
+            self._external = True
+        res = numpy.frombuffer(self._raw_data, dtype=dtype)
+        if not writable:
+            res.flags.writeable = False
+        return res
+
+    def __array__(self, dtype=None, copy=None):
+        """
+        Makes ``numpy.asarray`` work on BinData instances - see ``to_numpy``.
+        """
+        res = self.to_numpy()
+        if dtype is not None:
+            return res.astype(dtype)
+        if copy:
+            return res.copy()
+        return res
+
+    def _make_writable(self):
+        """
+        Makes sure the raw data can be modified in place, copying it into
+        a private bytearray if it lives in read-only memory or is shared
+        with live views.
+        """
+        if (self._owner is not None or self._views or
+                isinstance(self._raw_data, memoryview) and
+                self._raw_data.readonly):
+            self._set_raw_data(bytearray(self._raw_data))
+
+    def _flatten(self):
+        """
+        Makes sure the raw data is contiguous (strided views aren't),
+        copying it if necessary.  Strides are checked directly, since
+        memoryviews of a single element count as contiguous whatever
+        their stride is, but can't be concatenated.
+        """
+        raw = self._raw_data
+        if isinstance(raw, memoryview) and raw.strides != (raw.itemsize,):
+            self._set_raw_data(bytearray(raw))
+
+    def _set_raw_data(self, raw):
+        """
+        Replaces the raw data with a new, unshared buffer.
+        """
+        self._raw_data = raw
+        self._owner = None
+        self._views = None
+        self._external = False
+
+    def _view(self, raw, width=None):
+        """
+        Creates a view of this instance with the given raw data, which must
+        be a memoryview of this instance's raw data (and thus already
+        validated).  The view can have a different width, as long as
+        the raw data is valid for it.  If the raw data can be written from
+        outside, a copy is made instead.
+        """
+        res = BinData(self._width if width is None else width, 0)
+        if self._external:
+            res._raw_data = bytearray(raw)
+            return res
+        owner = self if self._owner is None else self._owner
+        res._raw_data = raw
+        res._owner = owner
+        # Keyed by id, since equal views (or views modified after being
+        # added) must still be tracked separately.
+        if owner._views is None:
+            owner._views = weakref.WeakValueDictionary()
+        owner._views[id(res)] = res
+        return res
+
     @property
     def width(self):
         """
@@ -99,13 +402,44 @@ class BinData(object):
     @property
     def raw_data(self):
         """
-        Returns this instance's raw data as bytes.  May be changed to
-        return a memoryview in the future.
+        Returns a copy of this instance's raw data as bytes.  Use
+        ``raw_view`` to avoid copying.
         """
         return bytes(self._raw_data)
 
+    @property
+    def raw_view(self):
+        """
+        Returns this instance's raw data as a read-only memoryview, without
+        copying.  The view reflects later in-place modifications of this
+        instance, but not ones that change its length.  On Pythons without
+        ``memoryview.toreadonly`` (before 3.8), the view is writable, but
+        must not be written to.
+        """
+        self._flatten()
+        view = memoryview(self._raw_data)
+        try:
+            return view.toreadonly()
+        except AttributeError:
+            return view
+
+    def __buffer__(self, flags):
+        """
+        Implements the buffer protocol (see PEP 688), exposing the raw data.
+        The buffer is read-only unless a writable one is requested - it is
+        then the caller's responsibility to keep the elements in range.
+        """
+        if flags & _PYBUF_WRITABLE:
+            self._make_writable()
+            self._flatten()
+            self._external = True
+            return memoryview(self._raw_data)
+        return self.raw_view
+
     def __hash__(self):
-        return hash((self._width, bytes(self._raw_data)))
+        # crc32 reads the buffer in place - hashing a memoryview would need
+        # a hashable (ie. immutable) underlying object.
+        return hash((self._width, zlib.crc32(self.raw_view)))
 
     def __eq__(self, other):
         """
@@ -148,18 +482,29 @@ class BinData(object):
         When the index is a slice object, returns a subrange of elements
         as a BinData instance of the same width.  Slicing syntax
         works as usual for Python sequences, including negative indices,
-        out of range indices, and strides (though strides other than 1
-        are not particularly efficient).
+        out of range indices, and strides.  The result is a copy-on-write
+        view (see class documentation), except for strides other than 1
+        with elements wider than one octet, which are copied (a memoryview
+        cannot express such strides).
         """
         ope = self.octets_per_element()
         if isinstance(idx, slice):
             start, stop, stride = idx.indices(len(self))
             if stride == 1:
-                raw = self._raw_data[start * ope:stop * ope]
-                return BinData.from_raw_data(self._width, raw)
+                stop = max(start, stop)
+                view = memoryview(self._raw_data)[start * ope:stop * ope]
+                return self._view(view)
+            elif ope == 1:
+                return self._view(memoryview(self._raw_data)[idx])
             else:
-                data = [self[x] for x in range(start, stop, stride)]
-                return BinData(self._width, data)
+                num = len(range(start, stop, stride))
+                raw = bytearray(num * ope)
+                for i in range(ope):
+                    raw[i::ope] = self._raw_data[
+                        _octet_slice(start, stride, num, ope, i)]
+                res = BinData(self._width)
+                res._raw_data = raw
+                return res
         else:
             idx = operator.index(idx)
             if idx < 0:
@@ -183,7 +528,8 @@ class BinData(object):
         BinData instance with the same width.  The elements selected
         by the slice are replaced with ones from the other BinData.
         If stride is 1, this can be used to expand or shrink this instance
-        (though this is not very efficient).  If stride is not 1,
+        (though this copies the whole data - see RopeBinData for cheap
+        splicing).  If stride is not 1,
         the operation is not efficient, and the length of the slice must be
         equal to the length of the assigned value.
         """
@@ -197,15 +543,31 @@ class BinData(object):
                 raise ValueError(
                     'value assigned to BinData slice has mismatched width')
             if stride == 1:
-                self._raw_data[start * ope:stop * ope] = val._raw_data
+                if stop < start:
+                    stop = start
+                if stop - start == len(val):
+                    raw = val.raw_view
+                    self._make_writable()
+                    self._raw_data[start * ope:stop * ope] = raw
+                else:
+                    # Build a new buffer instead of resizing the old one -
+                    # it may be shared with other objects.
+                    self._flatten()
+                    raw = bytearray(self._raw_data[:start * ope])
+                    raw += val.raw_view
+                    raw += self._raw_data[stop * ope:]
+                    self._set_raw_data(raw)
             else:
-                indices = range(start, stop, stride)
-                if len(indices) != len(val):
+                num = len(range(start, stop, stride))
+                if num != len(val):
                     raise ValueError(
                         'value assigned to extended slice has mismatched '
                         'length')
-                for i, v in zip(indices, val):
-                    self[i] = v
+                raw = bytearray(val._raw_data)
+                self._make_writable()
+                for i in range(ope):
+                    self._raw_data[
+                        _octet_slice(start, stride, num, ope, i)] = raw[i::ope]
         else:
             idx = operator.index(idx)
             if idx < 0:
@@ -219,8 +581,55 @@ class BinData(object):
             if val >= (1 << self._width) or val < 0:
                 raise ValueError('BinData element out of range for width')
             raw = int_to_bytes(val, ope, 'little')
+            self._make_writable()
             self._raw_data[ope * idx:ope * (idx + 1)] = raw
 
+    def _search_pattern(self, pattern, mask):
+        if not isinstance(pattern, BinData):
+            pattern = BinData(self._width, pattern)
+        if pattern._width != self._width:
+            raise ValueError('search pattern has mismatched width')
+        if mask is not None:
+            if not isinstance(mask, BinData):
+                mask = BinData(self._width, mask)
+            if mask._width != self._width:
+                raise ValueError('search mask has mismatched width')
+            mask = mask.raw_view
+        return SearchPattern(
+            self.octets_per_element(), pattern.raw_view, mask)
+
+    def finditer(self, pattern, start=0, end=None, mask=None):
+        """
+        Yields indices of all non-overlapping occurences of a sequence of
+        elements in this instance, or its ``start:end`` slice.
+        The pattern can be a BinData instance with the same width, or
+        anything accepted by the BinData constructor.  If ``mask`` is
+        given (in the same forms), only the pattern bits that are set
+        in the corresponding mask element have to match; the rest are
+        wildcards.  Searching is done on the raw data with ``bytes.find``,
+        a chunk at a time.
+        """
+        pattern = self._search_pattern(pattern, mask)
+        start, end, _ = slice(start, end).indices(len(self))
+        ope = self.octets_per_element()
+        raw = self.raw_view[start * ope:max(start, end) * ope]
+        chunks = (
+            raw[pos:pos + SEARCH_CHUNK]
+            for pos in range(0, len(raw), SEARCH_CHUNK)
+        )
+        for pos in pattern.search(chunks):
+            yield start + pos // ope
+
+    def find(self, pattern, start=0, end=None, mask=None):
+        """
+        Returns the index of the first occurence of a sequence of elements
+        in this instance, or -1 if not found.  See finditer for
+        the arguments.
+        """
+        for pos in self.finditer(pattern, start, end, mask):
+            return pos
+        return -1
+
     def __str__(self):
         """
         Returns the elements of this instance as space-separated hex numbers.
@@ -244,5 +653,8 @@ class BinData(object):
             return NotImplemented
         if self._width != other._width:
             raise ValueError('concatenating BinData of different widths')
-        return BinData.from_raw_data(self._width,
-                                     self._raw_data + other._raw_data)
+        raw = bytearray(self._raw_data)
+        raw += other.raw_view
+        res = BinData(self._width)
+        res._raw_data = raw
+        return res
@@ -0,0 +1,322 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import operator
+import zlib
+
+from six.moves import range
+
+from veles.compatibility.int_bytes import int_to_bytes, int_from_bytes
+
+from .bindata import BinData
+
+
+# Number of elements converted at once by bulk conversions - bounds
+# the size of temporary buffers.  Must be a multiple of 8.
+PACK_CHUNK = 0x80000
+
+# _BIT_TABLES[b] maps an octet to its b-th bit.
+_BIT_TABLES = [
+    bytes(bytearray((x >> b) & 1 for x in range(256)))
+    for b in range(8)
+]
+
+# _SHIFT_TABLES[b] maps an octet x to x << b (truncated to 8 bits).
+_SHIFT_TABLES = [
+    bytes(bytearray((x << b) & 0xff for x in range(256)))
+    for b in range(8)
+]
+
+
+def _or_columns(columns, size):
+    """
+    ORs together equal-length octet strings and returns the result as
+    ``size`` octets.  Done on big ints, so it runs at C speed.
+    """
+    acc = 0
+    for col in columns:
+        acc |= int_from_bytes(col, 'little')
+    return int_to_bytes(acc, size, 'little')
+
+
+def _unpack_bits(raw, width, start, count):
+    """
+    Unpacks ``count`` densely packed ``width``-bit elements, starting from
+    element ``start`` of ``raw``, returning a bytes object with one element
+    per octet.  The bits are first spread out one per octet, then each
+    element is gathered from a strided slice per bit - there is no Python
+    loop over the elements.
+    """
+    bit_start = start * width
+    nbits = count * width
+    octets = bytearray(raw[bit_start // 8:(bit_start + nbits + 7) // 8])
+    bits = bytearray(len(octets) * 8)
+    for b in range(8):
+        bits[b::8] = octets.translate(_BIT_TABLES[b])
+    bits = bits[bit_start % 8:bit_start % 8 + nbits]
+    return _or_columns([
+        bits[b::width].translate(_SHIFT_TABLES[b])
+        for b in range(width)
+    ], count)
+
+
+def _pack_bits(elements, width):
+    """
+    Inverse of _unpack_bits: packs a bytes-like object with one element
+    per octet into a dense bit string, returned as a bytearray.
+    """
+    elements = bytearray(elements)
+    nbits = len(elements) * width
+    bits = bytearray(nbits + (-nbits) % 8)
+    for b in range(width):
+        bits[b:nbits:width] = elements.translate(_BIT_TABLES[b])
+    return bytearray(_or_columns([
+        bits[b::8].translate(_SHIFT_TABLES[b])
+        for b in range(8)
+    ], len(bits) // 8))
+
+
+class PackedBinData(object):
+    """
+    A densely bit-packed counterpart of BinData for widths below 8 bits.
+
+    Element ``i`` occupies bits ``i * width`` to ``(i + 1) * width - 1``
+    of the raw data, with bits numbered starting from the LSB of the first
+    octet (which is what a little-endian repack from 8-bit data would
+    expect).  Unused bits at the end of the last octet are 0.
+
+    Single elements can be read and written in O(1).  Conversions from
+    and to the octet-aligned BinData layout are done in bulk.  Slicing and
+    slice assignment work as for BinData, but go through a conversion.
+    """
+
+    def __init__(self, width, data=()):
+        """
+        Creates a PackedBinData instance.  ``data`` can be a BinData
+        instance with the same width, or anything accepted by the BinData
+        constructor.
+        """
+        width = operator.index(width)
+        if width <= 0:
+            raise ValueError('PackedBinData width must be positive')
+        if width >= 8:
+            raise ValueError('PackedBinData width must be below 8')
+        self._width = width
+        if isinstance(data, int):
+            self._size = data
+            self._raw_data = bytearray((data * width + 7) // 8)
+            return
+        if not isinstance(data, BinData):
+            data = BinData(width, data)
+        elif data.width != width:
+            raise ValueError('PackedBinData width mismatch')
+        self._size = len(data)
+        self._raw_data = bytearray()
+        for pos in range(0, self._size, PACK_CHUNK):
+            self._raw_data += _pack_bits(
+                data.raw_view[pos:pos + PACK_CHUNK], width)
+
+    @classmethod
+    def from_bindata(cls, data):
+        """
+        Creates a PackedBinData instance from a BinData instance.
+        """
+        if not isinstance(data, BinData):
+            raise TypeError('from_bindata needs a BinData instance')
+        return cls(data.width, data)
+
+    @classmethod
+    def from_spaced_hex(cls, width, data):
+        """
+        Like BinData.from_spaced_hex.
+        """
+        return cls(width, BinData.from_spaced_hex(width, data))
+
+    @classmethod
+    def from_raw_data(cls, width, data, size):
+        """
+        Creates a PackedBinData instance of ``size`` elements from given
+        packed raw data.
+        """
+        self = cls(width)
+        size = operator.index(size)
+        if size < 0:
+            raise ValueError('PackedBinData size cannot be negative')
+        self._size = size
+        self._raw_data = bytearray(data)
+        nbits = size * self._width
+        if len(self._raw_data) != (nbits + 7) // 8:
+            raise ValueError('raw data length does not match size')
+        if nbits % 8 and self._raw_data[-1] >> (nbits % 8):
+            raise ValueError('raw data with non-zero unused bits')
+        return self
+
+    def to_bindata(self):
+        """
+        Converts this instance to an octet-aligned BinData instance.
+        """
+        return self._unpack(0, self._size)
+
+    def _unpack(self, start, stop):
+        raw = bytearray()
+        for pos in range(start, stop, PACK_CHUNK):
+            raw += _unpack_bits(self._raw_data, self._width, pos,
+                                min(PACK_CHUNK, stop - pos))
+        return BinData.from_raw_data(self._width, raw)
+
+    @property
+    def width(self):
+        """
+        Returns this instance's width in bits.
+        """
+        return self._width
+
+    @property
+    def raw_data(self):
+        """
+        Returns a copy of this instance's packed raw data as bytes.
+        """
+        return bytes(self._raw_data)
+
+    @property
+    def raw_view(self):
+        """
+        Returns this instance's packed raw data as a read-only memoryview
+        (see BinData.raw_view).
+        """
+        view = memoryview(self._raw_data)
+        try:
+            return view.toreadonly()
+        except AttributeError:
+            return view
+
+    def octets(self):
+        """
+        Returns size of the packed raw data of this instance, in octets.
+        """
+        return len(self._raw_data)
+
+    def __len__(self):
+        return self._size
+
+    def __hash__(self):
+        return hash((self._width, self._size, zlib.crc32(self.raw_view)))
+
+    def __eq__(self, other):
+        """
+        Instances are equal iff they have the same width and elements.
+        A PackedBinData is never equal to a BinData - compare the result of
+        ``to_bindata`` instead.
+        """
+        return (isinstance(other, PackedBinData) and
+                self._width == other._width and
+                self._size == other._size and
+                self._raw_data == other._raw_data)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def _index(self, idx):
+        idx = operator.index(idx)
+        if idx < 0:
+            if idx < -self._size:
+                raise IndexError('PackedBinData index out of range')
+            idx += self._size
+        else:
+            if idx >= self._size:
+                raise IndexError('PackedBinData index out of range')
+        return idx
+
+    def __getitem__(self, idx):
+        """
+        Returns a single element as an int, or a slice as a new
+        PackedBinData instance.
+        """
+        if isinstance(idx, slice):
+            indices = range(*idx.indices(self._size))
+            if not indices:
+                return PackedBinData(self._width)
+            lo = min(indices[0], indices[-1])
+            hi = max(indices[0], indices[-1]) + 1
+            data = self._unpack(lo, hi)
+            if indices.step != 1:
+                data = data[indices[0] - lo::indices.step]
+            return PackedBinData(self._width, data)
+        pos = self._index(idx) * self._width
+        octet = pos >> 3
+        shift = pos & 7
+        val = self._raw_data[octet]
+        if shift + self._width > 8:
+            val |= self._raw_data[octet + 1] << 8
+        return val >> shift & ((1 << self._width) - 1)
+
+    def __setitem__(self, idx, val):
+        """
+        Sets a single element, or replaces a slice with the elements of
+        a PackedBinData or BinData instance of the same width (with the same
+        rules as for BinData).
+        """
+        if isinstance(idx, slice):
+            if isinstance(val, PackedBinData):
+                val = val.to_bindata()
+            if not isinstance(val, BinData):
+                raise TypeError('value assigned to PackedBinData slice must '
+                                'be PackedBinData or BinData')
+            data = self.to_bindata()
+            data[idx] = val
+            res = PackedBinData(self._width, data)
+            self._size = res._size
+            self._raw_data = res._raw_data
+            return
+        pos = self._index(idx) * self._width
+        val = operator.index(val)
+        if val >= (1 << self._width) or val < 0:
+            raise ValueError('PackedBinData element out of range for width')
+        octet = pos >> 3
+        shift = pos & 7
+        mask = ((1 << self._width) - 1) << shift
+        cur = self._raw_data[octet]
+        if shift + self._width > 8:
+            cur |= self._raw_data[octet + 1] << 8
+        cur = cur & ~mask | val << shift
+        self._raw_data[octet] = cur & 0xff
+        if shift + self._width > 8:
+            self._raw_data[octet + 1] = cur >> 8
+
+    def __iter__(self):
+        for pos in range(0, self._size, PACK_CHUNK):
+            for x in self._unpack(pos, min(pos + PACK_CHUNK, self._size)):
+                yield x
+
+    def __str__(self):
+        """
+        Returns the elements as space-separated hex numbers, like BinData.
+        """
+        return str(self.to_bindata())
+
+    def __repr__(self):
+        return 'PackedBinData.from_spaced_hex({}, \'{}\')'.format(
+            self._width, self)
+
+    def __add__(self, other):
+        """
+        Concatenates two PackedBinData instances of the same width.
+        """
+        if not isinstance(other, PackedBinData):
+            return NotImplemented
+        if self._width != other._width:
+            raise ValueError(
+                'concatenating PackedBinData of different widths')
+        return PackedBinData(self._width,
+                             self.to_bindata() + other.to_bindata())
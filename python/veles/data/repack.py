@@ -23,6 +23,16 @@ try:
 except ImportError:
     from fractions import gcd
 
+try:
+    from functools import lru_cache
+except ImportError:
+    from backports.functools_lru_cache import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from veles.schema.model import Model
 from veles.schema import fields, enumeration
 
@@ -35,6 +45,97 @@ class Endian(enumeration.EnumModel):
     BIG = 'big'
 
 
+class _RepackPlan(object):
+    """
+    The precomputed schedule of a repacking, for one repack unit.
+    Bit positions are counted from the LSB of the unit, which is the big
+    int built as described in the Repacker docs.
+
+    - ``src_shifts``: position of each source element in the unit.
+    - ``dst_shifts``: position of each destination element (without
+      padding) in the unit.
+    - ``pieces``: for each destination element, a list of
+      ``(source element, source shift, mask, destination shift)`` tuples
+      describing the source bits it is made of.
+    - ``columns``: if all widths and paddings are multiples of 8,
+      a list of ``(destination octet, source octet)`` pairs within a unit,
+      which lets the repacking be done by copying strided octet columns.
+      None otherwise.
+    - ``view``: True if the destination raw data is identical to
+      the source raw data.
+    """
+
+    def __init__(self, endian, from_width, to_width, high_pad, low_pad):
+        padded_width = to_width + high_pad + low_pad
+        unit = padded_width * from_width // gcd(padded_width, from_width)
+        self.unit = unit
+        self.spu = spu = unit // from_width
+        self.dpu = dpu = unit // padded_width
+        if endian is Endian.LITTLE:
+            self.src_shifts = [i * from_width for i in range(spu)]
+            self.dst_shifts = [i * padded_width + low_pad for i in range(dpu)]
+        else:
+            self.src_shifts = [
+                (spu - i - 1) * from_width for i in range(spu)]
+            self.dst_shifts = [
+                (dpu - i - 1) * padded_width + low_pad for i in range(dpu)]
+        self.pieces = []
+        for dst in self.dst_shifts:
+            pieces = []
+            for i, src in enumerate(self.src_shifts):
+                lo = max(dst, src)
+                hi = min(dst + to_width, src + from_width)
+                if lo < hi:
+                    pieces.append(
+                        (i, lo - src, (1 << (hi - lo)) - 1, lo - dst))
+            self.pieces.append(pieces)
+        if (from_width | to_width | high_pad | low_pad) % 8 == 0:
+            # The unit is a sequence of octets - work out where each
+            # destination octet comes from.
+            src_octets = {}
+            for i, src in enumerate(self.src_shifts):
+                for j in range(from_width // 8):
+                    src_octets[src + j * 8] = i * from_width // 8 + j
+            self.columns = [
+                (i * to_width // 8 + j, src_octets[dst + j * 8])
+                for i, dst in enumerate(self.dst_shifts)
+                for j in range(to_width // 8)
+            ]
+            self.view = all(d == s for d, s in self.columns) and (
+                padded_width == to_width)
+        else:
+            self.columns = None
+            self.view = False
+
+
+@lru_cache(maxsize=None)
+def _get_plan(endian, from_width, to_width, high_pad, low_pad):
+    return _RepackPlan(endian, from_width, to_width, high_pad, low_pad)
+
+
+# Maximum number of source elements gathered at once by repack_many -
+# bounds the size of temporary arrays.
+BATCH_ELEMENTS = 0x100000
+
+
+def to_uint64(data, idx=None):
+    """
+    Converts a BinData of width up to 64 to a NumPy uint64 array (NumPy
+    has to be available).  If ``idx`` is given, it is an integer array
+    of indices of the elements to convert, and the result has the same
+    shape.
+    """
+    ope = data.octets_per_element()
+    arr = data.to_numpy()
+    if idx is not None:
+        arr = arr[idx]
+    if ope in (1, 2, 4, 8):
+        return arr.astype(numpy.uint64)
+    octets = numpy.zeros(arr.shape + (8,), dtype=numpy.uint8)
+    octets[..., :ope] = arr['octets']
+    return octets.view('<u8').reshape(arr.shape)
+
+
 class Repacker(Model):
     """
     Repacks binary data to a different element width.  Repacking conceptually
@@ -119,6 +220,10 @@ class Repacker(Model):
         should start.  ``num_element`` specifies the number of destination
         elements that should be returned (or None to repack as much data
         as possible).
+
+        If the result would have the same raw data as the source (ie.
+        for LITTLE endian repacking between multiples of 8 bits without
+        padding), it is returned as a copy-on-write view of the source.
         """
         if not isinstance(src, BinData):
             raise TypeError('repack needs a BinData instance')
@@ -127,33 +232,221 @@ class Repacker(Model):
         start = operator.index(start)
         if start < 0:
             raise ValueError('start cannot be negative')
-        ru = self.repack_unit
-        spu = ru // self.from_width
-        dpu = ru // self.padded_width
+        plan = self._plan
         if num_elements is None:
             num_elements = self.repackable_size(len(src) - start)
         rs = self.repack_size(num_elements)
         if start + rs > len(src):
             raise ValueError('not enough data in source')
-        units = (rs + spu - 1) // spu
-        res = BinData(self.to_width, num_elements)
+        units = (rs + plan.spu - 1) // plan.spu
+        if plan.view:
+            pos = start * src.octets_per_element()
+            size = num_elements * self.to_width // 8
+            return src._view(src.raw_view[pos:pos + size], self.to_width)
+        if plan.columns is not None:
+            return self._repack_columns(src, start, num_elements, units)
+        if self._numpy_ok():
+            return self._repack_numpy(src, start, num_elements, rs, units)
+        return self._repack_ints(src, start, num_elements, units)
+
+    def repack_iter(self, chunks):
+        """
+        Repacks data given as an iterable of source chunks, yielding
+        the result as a sequence of BinData blocks.  The chunks can be
+        BinData instances of the source width, or bytes-like objects
+        with raw source data (which may split elements between chunks,
+        but cannot be mixed with BinData chunks when they do).  The result
+        is the same as repacking all the chunks concatenated together
+        with ``num_elements`` of None.
+
+        Only the elements of the last incomplete repack unit are carried
+        over between chunks, so memory use is bounded by the chunk size,
+        not the total data size.
+        """
+        plan = self._plan
+        ope = (self.from_width + 7) // 8
+        leftover = BinData(self.from_width)
+        raw_leftover = b''
+        for chunk in chunks:
+            if not isinstance(chunk, BinData):
+                if isinstance(chunk, memoryview):
+                    chunk = chunk.tobytes()
+                raw = raw_leftover + chunk
+                split = len(raw) - len(raw) % ope
+                raw_leftover = raw[split:]
+                chunk = BinData.from_raw_data(self.from_width, raw[:split])
+            elif chunk.width != self.from_width:
+                raise ValueError('repack source width mismatch')
+            elif raw_leftover:
+                raise ValueError('BinData chunk after a partial element')
+            data = leftover + chunk if len(leftover) else chunk
+            full = len(data) // plan.spu
+            if full:
+                yield self.repack(data, 0, full * plan.dpu)
+            leftover = data[full * plan.spu:]
+        if raw_leftover:
+            raise ValueError('source data ends with a partial element')
+        num_elements = self.repackable_size(len(leftover))
+        if num_elements:
+            yield self.repack(leftover, 0, num_elements)
+
+    @property
+    def _plan(self):
+        """
+        The compiled repack plan - computed once per distinct set of
+        parameters.
+        """
+        return _get_plan(self.endian, self.from_width, self.to_width,
+                         self.high_pad, self.low_pad)
+
+    def _repack_columns(self, src, start, num_elements, units):
+        plan = self._plan
+        unit_octets = plan.unit // 8
+        src_ope = self.from_width // 8
+        dst_ope = self.to_width // 8
+        raw = src.raw_view[start * src_ope:
+                           (start + units * plan.spu) * src_ope].tobytes()
+        # Pad the last unit - the padding is never copied to the result.
+        raw += b'\0' * (units * unit_octets - len(raw))
+        res = bytearray(units * plan.dpu * dst_ope)
+        for dst, src_pos in plan.columns:
+            res[dst::plan.dpu * dst_ope] = raw[src_pos::unit_octets]
+        del res[num_elements * dst_ope:]
+        return BinData.from_raw_data(self.to_width, res)
+
+    def _numpy_ok(self):
+        return numpy is not None and max(
+            self.from_width, self.to_width, self.padded_width) <= 64
+
+    def _repack_numpy(self, src, start, num_elements, rs, units):
+        plan = self._plan
+        data = numpy.zeros((units, plan.spu), dtype=numpy.uint64)
+        data.reshape(-1)[:rs] = to_uint64(src[start:start + rs])
+        res = self._run_plan(data)
+        return BinData(self.to_width, res.reshape(-1)[:num_elements])
+
+    def _run_plan(self, data):
+        """
+        Runs the plan on a NumPy array of source units with one unit per
+        row, returning an array of destination units.
+        """
+        plan = self._plan
+        res = numpy.zeros((len(data), plan.dpu), dtype=numpy.uint64)
+        u64 = numpy.uint64
+        for i, pieces in enumerate(plan.pieces):
+            for s, src_shift, mask, dst_shift in pieces:
+                res[:, i] |= (
+                    (data[:, s] >> u64(src_shift)) & u64(mask)
+                ) << u64(dst_shift)
+        return res
+
+    def _repack_group(self, src, starts, num_elements):
+        """
+        Repacks ``num_elements`` elements at each of the given source
+        indices, which are already checked.
+        """
+        if self._plan.view:
+            raw = src.raw_view
+            ope = src.octets_per_element()
+            size = num_elements * self.to_width // 8
+            return [
+                src._view(raw[start * ope:start * ope + size], self.to_width)
+                for start in starts
+            ]
+        if self._numpy_ok():
+            return self._repack_batch(src, starts, num_elements)
+        return [self.repack(src, start, num_elements) for start in starts]
+
+    def _repack_batch(self, src, starts, num_elements):
+        """
+        Like _repack_group, but gathers all the records into one NumPy
+        array and repacks them together.
+        """
+        plan = self._plan
+        rs = self.repack_size(num_elements)
+        units = (rs + plan.spu - 1) // plan.spu
+        if not num_elements or not starts:
+            return [BinData(self.to_width, num_elements) for _ in starts]
+        offsets = numpy.arange(units * plan.spu)
+        batch = max(1, BATCH_ELEMENTS // (units * plan.spu))
+        res = []
+        for pos in range(0, len(starts), batch):
+            idx = numpy.add.outer(
+                numpy.array(starts[pos:pos + batch]), offsets)
+            # Elements past the repack size only fill up the last unit -
+            # read element 0 instead (which always exists) and clear them.
+            idx[:, rs:] = 0
+            data = to_uint64(src, idx)
+            data[:, rs:] = 0
+            out = self._run_plan(data.reshape(-1, plan.spu))
+            out = out.reshape(len(idx), -1)[:, :num_elements]
+            flat = BinData(self.to_width, out.reshape(-1))
+            raw = flat.raw_view
+            size = num_elements * flat.octets_per_element()
+            res += [
+                flat._view(raw[i * size:(i + 1) * size])
+                for i in range(len(idx))
+            ]
+        return res
+
+    def _repack_ints(self, src, start, num_elements, units):
+        plan = self._plan
         mask = (1 << self.to_width) - 1
+        res = []
         for u in range(units):
             unit = 0
-            sp = start + u * spu
-            for i, x in enumerate(src[sp:sp + spu]):
-                if self.endian is Endian.LITTLE:
-                    unit |= x << (i * self.from_width)
-                else:
-                    unit |= x << ((spu - i - 1) * self.from_width)
-            for i in range(min(dpu, num_elements - u * dpu)):
-                if self.endian is Endian.LITTLE:
-                    pos = i * self.padded_width
-                else:
-                    pos = (dpu - i - 1) * self.padded_width
-                res[u * dpu + i] = unit >> (pos + self.low_pad) & mask
-        return res
+            sp = start + u * plan.spu
+            for x, shift in zip(src[sp:sp + plan.spu], plan.src_shifts):
+                unit |= x << shift
+            res += [unit >> shift & mask for shift in plan.dst_shifts]
+        return BinData(self.to_width, res[:num_elements])
 
     @classmethod
     def cpp_type(cls):
         return 'RepackerModel', 'veles::data::Repacker', 'data/repack.h'
+
+
+def repack_many(src, items):
+    """
+    Performs many repackings of a single source BinData at once.  ``items``
+    is a sequence of ``(repacker, start, num_elements)`` tuples, with
+    the meaning of the ``Repacker.repack`` arguments.  Returns a list of
+    results, in the same order.
+
+    Items with identical repackers and element counts are grouped together
+    and checked once per group.  If NumPy is available and all widths are
+    at most 64 bits, each group is repacked as one array with a row per
+    item, instead of one by one, and the results share a single buffer
+    (as copy-on-write views).
+    """
+    if not isinstance(src, BinData):
+        raise TypeError('repack needs a BinData instance')
+    res = [None] * len(items)
+    keys = {}
+    groups = {}
+    for i, (repacker, start, num_elements) in enumerate(items):
+        key = keys.get(id(repacker))
+        if key is None:
+            key = keys[id(repacker)] = (
+                repacker.endian, repacker.from_width, repacker.to_width,
+                repacker.high_pad, repacker.low_pad)
+        group = groups.get((key, num_elements))
+        if group is None:
+            group = groups[key, num_elements] = (repacker, [], [])
+        group[1].append(i)
+        group[2].append(operator.index(start))
+    for (key, num_elements), (repacker, indices, starts) in groups.items():
+        if num_elements is None:
+            vals = [repacker.repack(src, start) for start in starts]
+        else:
+            if repacker.from_width != src.width:
+                raise ValueError('repack source width mismatch')
+            if min(starts) < 0:
+                raise ValueError('start cannot be negative')
+            rs = repacker.repack_size(num_elements)
+            if max(starts) + rs > len(src):
+                raise ValueError('not enough data in source')
+            vals = repacker._repack_group(src, starts, num_elements)
+        for i, val in zip(indices, vals):
+            res[i] = val
+    return res
@@ -0,0 +1,424 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import operator
+
+from six.moves import range
+
+from .bindata import BinData
+
+
+# Maximum size of a single leaf, in octets.  Bounds the amount of data
+# copied by single element writes and by merging of small leaves.
+LEAF_OCTETS = 0x10000
+
+
+class _Node(object):
+    """
+    A node of the rope tree.  Leaves have ``data`` set to a non-empty
+    BinData instance, inner nodes have ``left`` and ``right`` children.
+    Nodes are immutable (and so is the data in leaves), which lets
+    ropes share subtrees freely.
+    """
+
+    __slots__ = ['left', 'right', 'data', 'size', 'height']
+
+    def __init__(self, left=None, right=None, data=None):
+        self.left = left
+        self.right = right
+        self.data = data
+        if data is not None:
+            self.size = len(data)
+            self.height = 0
+        else:
+            self.size = left.size + right.size
+            self.height = max(left.height, right.height) + 1
+
+
+def _leaf(data):
+    return _Node(data=data) if len(data) else None
+
+
+def _rotate(a, b):
+    """
+    Creates a node with given children, doing an AVL rotation if their
+    heights differ by 2.
+    """
+    if a.height > b.height + 1:
+        if a.left.height >= a.right.height:
+            return _Node(a.left, _Node(a.right, b))
+        return _Node(_Node(a.left, a.right.left), _Node(a.right.right, b))
+    if b.height > a.height + 1:
+        if b.right.height >= b.left.height:
+            return _Node(_Node(a, b.left), b.right)
+        return _Node(_Node(a, b.left.left), _Node(b.left.right, b.right))
+    return _Node(a, b)
+
+
+def _join(a, b):
+    """
+    Concatenates two trees (either of which can be None), in time
+    proportional to the difference of their heights.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if (a.data is not None and b.data is not None and
+            (a.size + b.size) * a.data.octets_per_element() <= LEAF_OCTETS):
+        return _Node(data=a.data + b.data)
+    if a.height > b.height + 1:
+        return _rotate(a.left, _join(a.right, b))
+    if b.height > a.height + 1:
+        return _rotate(_join(a, b.left), b.right)
+    return _Node(a, b)
+
+
+def _split(node, idx):
+    """
+    Splits a tree into two trees holding elements before and after
+    a given index.
+    """
+    if node is None:
+        return None, None
+    if node.data is not None:
+        return _leaf(node.data[:idx]), _leaf(node.data[idx:])
+    if idx < node.left.size:
+        a, b = _split(node.left, idx)
+        return a, _join(b, node.right)
+    if idx > node.left.size:
+        a, b = _split(node.right, idx - node.left.size)
+        return _join(node.left, a), b
+    return node.left, node.right
+
+
+def _build(leaves):
+    """
+    Builds a balanced tree from a list of leaves.
+    """
+    if not leaves:
+        return None
+    if len(leaves) == 1:
+        return leaves[0]
+    mid = len(leaves) // 2
+    return _Node(_build(leaves[:mid]), _build(leaves[mid:]))
+
+
+def _replace(node, idx, val):
+    """
+    Returns a copy of the tree with a single element replaced.  Only
+    the path to the affected leaf and the leaf itself are copied.
+    """
+    if node.data is not None:
+        data = node.data[:]
+        data[idx] = val
+        return _Node(data=data)
+    if idx < node.left.size:
+        return _Node(_replace(node.left, idx, val), node.right)
+    return _Node(node.left, _replace(node.right, idx - node.left.size, val))
+
+
+class RopeBinData(object):
+    """
+    A chunked counterpart of BinData, for data that is often spliced.
+
+    The elements are kept in a balanced tree of BinData chunks, so
+    concatenation, insertion and deletion of arbitrary ranges, as well as
+    slicing, take O(log n) time instead of copying the whole data.  Single
+    elements are accessed in O(log n) time.  A contiguous buffer (as
+    needed by ``raw_data``, ``raw_view`` and ``to_bindata``) is built
+    lazily and cached until the next modification.
+
+    Otherwise, this class supports the same sequence API as BinData,
+    with slices returned as RopeBinData instances sharing chunks with
+    the original.
+    """
+
+    def __init__(self, width, data=()):
+        """
+        Creates a RopeBinData instance.  ``data`` can be a BinData
+        instance with the same width (which is not copied), or anything
+        accepted by the BinData constructor.
+        """
+        if not isinstance(data, BinData):
+            data = BinData(width, data)
+        elif data.width != operator.index(width):
+            raise ValueError('RopeBinData width mismatch')
+        self._width = data.width
+        self._set_root(self._chunk(data))
+
+    def _chunk(self, data):
+        step = max(1, LEAF_OCTETS // self.octets_per_element())
+        return _build([
+            _Node(data=data[pos:pos + step])
+            for pos in range(0, len(data), step)
+        ])
+
+    def _set_root(self, root):
+        self._root = root
+        self._flat = None
+
+    def _wrap(self, root):
+        res = RopeBinData(self._width)
+        res._set_root(root)
+        return res
+
+    @classmethod
+    def from_bindata(cls, data):
+        """
+        Creates a RopeBinData instance from a BinData instance.
+        """
+        if not isinstance(data, BinData):
+            raise TypeError('from_bindata needs a BinData instance')
+        return cls(data.width, data)
+
+    @classmethod
+    def from_spaced_hex(cls, width, data):
+        """
+        Like BinData.from_spaced_hex.
+        """
+        return cls(width, BinData.from_spaced_hex(width, data))
+
+    @classmethod
+    def from_raw_data(cls, width, data):
+        """
+        Like BinData.from_raw_data.
+        """
+        return cls(width, BinData.from_raw_data(width, data))
+
+    def to_bindata(self):
+        """
+        Returns the elements of this instance as a BinData instance.
+        """
+        if self._flat is None:
+            flat = BinData(self._width, len(self))
+            pos = 0
+            for chunk in self.chunks():
+                flat[pos:pos + len(chunk)] = chunk
+                pos += len(chunk)
+            self._flat = flat
+        return self._flat[:]
+
+    def chunks(self):
+        """
+        Yields the elements of this instance as a sequence of non-empty
+        BinData instances, without building a contiguous buffer.
+        """
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is None:
+                node = stack.pop()
+            if node.data is not None:
+                yield node.data[:]
+                node = None
+            else:
+                stack.append(node.right)
+                node = node.left
+
+    @property
+    def width(self):
+        """
+        Returns this instance's width in bits.
+        """
+        return self._width
+
+    @property
+    def raw_data(self):
+        """
+        Returns a copy of this instance's raw data as bytes.
+        """
+        return self.to_bindata().raw_data
+
+    @property
+    def raw_view(self):
+        """
+        Returns this instance's raw data as a read-only memoryview
+        (see BinData.raw_view).
+        """
+        self.to_bindata()
+        return self._flat.raw_view
+
+    def octets_per_element(self):
+        """
+        Returns how many octets each element takes in the raw data.
+        """
+        return (self._width + 7) // 8
+
+    def octets(self):
+        """
+        Returns size of this instance's raw data, in octets.
+        """
+        return len(self) * self.octets_per_element()
+
+    def __len__(self):
+        return 0 if self._root is None else self._root.size
+
+    def __hash__(self):
+        return hash(self.to_bindata())
+
+    def __eq__(self, other):
+        """
+        Instances are equal iff they have the same width and elements.
+        A RopeBinData is never equal to a BinData - compare the result of
+        ``to_bindata`` instead.
+        """
+        return (isinstance(other, RopeBinData) and
+                self._width == other._width and
+                len(self) == len(other) and
+                self.raw_view == other.raw_view)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def _index(self, idx):
+        idx = operator.index(idx)
+        if idx < 0:
+            if idx < -len(self):
+                raise IndexError('RopeBinData index out of range')
+            idx += len(self)
+        else:
+            if idx >= len(self):
+                raise IndexError('RopeBinData index out of range')
+        return idx
+
+    def _bounds(self, idx):
+        start, stop, stride = idx.indices(len(self))
+        if stride == 1:
+            stop = max(start, stop)
+        return start, stop, stride
+
+    def __getitem__(self, idx):
+        """
+        Returns a single element as an int, or a slice as a new
+        RopeBinData instance.
+        """
+        if isinstance(idx, slice):
+            start, stop, stride = self._bounds(idx)
+            if stride != 1:
+                return RopeBinData(self._width, self.to_bindata()[idx])
+            rest, _ = _split(self._root, stop)
+            _, res = _split(rest, start)
+            return self._wrap(res)
+        idx = self._index(idx)
+        if self._flat is not None:
+            return self._flat[idx]
+        node = self._root
+        while node.data is None:
+            if idx < node.left.size:
+                node = node.left
+            else:
+                idx -= node.left.size
+                node = node.right
+        return node.data[idx]
+
+    def _coerce(self, val):
+        if isinstance(val, BinData):
+            val = RopeBinData(val.width, val)
+        elif not isinstance(val, RopeBinData):
+            raise TypeError(
+                'value assigned to RopeBinData must be RopeBinData or BinData')
+        if val._width != self._width:
+            raise ValueError(
+                'value assigned to RopeBinData has mismatched width')
+        return val
+
+    def __setitem__(self, idx, val):
+        """
+        Sets a single element, or replaces a slice with the elements of
+        a RopeBinData or BinData instance of the same width (with the same
+        rules as for BinData).  Replacing a slice with stride 1 takes
+        O(log n) time regardless of the lengths involved.
+        """
+        if isinstance(idx, slice):
+            val = self._coerce(val)
+            start, stop, stride = self._bounds(idx)
+            if stride != 1:
+                data = self.to_bindata()
+                data[idx] = val.to_bindata()
+                self._set_root(self._chunk(data))
+                return
+            left, rest = _split(self._root, start)
+            _, right = _split(rest, stop - start)
+            self._set_root(_join(_join(left, val._root), right))
+            return
+        idx = self._index(idx)
+        val = operator.index(val)
+        if val >= (1 << self._width) or val < 0:
+            raise ValueError('RopeBinData element out of range for width')
+        self._set_root(_replace(self._root, idx, val))
+
+    def __delitem__(self, idx):
+        """
+        Deletes a single element or a slice.  Deleting a slice with
+        stride 1 takes O(log n) time.
+        """
+        if isinstance(idx, slice):
+            start, stop, stride = self._bounds(idx)
+            if stride != 1:
+                indices = range(start, stop, stride)
+                if stride < 0:
+                    indices = indices[::-1]
+                # Delete each selected element by joining the ranges
+                # between them.
+                root = None
+                pos = 0
+                for i in indices:
+                    root = _join(root, self[pos:i]._root)
+                    pos = i + 1
+                self._set_root(_join(root, self[pos:]._root))
+                return
+        else:
+            start = self._index(idx)
+            stop = start + 1
+        left, rest = _split(self._root, start)
+        _, right = _split(rest, stop - start)
+        self._set_root(_join(left, right))
+
+    def insert(self, idx, val):
+        """
+        Inserts the elements of a RopeBinData or BinData instance of
+        the same width before a given index (clamped to the valid range,
+        like for lists).  Takes O(log n) time.
+        """
+        self[idx:idx] = val
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for x in chunk:
+                yield x
+
+    def __str__(self):
+        """
+        Returns the elements as space-separated hex numbers, like BinData.
+        """
+        return str(self.to_bindata())
+
+    def __repr__(self):
+        return 'RopeBinData.from_spaced_hex({}, \'{}\')'.format(
+            self._width, self)
+
+    def __add__(self, other):
+        """
+        Concatenates this instance with a RopeBinData or BinData instance
+        of the same width, in O(log n) time.
+        """
+        if isinstance(other, BinData):
+            other = RopeBinData(other.width, other)
+        elif not isinstance(other, RopeBinData):
+            return NotImplemented
+        if self._width != other._width:
+            raise ValueError(
+                'concatenating RopeBinData of different widths')
+        return self._wrap(_join(self._root, other._root))
@@ -0,0 +1,129 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from six.moves import range
+
+from veles.compatibility.int_bytes import int_from_bytes
+
+
+# Size of the pieces raw data is searched in, in octets.
+SEARCH_CHUNK = 0x100000
+
+
+class SearchPattern(object):
+    """
+    A search pattern compiled for fast matching against raw data of
+    elements ``ope`` octets long.  ``raw`` is the raw data of the pattern
+    elements, and ``mask``, if given, is raw data of the same length,
+    whose set bits select the bits of ``raw`` that have to match (the rest
+    are wildcards).
+
+    Matching is driven by the longest run of fully significant octets
+    in the pattern, which is searched for with ``bytes.find``.  Patterns
+    with no such octets at all have to be tried at every element,
+    which is much slower.
+    """
+
+    def __init__(self, ope, raw, mask=None):
+        raw = bytearray(raw)
+        if not raw:
+            raise ValueError('empty search pattern')
+        if len(raw) % ope:
+            raise ValueError('search pattern length is not a multiple of '
+                             'element size')
+        if mask is not None:
+            mask = bytearray(mask)
+            if len(mask) != len(raw):
+                raise ValueError('search mask length mismatch')
+            raw = bytearray(x & m for x, m in zip(raw, mask))
+            if all(m == 0xff for m in mask):
+                mask = None
+        self.ope = ope
+        self.size = len(raw)
+        self.raw = bytes(raw)
+        self.mask = None if mask is None else bytes(mask)
+        if mask is None:
+            self._anchor = 0, self.raw
+        else:
+            self._raw_int = int_from_bytes(self.raw, 'little')
+            self._mask_int = int_from_bytes(self.mask, 'little')
+            best = 0, 0
+            run = 0
+            for i, m in enumerate(mask):
+                run = run + 1 if m == 0xff else 0
+                if run > best[1]:
+                    best = i + 1 - run, run
+            if best[1]:
+                pos, size = best
+                self._anchor = pos, self.raw[pos:pos + size]
+            else:
+                self._anchor = None
+
+    def _match(self, buf, pos):
+        window = buf[pos:pos + self.size]
+        return (int_from_bytes(window, 'little') & self._mask_int ==
+                self._raw_int)
+
+    def _find(self, buf, pos):
+        """
+        Returns the first position of a match fully contained in ``buf``,
+        at or after ``pos`` and aligned to elements, or -1.
+        """
+        last = len(buf) - self.size
+        if last < pos:
+            # Also keeps the end index of find below from going negative.
+            return -1
+        if self._anchor is None:
+            for cand in range(pos, last + 1, self.ope):
+                if self._match(buf, cand):
+                    return cand
+            return -1
+        off, anchor = self._anchor
+        idx = pos + off
+        while True:
+            idx = buf.find(anchor, idx, last + off + len(anchor))
+            if idx < 0:
+                return -1
+            cand = idx - off
+            if cand % self.ope == 0 and (
+                    self.mask is None or self._match(buf, cand)):
+                return cand
+            idx += 1
+
+    def search(self, chunks):
+        """
+        Searches raw data given as an iterable of bytes-like chunks (of
+        any sizes), and yields octet offsets (from the start of the first
+        chunk) of all non-overlapping matches.  Only a chunk and
+        the pattern size worth of previous data are kept in memory.
+        """
+        buf = b''
+        base = 0
+        for chunk in chunks:
+            if isinstance(chunk, memoryview):
+                chunk = chunk.tobytes()
+            buf += chunk
+            pos = 0
+            while True:
+                found = self._find(buf, pos)
+                if found < 0:
+                    break
+                yield base + found
+                pos = found + self.size
+            # Drop the data that cannot start a match anymore, keeping
+            # the start of the buffer aligned to elements.
+            keep = max(pos, len(buf) - self.size + 1, 0)
+            keep += -keep % self.ope
+            buf = buf[keep:]
+            base += keep
@@ -0,0 +1,208 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import operator
+
+from six.moves import range
+
+from veles.compatibility.int_bytes import int_to_bytes, int_from_bytes
+from veles.schema.model import Model
+from veles.schema import fields, enumeration
+
+from .bindata import BinData
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TransformOp(enumeration.EnumModel):
+    """
+    Represents an element-wise transformation of binary data.
+    """
+    XOR = 'xor'
+    AND = 'and'
+    OR = 'or'
+    ADD = 'add'
+    SUB = 'sub'
+    ROTL = 'rotl'
+    ROTR = 'rotr'
+    BYTESWAP = 'byteswap'
+    LOOKUP = 'lookup'
+
+
+_KEY_OPS = {
+    TransformOp.XOR: operator.xor,
+    TransformOp.AND: operator.and_,
+    TransformOp.OR: operator.or_,
+    TransformOp.ADD: operator.add,
+    TransformOp.SUB: operator.sub,
+}
+
+
+def _lanes(value, ope, num):
+    """
+    Returns a big int with ``value`` repeated in each of ``num`` lanes
+    of ``ope`` octets.
+    """
+    return int_from_bytes(int_to_bytes(value, ope, 'little') * num, 'little')
+
+
+class Transform(Model):
+    """
+    Describes an element-wise transformation of BinData of a given width.
+    The supported operations are:
+
+    - XOR, AND, OR, ADD, SUB: combines each element with the corresponding
+      element of ``key``, which is repeated as necessary to cover the whole
+      data (a single-element key works like a scalar).  ADD and SUB wrap
+      around modulo 2 ** width.
+    - ROTL, ROTR: rotates the bits of each element left or right by
+      ``count`` bits.
+    - BYTESWAP: reverses the octets of each element.  The width has to be
+      a multiple of 8.
+    - LOOKUP: replaces each element ``x`` with ``key[x]``.  The key has to
+      have 2 ** width elements and its width determines the width of
+      the result.
+
+    The elements are never processed one by one.  Bitwise operations,
+    addition and rotations use NumPy if available and the element size
+    is a power of two octets; otherwise, they are done on the whole data
+    at once, treated as a big int with one lane per element.  BYTESWAP and
+    LOOKUP work on strided octet columns (LOOKUP on wider elements uses
+    NumPy if available).
+    """
+
+    op = fields.Enum(TransformOp)
+    width = fields.SmallUnsignedInteger(minimum=1)
+    key = fields.BinData(optional=True)
+    count = fields.SmallUnsignedInteger(default=0)
+
+    def __init__(self, op, width, **kwargs):
+        super(Transform, self).__init__(
+            op=op,
+            width=width,
+            **kwargs
+        )
+
+    def apply(self, src):
+        """
+        Applies the transformation to the given source BinData, whose width
+        must match the width specified at construction, and returns
+        the result as a new BinData.
+        """
+        if not isinstance(src, BinData):
+            raise TypeError('transform needs a BinData instance')
+        if self.width != src.width:
+            raise ValueError('transform source width mismatch')
+        if self.op in _KEY_OPS:
+            if self.key is None or not len(self.key):
+                raise ValueError('transform needs a key')
+            if self.key.width != self.width:
+                raise ValueError('transform key width mismatch')
+            return self._apply_key(src)
+        elif self.op in (TransformOp.ROTL, TransformOp.ROTR):
+            return self._apply_rotate(src)
+        elif self.op == TransformOp.BYTESWAP:
+            return self._apply_byteswap(src)
+        else:
+            if self.key is None or len(self.key) != 1 << self.width:
+                raise ValueError('lookup table size mismatch')
+            return self._apply_lookup(src)
+
+    def _apply_key(self, src):
+        width = self.width
+        ope = src.octets_per_element()
+        num = len(src)
+        size = num * ope
+        key = self.key
+        if numpy is not None and ope in (1, 2, 4, 8):
+            x = src.to_numpy()
+            k = numpy.tile(key.to_numpy(), len(x) // len(key) + 1)[:len(x)]
+            res = _KEY_OPS[self.op](x, k) & x.dtype.type((1 << width) - 1)
+            return BinData.from_numpy(width, res)
+        if self.op == TransformOp.SUB:
+            # Subtraction is addition of the negated key.
+            key = BinData(width, [-x % (1 << width) for x in key])
+        reps = num // len(key) + 1
+        k = int_from_bytes(key.raw_view.tobytes() * reps, 'little')
+        k &= (1 << size * 8) - 1
+        x = int_from_bytes(src.raw_view, 'little')
+        if self.op == TransformOp.XOR:
+            x ^= k
+        elif self.op == TransformOp.AND:
+            x &= k
+        elif self.op == TransformOp.OR:
+            x |= k
+        else:
+            # Add the low bits of all lanes, which cannot carry out
+            # of a lane, then fix up the top bits.
+            high = _lanes(1 << (width - 1), ope, num)
+            low = _lanes((1 << (width - 1)) - 1, ope, num)
+            x = ((x & low) + (k & low)) ^ ((x ^ k) & high)
+        return BinData.from_raw_data(width, int_to_bytes(x, size, 'little'))
+
+    def _apply_rotate(self, src):
+        width = self.width
+        ope = src.octets_per_element()
+        num = len(src)
+        count = self.count % width
+        if self.op == TransformOp.ROTR:
+            count = (width - count) % width
+        if not count:
+            return src[:]
+        if numpy is not None and ope in (1, 2, 4, 8):
+            x = src.to_numpy()
+            t = x.dtype.type
+            res = (x << t(count) | x >> t(width - count)) & t((1 << width) - 1)
+            return BinData.from_numpy(width, res)
+        x = int_from_bytes(src.raw_view, 'little')
+        # Bits moved up stay within the lane, bits moved down are cut
+        # to the low ``count`` bits, dropping anything shifted in from
+        # the next lane.
+        up = (x & _lanes((1 << (width - count)) - 1, ope, num)) << count
+        down = (x >> (width - count)) & _lanes((1 << count) - 1, ope, num)
+        return BinData.from_raw_data(
+            width, int_to_bytes(up | down, num * ope, 'little'))
+
+    def _apply_byteswap(self, src):
+        if self.width % 8:
+            raise ValueError('byteswap needs a width divisible by 8')
+        ope = src.octets_per_element()
+        raw = src.raw_view.tobytes()
+        res = bytearray(len(raw))
+        for i in range(ope):
+            res[i::ope] = raw[ope - 1 - i::ope]
+        return BinData.from_raw_data(self.width, res)
+
+    def _apply_lookup(self, src):
+        table = self.key
+        ope = src.octets_per_element()
+        if ope != 1:
+            if (numpy is not None and ope == 2 and
+                    table.octets_per_element() in (1, 2, 4, 8)):
+                return BinData.from_numpy(
+                    table.width, table.to_numpy()[src.to_numpy()])
+            return BinData(table.width, [table[x] for x in src])
+        # Translate each octet column of the table separately.
+        res_ope = table.octets_per_element()
+        raw = src.raw_view.tobytes()
+        tab = table.raw_view.tobytes()
+        res = bytearray(len(raw) * res_ope)
+        for i in range(res_ope):
+            column = tab[i::res_ope]
+            column += b'\0' * (256 - len(column))
+            res[i::res_ope] = raw.translate(column)
+        return BinData.from_raw_data(table.width, res)
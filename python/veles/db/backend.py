@@ -12,23 +12,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import hashlib
+import mmap
 import operator
 
 import os
 import sqlite3
+import uuid
+import weakref
+import zlib
 
 import six
 
 from veles.proto import msgpackwrap
 from veles.schema.nodeid import NodeID
 from veles.proto.node import Node, PosFilter
-from veles.proto.exceptions import WritePastEndError
+from veles.proto.exceptions import BinDataChangedError, WritePastEndError
 from veles.util.bigint import bigint_encode, bigint_decode
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
 
 DB_APP_ID = int('veles', 36)
-DB_VERSION = 2
+DB_VERSION = 10
+# Default page size of new binary data - the page size of existing data
+# is stored with it, and can be changed with DbBackend.repage_bindata.
 DB_BINDATA_PAGE_SIZE = 0x10000
+# Number of octets converted in a single step of DbBackend.repage_bindata.
+DB_REPAGE_BATCH_SIZE = 0x400000
+# Default size of the chunks of binary data stored in external files - each
+# write rewrites the chunks it touches.
+DB_BINDATA_FILE_CHUNK = 0x1000000
+# Number of decompressed bindata pages cached by DbBackend.
+DB_BINDATA_CACHE_PAGES = 64
+# Maximum number of ids in a single IN (...) clause - older sqlite versions
+# don't allow more than 999 parameters in a statement.
+DB_MAX_IN_IDS = 500
+# Initial row count limit used when estimating the costs of list query plans.
+DB_LIST_PLAN_START = 64
 
 DB_SCHEMA = [
     'pragma application_id = {}'.format(DB_APP_ID),
@@ -49,6 +74,9 @@ DB_SCHEMA = [
             name VARCHAR NOT NULL,
             PRIMARY KEY (id, name)
         )
+    """, """
+        CREATE INDEX node_tag_name
+        ON node_tag(name, id)
     """, """
         CREATE TABLE node_attr(
             id BLOB NOT NULL REFERENCES node(id),
@@ -69,12 +97,57 @@ DB_SCHEMA = [
             name VARCHAR NOT NULL,
             page INTEGER NOT NULL,
             data BLOB NOT NULL,
+            codec VARCHAR,
             PRIMARY KEY (id, name, page)
         )
+    """, """
+        CREATE TABLE node_bindata_meta(
+            id BLOB NOT NULL REFERENCES node(id),
+            name VARCHAR NOT NULL,
+            length INTEGER NOT NULL,
+            page_size INTEGER NOT NULL,
+            page_base INTEGER NOT NULL DEFAULT 0,
+            repage_size INTEGER,
+            repage_done INTEGER,
+            codec VARCHAR,
+            file_chunk INTEGER,
+            repage_codec VARCHAR,
+            PRIMARY KEY (id, name)
+        )
+    """, """
+        CREATE TABLE node_bindata_file(
+            id BLOB NOT NULL REFERENCES node(id),
+            name VARCHAR NOT NULL,
+            chunk INTEGER NOT NULL,
+            file VARCHAR NOT NULL,
+            PRIMARY KEY (id, name, chunk)
+        )
+    """, """
+        CREATE TABLE bindata_page(
+            hash BLOB NOT NULL PRIMARY KEY,
+            refs INTEGER NOT NULL,
+            codec VARCHAR,
+            data BLOB NOT NULL
+        )
+    """, """
+        CREATE TRIGGER node_bindata_unref
+        AFTER DELETE ON node_bindata
+        WHEN old.codec = 'hash'
+        BEGIN
+            UPDATE bindata_page SET refs = refs - 1 WHERE hash = old.data;
+            DELETE FROM bindata_page WHERE hash = old.data AND refs = 0;
+        END
+    """, """
+        CREATE TABLE node_pos_key(
+            key INTEGER PRIMARY KEY,
+            id BLOB NOT NULL UNIQUE REFERENCES node(id)
+        )
+    """, """
+        CREATE VIRTUAL TABLE node_pos
+        USING rtree(key, parent_lo, parent_hi, pos_lo, pos_hi)
     """
 ]
 
-
 # TODO:
 #
 # - link support
@@ -82,8 +155,13 @@ DB_SCHEMA = [
 # - trigger model
 
 if six.PY3:
-    def buffer(x):
-        return x
+    def buffer(x, offset=0, size=None):
+        if offset == 0 and size is None:
+            return x
+        view = memoryview(x)
+        if size is None:
+            return view[offset:]
+        return view[offset:offset + size]
 
 
 def db_bigint_encode(val):
@@ -94,12 +172,388 @@ def db_bigint_decode(val):
     return None if val is None else bigint_decode(bytes(val))
 
 
+# Positions are stored as native integers if they fit in sqlite's 64-bit
+# INTEGER, and as bigint-encoded BLOBs otherwise.  sqlite sorts all BLOBs
+# after all integers, which is right for large positive values, but not for
+# large negative ones - their encodings start with an octet below 0x80, and
+# have to be handled specially by comparisons (see _pos_cmp).
+DB_POS_MIN = -1 << 63
+DB_POS_MAX = (1 << 63) - 1
+
+
+def db_pos_encode(val):
+    if val is None or DB_POS_MIN <= val <= DB_POS_MAX:
+        return val
+    return buffer(bigint_encode(val))
+
+
+def db_pos_decode(val):
+    if val is None or isinstance(val, six.integer_types):
+        return val
+    return bigint_decode(bytes(val))
+
+
+def _pos_cmp(column, op, val):
+    """
+    Builds a condition comparing a position column with a value, where
+    ``op`` is ``'>='`` or ``'<='``.  Returns a tuple of (condition, args).
+    NULLs never match.
+    """
+    # X'' is the smallest BLOB, X'80' the smallest encoded positive one.
+    neg_blob = "{0} >= X'' AND {0} < X'80'".format(column)
+    cond = "{} {} ?".format(column, op)
+    if val > DB_POS_MAX:
+        pass
+    elif val >= DB_POS_MIN:
+        if op == '>=':
+            cond = "({} AND {} < X'' OR {} >= X'80')".format(
+                cond, column, column)
+        else:
+            cond = "({} OR {})".format(cond, neg_blob)
+    elif op == '>=':
+        cond = "({} OR {} < X'')".format(cond, column)
+    else:
+        cond = "({} AND {} >= X'')".format(cond, column)
+    return cond, (db_pos_encode(val),)
+
+
+# The node_pos R*Tree indexes nodes as boxes spanning a single parent
+# coordinate (see _pos_parent_key) and the range from pos_start to pos_end.
+# It stores 32-bit floats, rounding boxes outwards, so it is only used to
+# find candidates, which are then checked against the node table.  Its
+# integer keys are mapped to node ids by node_pos_key.
+
+
+def _pos_parent_key(raw_parent):
+    """
+    Returns the R*Tree coordinate of a parent - the first 24 bits of its
+    id, which are exact in a float.  Nodes with colliding parents are
+    filtered out by the exact checks.
+    """
+    if raw_parent is None:
+        return 0
+    octets = bytearray(bytes(raw_parent[:3]))
+    return octets[0] << 16 | octets[1] << 8 | octets[2]
+
+
+def _pos_coord(val, default):
+    if val is None:
+        return default
+    try:
+        return float(val)
+    except OverflowError:
+        return float('inf') if val > 0 else float('-inf')
+
+
+def _set_node_pos(c, raw_id, raw_parent, pos_start, pos_end):
+    """
+    Updates the R*Tree entry of a node.
+    """
+    c.execute("""
+        SELECT key FROM node_pos_key WHERE id = ?
+    """, (raw_id,))
+    rows = c.fetchall()
+    if rows:
+        (key,), = rows
+    else:
+        c.execute("""
+            INSERT INTO node_pos_key (id) VALUES (?)
+        """, (raw_id,))
+        key = c.lastrowid
+    lo = _pos_coord(pos_start, float('-inf'))
+    hi = _pos_coord(pos_end, float('inf'))
+    parent_key = _pos_parent_key(raw_parent)
+    c.execute("""
+        INSERT OR REPLACE INTO node_pos
+            (key, parent_lo, parent_hi, pos_lo, pos_hi)
+        VALUES (?, ?, ?, ?, ?)
+    """, (key, parent_key, parent_key, min(lo, hi), max(lo, hi)))
+
+
+def _sync_node_pos(c, raw_id):
+    """
+    Updates the R*Tree entry of a node from the node table.
+    """
+    c.execute("""
+        SELECT parent, pos_start, pos_end FROM node WHERE id = ?
+    """, (raw_id,))
+    for raw_parent, pos_start, pos_end in c.fetchall():
+        _set_node_pos(c, raw_id, raw_parent, db_pos_decode(pos_start),
+                      db_pos_decode(pos_end))
+
+
+def _fill_node_pos(c):
+    """
+    Rebuilds the R*Tree from scratch.
+    """
+    c.execute("DELETE FROM node_pos")
+    c.execute("DELETE FROM node_pos_key")
+    c.execute("SELECT id, parent, pos_start, pos_end FROM node")
+    for raw_id, raw_parent, pos_start, pos_end in c.fetchall():
+        _set_node_pos(c, raw_id, raw_parent, db_pos_decode(pos_start),
+                      db_pos_decode(pos_end))
+
+
+def _convert_pos_columns(c):
+    """
+    Converts positions stored as bigint BLOBs to native integers, where
+    they fit.
+    """
+    c.execute("""
+        SELECT id, pos_start, pos_end FROM node
+        WHERE typeof(pos_start) = 'blob' OR typeof(pos_end) = 'blob'
+    """)
+    c.executemany("""
+        UPDATE node SET pos_start = ?, pos_end = ? WHERE id = ?
+    """, [
+        (db_pos_encode(db_pos_decode(pos_start)),
+         db_pos_encode(db_pos_decode(pos_end)),
+         raw_id)
+        for raw_id, pos_start, pos_end in c.fetchall()
+    ])
+
+
+def _add_columns(table, columns):
+    """
+    Returns a migration step adding columns (given as their definitions)
+    to a table, unless they already exist.
+    """
+    def step(c):
+        c.execute("pragma table_info({})".format(table))
+        existing = {row[1] for row in c.fetchall()}
+        for column in columns:
+            if column.split()[0] not in existing:
+                c.execute("ALTER TABLE {} ADD COLUMN {}".format(
+                    table, column))
+    return step
+
+
+# Bindata pages are stored with a codec - NULL for raw data, 'zero' for
+# pages of all zeros (with empty data - their size is implied by the page
+# size and the length of the bindata), 'hash' for deduplicated pages (with
+# the SHA-256 of the page as data - the page itself is stored in
+# bindata_page, with its own codec), or one of the compression codecs
+# below.  The codec used for new pages is set per bindata key.
+#
+# bindata_page rows are reference counted - the counts are incremented
+# when storing pages, and decremented (and unused pages deleted) by
+# a trigger on deletion of node_bindata rows, which also covers rows
+# replaced by INSERT OR REPLACE (thanks to recursive_triggers).
+DB_BINDATA_CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+}
+if lzma is not None:
+    DB_BINDATA_CODECS['lzma'] = (lzma.compress, lzma.decompress)
+
+
+# Default for the codec argument of DbBackend.repage_bindata.
+_KEEP_CODEC = object()
+
+
+def _check_codec(codec):
+    if codec is not None and codec not in DB_BINDATA_CODECS:
+        raise ValueError('unknown bindata codec')
+
+
+# Selects the codec and data of node_bindata pages, resolving deduplicated
+# ones - to be used with _PAGE_JOIN.
+_PAGE_COLUMNS = """
+    CASE WHEN node_bindata.codec = 'hash'
+        THEN bindata_page.codec ELSE node_bindata.codec END,
+    CASE WHEN node_bindata.codec = 'hash'
+        THEN bindata_page.data ELSE node_bindata.data END
+"""
+_PAGE_JOIN = """
+    node_bindata LEFT JOIN bindata_page
+    ON node_bindata.codec = 'hash' AND bindata_page.hash = node_bindata.data
+"""
+
+
+def _encode_page(data, codec):
+    """
+    Encodes a bindata page for storage, returns a tuple of (codec, data).
+    Compression is skipped if it doesn't make the page smaller.
+    """
+    raw = bytes(data)
+    if raw.count(b'\0') == len(raw):
+        return 'zero', b''
+    if codec is not None:
+        packed = DB_BINDATA_CODECS[codec][0](raw)
+        if len(packed) < len(raw):
+            return codec, buffer(packed)
+    return None, data
+
+
+# Binary data at least DbBackend.bindata_file_size octets long is stored
+# in external files instead of pages, in a directory next to the database
+# file.  The data is split into chunks of file_chunk octets (recorded in
+# node_bindata_meta), each stored in its own file, listed in
+# node_bindata_file.  The files are never modified: a write makes new files
+# for the chunks it touches (written to a temporary name, synced to disk
+# and renamed), which replace the old ones in the database transaction.
+# The old files are removed when the transaction is committed (or the new
+# ones, when it's rolled back), so the database never refers to partially
+# written files.
+def _fsync_dir(path):
+    """
+    Syncs a directory to disk, to make renames in it durable.  Silently
+    does nothing where directories can't be synced (eg. on Windows).
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# DB_MIGRATIONS[v] is the list of steps upgrading a database from schema
+# version v to v + 1 - SQL statements, or functions called with a cursor.
+# They may be rerun if an upgrade gets interrupted, so they have to be
+# idempotent.
+DB_MIGRATIONS = {
+    2: [
+        """
+            CREATE INDEX IF NOT EXISTS node_tag_name
+            ON node_tag(name, id)
+        """,
+    ],
+    3: [
+        """
+            CREATE TABLE IF NOT EXISTS node_pos_key(
+                key INTEGER PRIMARY KEY,
+                id BLOB NOT NULL UNIQUE REFERENCES node(id)
+            )
+        """, """
+            CREATE VIRTUAL TABLE IF NOT EXISTS node_pos
+            USING rtree(key, parent_lo, parent_hi, pos_lo, pos_hi)
+        """,
+        _fill_node_pos,
+    ],
+    4: [
+        _convert_pos_columns,
+    ],
+    5: [
+        """
+            CREATE TABLE IF NOT EXISTS node_bindata_meta(
+                id BLOB NOT NULL REFERENCES node(id),
+                name VARCHAR NOT NULL,
+                length INTEGER NOT NULL,
+                page_size INTEGER NOT NULL,
+                PRIMARY KEY (id, name)
+            )
+        """,
+        # ATTENTION: sqlite dependency here - length(data) will be evaluated
+        # for the max page for a given key (see
+        # https://www.sqlite.org/lang_select.html#bareagg).
+        """
+            INSERT OR REPLACE INTO node_bindata_meta
+                (id, name, length, page_size)
+            SELECT id, name, MAX(page) * {0} + length(data), {0}
+            FROM node_bindata
+            GROUP BY id, name
+        """.format(DB_BINDATA_PAGE_SIZE),
+    ],
+    6: [
+        _add_columns('node_bindata_meta', [
+            "page_base INTEGER NOT NULL DEFAULT 0",
+            "repage_size INTEGER",
+            "repage_done INTEGER",
+            "repage_codec VARCHAR",
+        ]),
+    ],
+    7: [
+        _add_columns('node_bindata', ["codec VARCHAR"]),
+        _add_columns('node_bindata_meta', ["codec VARCHAR"]),
+    ],
+    8: [
+        """
+            CREATE TABLE IF NOT EXISTS bindata_page(
+                hash BLOB NOT NULL PRIMARY KEY,
+                refs INTEGER NOT NULL,
+                codec VARCHAR,
+                data BLOB NOT NULL
+            )
+        """, """
+            CREATE TRIGGER IF NOT EXISTS node_bindata_unref
+            AFTER DELETE ON node_bindata
+            WHEN old.codec = 'hash'
+            BEGIN
+                UPDATE bindata_page SET refs = refs - 1 WHERE hash = old.data;
+                DELETE FROM bindata_page WHERE hash = old.data AND refs = 0;
+            END
+        """,
+    ],
+    9: [
+        _add_columns('node_bindata_meta', ["file_chunk INTEGER"]),
+        """
+            CREATE TABLE IF NOT EXISTS node_bindata_file(
+                id BLOB NOT NULL REFERENCES node(id),
+                name VARCHAR NOT NULL,
+                chunk INTEGER NOT NULL,
+                file VARCHAR NOT NULL,
+                PRIMARY KEY (id, name, chunk)
+            )
+        """,
+    ],
+}
+
+
+class _PageReader(object):
+    """
+    Tracks an iterator over binary data stored in pages.  It is marked
+    stale when the data changes - the pages it hasn't read yet would no
+    longer match the ones it already has.
+    """
+
+    def __init__(self, raw_id, key):
+        self.raw_id = bytes(raw_id)
+        self.key = key
+        self.stale = False
+
+
 class DbBackend:
-    def __init__(self, path):
+    def __init__(self, path, bindata_page_size=DB_BINDATA_PAGE_SIZE,
+                 bindata_codec=None, bindata_dedup=False,
+                 bindata_file_size=None,
+                 bindata_file_chunk=DB_BINDATA_FILE_CHUNK):
+        bindata_page_size = operator.index(bindata_page_size)
+        if bindata_page_size <= 0:
+            raise ValueError('page size must be positive')
+        _check_codec(bindata_codec)
+        if bindata_file_size is not None:
+            bindata_file_size = operator.index(bindata_file_size)
+            if bindata_file_size <= 0:
+                raise ValueError('file size threshold must be positive')
+            if not path:
+                raise ValueError('external bindata needs a database file')
+        bindata_file_chunk = operator.index(bindata_file_chunk)
+        if bindata_file_chunk <= 0:
+            raise ValueError('file chunk size must be positive')
+        self.bindata_page_size = bindata_page_size
+        self.bindata_codec = bindata_codec
+        self.bindata_dedup = bool(bindata_dedup)
+        self.bindata_file_size = bindata_file_size
+        self.bindata_file_chunk = bindata_file_chunk
+        # Maps compressed pages to their decompressed data, in LRU order.
+        self._page_cache = collections.OrderedDict()
+        # External bindata files created and dropped by the current
+        # transaction.
+        self._files_created = []
+        self._files_dropped = []
+        # _PageReaders of the iterators over paged binary data in progress.
+        self._page_readers = weakref.WeakSet()
         if not path:
             path = ':memory:'
-        elif path.startswith(':'):
-            path = './' + path
+            self.bindata_dir = None
+        else:
+            if path.startswith(':'):
+                path = './' + path
+            self.bindata_dir = path + '.bindata'
 
         dirname = os.path.dirname(path)
         if dirname != '' and not os.path.exists(dirname):
@@ -125,17 +579,36 @@ class DbBackend:
             # This is a Veles database, but is it the right version?
             version = self.db.execute('pragma user_version').fetchone()[0]
             if version != DB_VERSION:
-                raise ValueError('unknown database schema version')
+                self._migrate(version)
         else:
             raise ValueError('invalid application ID')
         self.db.execute('pragma foreign_keys = on')
         fk = self.db.execute('pragma foreign_keys').fetchone()[0]
         if not fk:
             raise ValueError('foreign keys not supported by sqlite')
+        self.db.execute('pragma recursive_triggers = on')
         wrapper = msgpackwrap.MsgpackWrapper()
         self.unpacker = wrapper.unpacker
         self.packer = wrapper.packer
 
+    def _migrate(self, version):
+        """
+        Upgrades the database from an older schema version, one version
+        at a time.
+        """
+        if version > DB_VERSION or any(
+                v not in DB_MIGRATIONS for v in range(version, DB_VERSION)):
+            raise ValueError('unknown database schema version')
+        c = self.db.cursor()
+        for v in range(version, DB_VERSION):
+            for x in DB_MIGRATIONS[v]:
+                if callable(x):
+                    x(c)
+                else:
+                    c.execute(x)
+            c.execute('pragma user_version = {}'.format(v + 1))
+            self.db.commit()
+
     def _load(self, data):
         self.unpacker.feed(data)
         return self.unpacker.unpack()
@@ -143,46 +616,64 @@ class DbBackend:
     def get(self, id):
         if not isinstance(id, NodeID):
             raise TypeError('node id has wrong type')
-        raw_id = buffer(id.bytes)
+        return self.get_many([id]).get(id)
+
+    def get_many(self, ids):
+        """
+        Fetches many nodes at once.  Returns a dict mapping ids to Nodes
+        - ids of nodes that don't exist are left out.  Each table is read
+        with a single query per DB_MAX_IN_IDS ids, instead of a query
+        per node.
+        """
+        ids = list(ids)
+        for id in ids:
+            if not isinstance(id, NodeID):
+                raise TypeError('node id has wrong type')
+        res = {}
+        for pos in six.moves.range(0, len(ids), DB_MAX_IN_IDS):
+            res.update(self._get_many(ids[pos:pos + DB_MAX_IN_IDS]))
+        return res
+
+    def _get_many(self, ids):
+        by_raw = {id.bytes: id for id in ids}
+        raw_ids = [buffer(x) for x in by_raw]
+        cond = 'id IN ({})'.format(', '.join('?' * len(raw_ids)))
         c = self.db.cursor()
         c.execute("""
-            SELECT parent, pos_start, pos_end FROM node WHERE id = ?
-        """, (raw_id,))
-        rows = c.fetchall()
-        if not rows:
-            return None
-        (raw_parent, pos_start, pos_end), = rows
-        parent = NodeID(bytes(raw_parent)) if raw_parent else NodeID.root_id
+            SELECT id, parent, pos_start, pos_end FROM node WHERE {}
+        """.format(cond), raw_ids)
+        nodes = {}
+        for raw_id, raw_parent, pos_start, pos_end in c.fetchall():
+            parent = (NodeID(bytes(raw_parent)) if raw_parent
+                      else NodeID.root_id)
+            nodes[bytes(raw_id)] = Node(
+                id=by_raw[bytes(raw_id)], parent=parent,
+                pos_start=db_pos_decode(pos_start),
+                pos_end=db_pos_decode(pos_end),
+                tags=set(), attr={}, data=set(), bindata={})
+        if not nodes:
+            return {}
         c.execute("""
-            SELECT name FROM node_tag WHERE id = ?
-        """, (raw_id,))
-        tags = {x for x, in c.fetchall()}
+            SELECT id, name FROM node_tag WHERE {}
+        """.format(cond), raw_ids)
+        for raw_id, name in c.fetchall():
+            nodes[bytes(raw_id)].tags.add(name)
         c.execute("""
-            SELECT name, data FROM node_attr WHERE id = ?
-        """, (raw_id,))
-        attr = {k: self._load(v) for k, v in c.fetchall()}
+            SELECT id, name, data FROM node_attr WHERE {}
+        """.format(cond), raw_ids)
+        for raw_id, name, data in c.fetchall():
+            nodes[bytes(raw_id)].attr[name] = self._load(data)
         c.execute("""
-            SELECT name FROM node_data WHERE id = ?
-        """, (raw_id,))
-        data = {x for x, in c.fetchall()}
-        # ATTENTION: sqlite dependency here - length(data) will be evaluated
-        # for the max page for a given key (see
-        # https://www.sqlite.org/lang_select.html#bareagg).
-        assert isinstance(c, sqlite3.Cursor)
+            SELECT id, name FROM node_data WHERE {}
+        """.format(cond), raw_ids)
+        for raw_id, name in c.fetchall():
+            nodes[bytes(raw_id)].data.add(name)
         c.execute("""
-            SELECT name, MAX(page), length(data)
-            FROM node_bindata
-            WHERE id = ?
-            GROUP BY name
-        """, (raw_id,))
-        bindata = {
-            key: page * DB_BINDATA_PAGE_SIZE + lastlen
-            for key, page, lastlen in c.fetchall()
-        }
-        return Node(id=id, parent=parent,
-                    pos_start=db_bigint_decode(pos_start),
-                    pos_end=db_bigint_decode(pos_end), tags=tags, attr=attr,
-                    data=data, bindata=bindata)
+            SELECT id, name, length FROM node_bindata_meta WHERE {}
+        """.format(cond), raw_ids)
+        for raw_id, name, length in c.fetchall():
+            nodes[bytes(raw_id)].bindata[name] = length
+        return {node.id: node for node in nodes.values()}
 
     def create(self, node, commit=True):
         if not isinstance(node, Node):
@@ -200,9 +691,10 @@ class DbBackend:
             VALUES (?, ?, ?, ?)
         """, (
             raw_id, raw_parent,
-            db_bigint_encode(node.pos_start),
-            db_bigint_encode(node.pos_end)
+            db_pos_encode(node.pos_start),
+            db_pos_encode(node.pos_end)
         ))
+        _set_node_pos(c, raw_id, raw_parent, node.pos_start, node.pos_end)
         c.executemany("""
             INSERT INTO node_tag (id, name) VALUES (?, ?)
         """, [
@@ -234,10 +726,11 @@ class DbBackend:
             SET pos_start = ?, pos_end = ?
             WHERE id = ?
         """, (
-            db_bigint_encode(pos_start),
-            db_bigint_encode(pos_end),
+            db_pos_encode(pos_start),
+            db_pos_encode(pos_end),
             raw_id
         ))
+        _sync_node_pos(c, raw_id)
         if commit:
             self.commit()
 
@@ -257,6 +750,7 @@ class DbBackend:
             SET parent = ?
             WHERE id = ?
         """, (raw_parent, raw_id))
+        _sync_node_pos(c, raw_id)
         if commit:
             self.commit()
 
@@ -341,7 +835,7 @@ class DbBackend:
         if commit:
             self.commit()
 
-    def get_bindata(self, id, key, start=0, end=None):
+    def _check_bindata_range(self, id, key, start, end):
         if not isinstance(id, NodeID):
             raise TypeError('node id has wrong type')
         start = operator.index(start)
@@ -353,30 +847,331 @@ class DbBackend:
             raise ValueError('end must be >= start')
         if not isinstance(key, six.text_type):
             raise TypeError('key is not a string')
-        if start == end:
-            return b''
-        page_first = start // DB_BINDATA_PAGE_SIZE
-        offset = page_first * DB_BINDATA_PAGE_SIZE
+        return start, end
+
+    def _get_bindata_meta(self, c, raw_id, key):
+        """
+        Returns a tuple of (length, page size, first page number, codec,
+        external file chunk size) for binary data.  The chunk size is None
+        for data stored in pages.
+        """
+        c.execute("""
+            SELECT length, page_size, page_base, codec, file_chunk
+            FROM node_bindata_meta
+            WHERE id = ? AND name = ?
+        """, (raw_id, key))
+        rows = c.fetchall()
+        if not rows:
+            return 0, self.bindata_page_size, 0, self.bindata_codec, None
+        row, = rows
+        return row
+
+    def _map_bindata_file(self, name):
+        """
+        Maps an external bindata file into memory, read-only.  The mapping
+        stays valid as long as there are buffers referencing it, even if
+        the file is removed in the meantime.
+        """
+        with open(os.path.join(self.bindata_dir, name), 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _decode_page(self, codec, data, size):
+        """
+        Returns the contents of a stored page, as bytes.  ``size`` is only
+        used for zero pages.
+        """
+        if codec is None:
+            return data if isinstance(data, bytes) else bytes(data)
+        if codec == 'zero':
+            return b'\0' * size
+        data = bytes(data)
+        res = self._page_cache.pop(data, None)
+        if res is None:
+            res = DB_BINDATA_CODECS[codec][1](data)
+        self._page_cache[data] = res
+        if len(self._page_cache) > DB_BINDATA_CACHE_PAGES:
+            self._page_cache.popitem(last=False)
+        return res
+
+    def _get_bindata_pages(self, raw_id, key, meta, start, end):
+        """
+        Returns an iterator over the pages of binary data overlapping
+        the given range (which has to be non-empty and within the data),
+        trimmed to it, as memoryviews.  The pages are fetched from
+        the database lazily.  Data stored in external files is yielded as
+        page-sized slices of their memory mappings, without copying it -
+        all the files in the range are mapped right away, so that
+        the iterator keeps reading the same data even if it is rewritten
+        (and the files removed) in the meantime.
+        """
+        length, page_size, page_base, _, file_chunk = meta
+        if file_chunk is not None:
+            c = self.db.cursor()
+            c.execute("""
+                SELECT chunk, file FROM node_bindata_file
+                WHERE id = ? AND name = ? AND chunk BETWEEN ? AND ?
+                ORDER BY chunk
+            """, (raw_id, key, start // file_chunk, (end - 1) // file_chunk))
+            maps = [
+                (chunk * file_chunk, self._map_bindata_file(name))
+                for chunk, name in c.fetchall()
+            ]
+            return self._iter_file_pages(maps, page_size, file_chunk,
+                                         start, end)
+        reader = _PageReader(raw_id, key)
+        self._page_readers.add(reader)
+        return self._iter_db_pages(reader, raw_id, key, meta, start, end)
+
+    def _iter_file_pages(self, maps, page_size, file_chunk, start, end):
+        """
+        Yields page-sized slices of a range of mapped external files,
+        given as a list of (base offset, mapping) pairs.
+        """
+        for base, data in maps:
+            lo = max(start, base)
+            hi = min(end, base + file_chunk)
+            for pos in six.moves.range(lo, hi, page_size):
+                yield buffer(data, pos - base, min(page_size, hi - pos))
+
+    def _iter_db_pages(self, reader, raw_id, key, meta, start, end):
+        """
+        Yields the pages of binary data stored in the database, for
+        _get_bindata_pages.  Raises BinDataChangedError if the data is
+        changed before all of them are read.
+        """
+        length, page_size, page_base, _, _ = meta
+        page_first = start // page_size
+        page_last = (end - 1) // page_size
+        offset = page_first * page_size
         start -= offset
+        end -= offset
         c = self.db.cursor()
-        if end is None:
-            c.execute("""
-                SELECT data
-                FROM node_bindata
-                WHERE id = ? AND name = ? AND page >= ?
-                ORDER BY page
-            """, (buffer(id.bytes), key, page_first))
+        c.execute("""
+            SELECT page, {}
+            FROM {}
+            WHERE id = ? AND name = ? AND page BETWEEN ? AND ?
+            ORDER BY page
+        """.format(_PAGE_COLUMNS, _PAGE_JOIN), (
+            raw_id, key, page_base + page_first, page_base + page_last))
+        while end > 0:
+            if reader.stale:
+                raise BinDataChangedError()
+            row = c.fetchone()
+            if row is None:
+                return
+            page, codec, data = row
+            size = min(page_size, length - (page - page_base) * page_size)
+            data = self._decode_page(codec, data, size)
+            yield memoryview(data)[start:end]
+            start = max(0, start - len(data))
+            end -= len(data)
+
+    def _bindata_changed(self, raw_id, key=None):
+        """
+        Marks the iterators over paged binary data of a given key (or all
+        keys of a node, if None) as stale.
+        """
+        raw_id = bytes(raw_id)
+        for reader in list(self._page_readers):
+            if reader.raw_id == raw_id and key in (None, reader.key):
+                reader.stale = True
+
+    def iter_bindata(self, id, key, start=0, end=None):
+        """
+        Returns an iterator over a range of binary data, yielding it as
+        memoryviews of consecutive pages (only the first and the last one
+        are trimmed to the range).  The pages are read lazily, so only one
+        of them has to be in memory at a time.  The iterator always yields
+        the data as of its creation: if it is stored in pages and changes
+        before the iterator is done, the iterator raises
+        BinDataChangedError instead of mixing old and new data.
+        """
+        start, end = self._check_bindata_range(id, key, start, end)
+        raw_id = buffer(id.bytes)
+        meta = self._get_bindata_meta(self.db.cursor(), raw_id, key)
+        length = meta[0]
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return iter(())
+        return self._get_bindata_pages(raw_id, key, meta, start, end)
+
+    def get_bindata(self, id, key, start=0, end=None):
+        return b''.join(self.iter_bindata(id, key, start, end))
+
+    def _patch_bindata_page(self, c, raw_id, key, page, codec, offset,
+                            data, old_size, new_size):
+        """
+        Writes data at a given offset of an existing page, and resizes
+        the page to ``new_size``.  If the size doesn't change and the page
+        is stored raw, it is patched in place with sqlite's incremental blob
+        I/O (if supported), so that only the changed part is written.
+        Otherwise, it is decoded and stored again with the given codec.
+        """
+        c.execute("""
+            SELECT node_bindata.rowid, node_bindata.codec, {}
+            FROM {}
+            WHERE id = ? AND name = ? AND page = ?
+        """.format(_PAGE_COLUMNS, _PAGE_JOIN), (raw_id, key, page))
+        rows = c.fetchall()
+        if rows:
+            (rowid, row_codec, old_codec, old), = rows
+            if (row_codec is None and old_size == new_size and
+                    hasattr(self.db, 'blobopen')):
+                # sqlite3 only starts transactions implicitly before DML
+                # statements - without this, the write would be committed
+                # right away.
+                if not self.db.in_transaction:
+                    self.db.execute('BEGIN')
+                with self.db.blobopen('node_bindata', 'data', rowid) as blob:
+                    blob.seek(offset)
+                    blob.write(data)
+                return
+            old = self._decode_page(old_codec, old, old_size)
         else:
-            page_last = (end - 1) // DB_BINDATA_PAGE_SIZE
+            old = b''
+        res = bytearray(new_size)
+        old = old[:new_size]
+        res[:len(old)] = old
+        res[offset:offset + len(data)] = data
+        self._write_bindata_pages(c, codec, [(raw_id, key, page, res)])
+
+    def _write_bindata_pages(self, c, codec, pages):
+        """
+        Stores pages given as (id, key, page, data) tuples, encoding them
+        with a codec, and deduplicating them if enabled.
+        """
+        rows = []
+        for raw_id, key, page, data in pages:
+            if self.bindata_dedup:
+                data = bytes(data)
+                if data.count(b'\0') != len(data):
+                    digest = buffer(hashlib.sha256(data).digest())
+                    self._ref_page(c, digest, data, codec)
+                    rows.append((raw_id, key, page, 'hash', digest))
+                    continue
+            rows.append((raw_id, key, page) + _encode_page(data, codec))
+        c.executemany("""
+            INSERT OR REPLACE INTO node_bindata (id, name, page, codec, data)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+
+    def _ref_page(self, c, digest, data, codec):
+        """
+        Adds a reference to a deduplicated page, storing it if it's new.
+        """
+        c.execute("""
+            UPDATE bindata_page SET refs = refs + 1 WHERE hash = ?
+        """, (digest,))
+        if not c.rowcount:
             c.execute("""
-                SELECT data
-                FROM node_bindata
-                WHERE id = ? AND name = ? AND page BETWEEN ? AND ?
-                ORDER BY page
-            """, (buffer(id.bytes), key, page_first, page_last))
-            end -= offset
-        data = b''.join(bytes(x) for x, in c.fetchall())
-        return data[start:end]
+                INSERT INTO bindata_page (hash, refs, codec, data)
+                VALUES (?, 1, ?, ?)
+            """, (digest,) + _encode_page(data, codec))
+
+    def _cancel_repage(self, c, raw_id, key, meta):
+        """
+        Drops the pages written so far by an unfinished repage_bindata run.
+        """
+        length, page_size, page_base, _, _ = meta
+        c.execute("""
+            SELECT repage_size FROM node_bindata_meta
+            WHERE id = ? AND name = ? AND repage_size IS NOT NULL
+        """, (raw_id, key))
+        if not c.fetchall():
+            return
+        pages = (length + page_size - 1) // page_size
+        c.execute("""
+            DELETE FROM node_bindata
+            WHERE id = ? AND name = ? AND page >= ?
+        """, (raw_id, key, page_base + pages))
+        c.execute("""
+            UPDATE node_bindata_meta
+            SET repage_size = NULL, repage_done = NULL, repage_codec = NULL
+            WHERE id = ? AND name = ?
+        """, (raw_id, key))
+
+    def _copy_bindata(self, f, raw_id, key, meta, start, end):
+        """
+        Writes a range of binary data to a file, a page at a time.
+        """
+        if start < end:
+            for piece in self._get_bindata_pages(raw_id, key, meta,
+                                                 start, end):
+                f.write(piece)
+
+    def _write_bindata_file(self, c, raw_id, key, meta, start, data,
+                            new_len):
+        """
+        Stores binary data in external files, with ``data`` written at
+        ``start`` and the length set to ``new_len``.  Only the chunks
+        touched by the write (and the last one, if it's truncated) are
+        rewritten - unless the data is moved out of pages, in which case
+        all of them are written.  The files of chunks past the new end
+        are dropped.
+        """
+        _, page_size, _, codec, file_chunk = meta
+        end = start + len(data)
+        if file_chunk is None:
+            file_chunk = self.bindata_file_chunk
+            first, stop = 0, (new_len + file_chunk - 1) // file_chunk
+        else:
+            # This includes the last chunk if it gets truncated - the data
+            # then ends at ``end``.
+            first = start // file_chunk
+            stop = (end + file_chunk - 1) // file_chunk
+        if not os.path.isdir(self.bindata_dir):
+            os.makedirs(self.bindata_dir)
+        rows = []
+        for chunk in six.moves.range(first, stop):
+            lo = chunk * file_chunk
+            hi = min(new_len, lo + file_chunk)
+            name = uuid.uuid4().hex
+            path = os.path.join(self.bindata_dir, name)
+            with open(path + '.tmp', 'wb') as f:
+                self._copy_bindata(f, raw_id, key, meta, lo, min(start, hi))
+                if max(lo, start) < min(hi, end):
+                    f.write(buffer(data, max(lo, start) - start,
+                                   min(hi, end) - max(lo, start)))
+                self._copy_bindata(f, raw_id, key, meta, max(lo, end), hi)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(path + '.tmp', path)
+            self._files_created.append(name)
+            rows.append((raw_id, key, chunk, name))
+        _fsync_dir(self.bindata_dir)
+        self._drop_bindata_files(
+            c, raw_id, key, (new_len + file_chunk - 1) // file_chunk,
+            first, stop)
+        c.executemany("""
+            INSERT INTO node_bindata_file (id, name, chunk, file)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+        c.execute("""
+            DELETE FROM node_bindata WHERE id = ? AND name = ?
+        """, (raw_id, key))
+        c.execute("""
+            INSERT OR REPLACE INTO node_bindata_meta
+                (id, name, length, page_size, codec, file_chunk)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (raw_id, key, new_len, page_size, codec, file_chunk))
+
+    def _drop_bindata_files(self, c, raw_id, key, end, first=0, stop=0):
+        """
+        Drops the external files of chunks from ``end`` on, and of chunks
+        from ``first`` to ``stop``.  The files are removed on commit.
+        """
+        args = (raw_id, key, end, first, stop)
+        c.execute("""
+            SELECT file FROM node_bindata_file
+            WHERE id = ? AND name = ?
+            AND (chunk >= ? OR chunk >= ? AND chunk < ?)
+        """, args)
+        self._files_dropped += [name for name, in c.fetchall()]
+        c.execute("""
+            DELETE FROM node_bindata_file
+            WHERE id = ? AND name = ?
+            AND (chunk >= ? OR chunk >= ? AND chunk < ?)
+        """, args)
 
     def set_bindata(self, id, key, start, data, truncate=False, commit=True):
         if not isinstance(id, NodeID):
@@ -388,82 +1183,176 @@ class DbBackend:
             raise TypeError('key is not a string')
         if not isinstance(truncate, bool):
             raise TypeError('truncate is not a bool')
-        if not isinstance(data, bytes):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
             raise TypeError('data must be bytes')
         raw_id = buffer(id.bytes)
 
-        # First, determine current length.
+        # First, determine current length and layout.
         c = self.db.cursor()
-        # ATTENTION: sqlite dependency here - length(data) will be evaluated
-        # for the max page (see
-        # https://www.sqlite.org/lang_select.html#bareagg).
-        assert isinstance(c, sqlite3.Cursor)
-        c.execute("""
-            SELECT MAX(page), length(data)
-            FROM node_bindata
-            WHERE id = ? AND name = ?
-        """, (raw_id, key))
-        (page, lastlen), = c.fetchall()
-        if page is not None:
-            cur_len = page * DB_BINDATA_PAGE_SIZE + lastlen
-        else:
-            cur_len = 0
+        meta = self._get_bindata_meta(c, raw_id, key)
+        cur_len, page_size, page_base, codec, file_chunk = meta
         if start > cur_len:
             raise WritePastEndError()
 
         # Some calculations.
         end = start + len(data)
-        page_first = start // DB_BINDATA_PAGE_SIZE
-        page_end = (end + DB_BINDATA_PAGE_SIZE - 1) // DB_BINDATA_PAGE_SIZE
-        offset = page_first * DB_BINDATA_PAGE_SIZE
-        real_end = page_end * DB_BINDATA_PAGE_SIZE
-
-        # Fetch partial first page.
-        if start != offset:
-            assert offset < start
-            data = self.get_bindata(id, key, offset, start) + data
-            start = offset
-
-        # Fetch partial last page.
-        if end != real_end and not truncate:
-            assert end < real_end
-            data = data + self.get_bindata(id, key, end, real_end)
-            end = real_end
-
-        # Remove pages that will be overwritten or truncated.
+        new_len = end if truncate else max(cur_len, end)
+        if end == start and not truncate:
+            # Nothing to do.
+            return
+        self._bindata_changed(raw_id, key)
+
+        # Data that is (or becomes) large enough goes to external files.
+        if new_len and (file_chunk is not None or (
+                self.bindata_file_size is not None and
+                new_len >= self.bindata_file_size)):
+            self._write_bindata_file(
+                c, raw_id, key, meta, start, data, new_len)
+            if commit:
+                self.commit()
+            return
+
+        page_first = start // page_size
+        page_end = (end + page_size - 1) // page_size
+
+        # The pages of an unfinished repage_bindata run would get stale.
+        self._cancel_repage(c, raw_id, key, meta)
+
+        # Remove truncated pages.
         if truncate:
             c.execute("""
                 DELETE FROM node_bindata
                 WHERE id = ? AND name = ? AND page >= ?
-            """, (raw_id, key, page_first))
-        elif page_first == page_end:
-            # Nothing to do.
-            assert len(data) == 0
-            return
+            """, (raw_id, key, page_base + page_end))
+
+        # Write the pages - buffer() slices the data without copying it.
+        # Pages that are replaced as a whole are written in one go, the
+        # partial first and last pages are patched.
+        full_pages = []
+        for page in six.moves.range(page_first, page_end):
+            page_start = page * page_size
+            lo = max(start, page_start)
+            hi = min(end, page_start + page_size)
+            piece = buffer(data, lo - start, hi - lo)
+            old_size = min(max(cur_len - page_start, 0), page_size)
+            new_size = min(new_len - page_start, page_size)
+            if lo == page_start and hi - lo == new_size:
+                full_pages.append((raw_id, key, page_base + page, piece))
+            else:
+                self._patch_bindata_page(
+                    c, raw_id, key, page_base + page, codec,
+                    lo - page_start, piece, old_size, new_size)
+        self._write_bindata_pages(c, codec, full_pages)
+
+        # And record the new length.
+        if new_len:
+            c.execute("""
+                INSERT OR REPLACE INTO node_bindata_meta
+                    (id, name, length, page_size, page_base, codec)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (raw_id, key, new_len, page_size, page_base, codec))
         else:
             c.execute("""
-                DELETE FROM node_bindata
-                WHERE id = ? AND name = ? AND page BETWEEN ? AND ?
-            """, (raw_id, key, page_first, page_end - 1))
-
-        # Write new pages.
-        c.executemany("""
-            INSERT INTO node_bindata (id, name, page, data)
-            VALUES (?, ?, ?, ?)
-        """, [
-            (
-                raw_id, key, page,
-                buffer(data[
-                    (page - page_first) * DB_BINDATA_PAGE_SIZE:
-                    (page - page_first + 1) * DB_BINDATA_PAGE_SIZE
-                ])
-            ) for page in six.moves.range(page_first, page_end)
-        ])
+                DELETE FROM node_bindata_meta WHERE id = ? AND name = ?
+            """, (raw_id, key))
+            if file_chunk is not None:
+                self._drop_bindata_files(c, raw_id, key, 0)
 
         # We're done here.
         if commit:
             self.commit()
 
+    def get_bindata_page_sizes(self):
+        """
+        Returns a dict mapping (node id, key) pairs of all binary data in
+        the database to their page sizes.
+        """
+        c = self.db.cursor()
+        c.execute("""
+            SELECT id, name, page_size FROM node_bindata_meta
+        """)
+        return {
+            (NodeID(bytes(raw_id)), key): page_size
+            for raw_id, key, page_size in c.fetchall()
+        }
+
+    def repage_bindata(self, id, key, page_size, codec=_KEEP_CODEC,
+                       batch_size=DB_REPAGE_BATCH_SIZE, commit=True):
+        """
+        Rewrites binary data with a new page size and (if given) codec,
+        which is also used for pages written later.  This is a generator -
+        it converts about ``batch_size`` octets at each step, commits them
+        (unless ``commit`` is false), and yields the number of octets
+        converted so far, so that other work (including through other
+        connections to the database) can go on between the steps.  The new
+        pages are written next to the old ones, which are still used until
+        the last step switches over.  An unfinished conversion to the same
+        page size and codec is resumed; writing to the data in the meantime
+        makes it start over.  Data stored in an external file is left alone.
+        """
+        if not isinstance(id, NodeID):
+            raise TypeError('node id has wrong type')
+        if not isinstance(key, six.text_type):
+            raise TypeError('key is not a string')
+        page_size = operator.index(page_size)
+        if page_size <= 0:
+            raise ValueError('page size must be positive')
+        if codec is not _KEEP_CODEC:
+            _check_codec(codec)
+        raw_id = buffer(id.bytes)
+        batch_pages = max(1, batch_size // page_size)
+        c = self.db.cursor()
+        while True:
+            meta = self._get_bindata_meta(c, raw_id, key)
+            length, old_size, page_base, old_codec, file_chunk = meta
+            if codec is _KEEP_CODEC:
+                codec = old_codec
+            if (not length or file_chunk is not None or
+                    (old_size, old_codec) == (page_size, codec)):
+                return
+            c.execute("""
+                SELECT repage_size, repage_done, repage_codec
+                FROM node_bindata_meta
+                WHERE id = ? AND name = ?
+            """, (raw_id, key))
+            (repage_size, done, repage_codec), = c.fetchall()
+            if (repage_size, repage_codec) != (page_size, codec):
+                self._cancel_repage(c, raw_id, key, meta)
+                done = 0
+            new_base = page_base + (length + old_size - 1) // old_size
+            stop = min(length, done + batch_pages * page_size)
+            data = b''.join(self._get_bindata_pages(
+                raw_id, key, meta, done, stop))
+            self._write_bindata_pages(c, codec, [
+                (
+                    raw_id, key, new_base + (done + pos) // page_size,
+                    buffer(data, pos, page_size)
+                ) for pos in six.moves.range(0, len(data), page_size)
+            ])
+            if stop < length:
+                c.execute("""
+                    UPDATE node_bindata_meta
+                    SET repage_size = ?, repage_done = ?, repage_codec = ?
+                    WHERE id = ? AND name = ?
+                """, (page_size, stop, codec, raw_id, key))
+            else:
+                # The old pages go away.
+                self._bindata_changed(raw_id, key)
+                c.execute("""
+                    DELETE FROM node_bindata
+                    WHERE id = ? AND name = ? AND page BETWEEN ? AND ?
+                """, (raw_id, key, page_base, new_base - 1))
+                c.execute("""
+                    UPDATE node_bindata_meta
+                    SET page_size = ?, page_base = ?, codec = ?,
+                        repage_size = NULL, repage_done = NULL,
+                        repage_codec = NULL
+                    WHERE id = ? AND name = ?
+                """, (page_size, new_base, codec, raw_id, key))
+            if commit:
+                self.commit()
+            yield stop
+
     def delete(self, id, commit=True):
         if not isinstance(id, NodeID):
             raise TypeError('node id has wrong type')
@@ -478,65 +1367,283 @@ class DbBackend:
         c.execute("""
             DELETE FROM node_data WHERE id = ?
         """, (raw_id,))
+        self._bindata_changed(raw_id)
         c.execute("""
             DELETE FROM node_bindata WHERE id = ?
         """, (raw_id,))
+        c.execute("""
+            SELECT file FROM node_bindata_file WHERE id = ?
+        """, (raw_id,))
+        self._files_dropped += [name for name, in c.fetchall()]
+        c.execute("""
+            DELETE FROM node_bindata_file WHERE id = ?
+        """, (raw_id,))
+        c.execute("""
+            DELETE FROM node_bindata_meta WHERE id = ?
+        """, (raw_id,))
+        c.execute("""
+            DELETE FROM node_pos WHERE key IN (
+                SELECT key FROM node_pos_key WHERE id = ?
+            )
+        """, (raw_id,))
+        c.execute("""
+            DELETE FROM node_pos_key WHERE id = ?
+        """, (raw_id,))
         c.execute("""
             DELETE FROM node WHERE id = ?
         """, (raw_id,))
         if commit:
             self.commit()
 
-    def list(self, parent, tags=frozenset(), pos_filter=PosFilter()):
-        if not isinstance(parent, NodeID):
-            raise TypeError('parent must be a NodeID')
+    def _count_capped(self, stmt, args, cap):
+        """
+        Counts the rows returned by a query, stopping at ``cap``.
+        """
+        c = self.db.cursor()
+        c.execute("""
+            SELECT COUNT(*) FROM ({} LIMIT ?)
+        """.format(stmt), args + (cap,))
+        return c.fetchone()[0]
+
+    def _pos_conds(self, parent, pos_filter):
+        """
+        Builds the node_pos conditions that all nodes matching list
+        parameters satisfy.  Returns a tuple of (conditions, args) - with
+        no conditions if the position filter is empty.
+        """
+        conds = []
+        args = ()
+        inf = float('inf')
+        if pos_filter.start_from is not None:
+            conds.append("node_pos.pos_hi >= ?")
+            args += (_pos_coord(pos_filter.start_from, -inf),)
+        if pos_filter.start_to is not None:
+            conds.append("node_pos.pos_lo <= ?")
+            args += (_pos_coord(pos_filter.start_to, inf),)
+        if pos_filter.end_from is not None:
+            conds.append("node_pos.pos_hi >= ?")
+            args += (_pos_coord(pos_filter.end_from, -inf),)
+        if pos_filter.end_to is not None:
+            conds.append("node_pos.pos_lo <= ?")
+            args += (_pos_coord(pos_filter.end_to, inf),)
+        if conds and parent is not None:
+            if parent == NodeID.root_id:
+                parent_key = _pos_parent_key(None)
+            else:
+                parent_key = _pos_parent_key(parent.bytes)
+            conds += ["node_pos.parent_lo <= ?", "node_pos.parent_hi >= ?"]
+            args += (parent_key, parent_key)
+        return conds, args
+
+    def _pick_list_driver(self, parent, tags, pos_filter):
+        """
+        Picks the nodes that should be scanned to answer a list query, ie.
+        the smallest of: the children of the parent, the nodes with one of
+        the tags, or the node_pos entries overlapping the position filter.
+        Returns None for the children (or all nodes, if parent is None),
+        a tag name, or a tuple of node_pos (conditions, args).
+        The candidates are counted (using indexes) with a growing limit,
+        until one of them is below it - so picking costs a small multiple
+        of the scan it chooses, even if the other candidates are huge.
+        """
+        candidates = []
+        if parent == NodeID.root_id:
+            candidates.append((None, """
+                SELECT 1 FROM node WHERE parent IS NULL
+            """, ()))
+        elif parent is not None:
+            candidates.append((None, """
+                SELECT 1 FROM node WHERE parent = ?
+            """, (buffer(parent.bytes),)))
+        for tag in sorted(tags):
+            candidates.append((tag, """
+                SELECT 1 FROM node_tag WHERE name = ?
+            """, (tag,)))
+        pos_conds, pos_args = self._pos_conds(parent, pos_filter)
+        if pos_conds:
+            candidates.append(((pos_conds, pos_args), """
+                SELECT 1 FROM node_pos WHERE {}
+            """.format(" AND ".join(pos_conds)), pos_args))
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0][0]
+        cap = DB_LIST_PLAN_START
+        while True:
+            counts = [
+                (self._count_capped(stmt, args, cap), i)
+                for i, (_, stmt, args) in enumerate(candidates)
+            ]
+            count, i = min(counts)
+            if count < cap:
+                return candidates[i][0]
+            cap *= 4
+
+    def _list_query(self, parent, tags, pos_filter):
+        """
+        Builds the query for ids of the nodes matching list parameters.
+        A parent of None matches all nodes.  Returns a tuple of (statement,
+        args).
+        """
         if not isinstance(tags, (set, frozenset)):
             raise TypeError('tags must be a set')
         if not isinstance(pos_filter, PosFilter):
             raise TypeError('pos_filter must be a PosFilter')
-        if parent == NodeID.root_id:
+        for tag in tags:
+            if not isinstance(tag, six.text_type):
+                raise TypeError('tag is not a string')
+        driver = self._pick_list_driver(parent, tags, pos_filter)
+        tag = None
+        conds = []
+        args = ()
+        if driver is None:
+            stmt = """
+                SELECT id FROM node
+            """
+        elif isinstance(driver, tuple):
+            # The R*Tree only narrows down the candidates - the exact
+            # position checks below still apply.
             stmt = """
-                SELECT id FROM node WHERE parent IS NULL
+                SELECT node.id FROM node_pos
+                CROSS JOIN node_pos_key ON node_pos_key.key = node_pos.key
+                CROSS JOIN node ON node.id = node_pos_key.id
             """
-            args = ()
+            conds += driver[0]
+            args += driver[1]
         else:
+            # CROSS JOIN makes sqlite scan node_tag first.
+            tag = driver
             stmt = """
-                SELECT id FROM node WHERE parent = ?
+                SELECT node.id FROM node_tag AS first_tag
+                CROSS JOIN node ON node.id = first_tag.id
             """
-            args = (buffer(parent.bytes), )
-        for tag in tags:
-            if not isinstance(tag, six.text_type):
-                raise TypeError('tag is not a string')
-            stmt += """ AND EXISTS (
-                SELECT 1 FROM node_tag
-                WHERE node_tag.id = node.id AND name = ?
-            )"""
+            conds.append("first_tag.name = ?")
             args += (tag,)
-        if pos_filter.start_from is not None:
-            stmt += " AND pos_start >= ?"
-            args += (db_bigint_encode(pos_filter.start_from),)
-        if pos_filter.start_to is not None:
-            stmt += " AND (pos_start <= ? OR pos_start IS NULL)"
-            args += (db_bigint_encode(pos_filter.start_to),)
-        if pos_filter.end_from is not None:
-            stmt += " AND (pos_end >= ? OR pos_end is NULL)"
-            args += (db_bigint_encode(pos_filter.end_from),)
-        if pos_filter.end_to is not None:
-            stmt += " AND pos_end <= ?"
-            args += (db_bigint_encode(pos_filter.end_to),)
+        if parent == NodeID.root_id:
+            conds.append("parent IS NULL")
+        elif parent is not None:
+            conds.append("parent = ?")
+            args += (buffer(parent.bytes),)
+        for other in sorted(tags):
+            if other == tag:
+                continue
+            conds.append("""EXISTS (
+                SELECT 1 FROM node_tag
+                WHERE node_tag.id = node.id AND node_tag.name = ?
+            )""")
+            args += (other,)
+        for column, op, val, null in [
+            ('pos_start', '>=', pos_filter.start_from, False),
+            ('pos_start', '<=', pos_filter.start_to, True),
+            ('pos_end', '>=', pos_filter.end_from, True),
+            ('pos_end', '<=', pos_filter.end_to, False),
+        ]:
+            if val is None:
+                continue
+            cond, cond_args = _pos_cmp(column, op, val)
+            if null:
+                cond = "({} OR {} IS NULL)".format(cond, column)
+            conds.append(cond)
+            args += cond_args
+        if conds:
+            stmt += " WHERE " + " AND ".join(conds)
+        return stmt, args
+
+    def list(self, parent, tags=frozenset(), pos_filter=PosFilter()):
+        if not isinstance(parent, NodeID):
+            raise TypeError('parent must be a NodeID')
+        stmt, args = self._list_query(parent, tags, pos_filter)
         c = self.db.cursor()
         c.execute(stmt, args)
         return {NodeID(bytes(x)) for x, in c.fetchall()}
 
+    def list_tagged(self, tags, pos_filter=PosFilter()):
+        """
+        Like list, but returns all nodes with the given tags, regardless
+        of their parent.
+        """
+        stmt, args = self._list_query(None, tags, pos_filter)
+        c = self.db.cursor()
+        c.execute(stmt, args)
+        return {NodeID(bytes(x)) for x, in c.fetchall()}
+
+    def list_nodes(self, parent, tags=frozenset(), pos_filter=PosFilter()):
+        """
+        Like list, but returns a list of full Nodes instead of ids.  All
+        the nodes are read with a single query, which gathers the rows of
+        all node tables for the listed ids (tagged with a letter saying
+        which table they come from) into one result, ordered by id.
+        """
+        if not isinstance(parent, NodeID):
+            raise TypeError('parent must be a NodeID')
+        stmt, args = self._list_query(parent, tags, pos_filter)
+        c = self.db.cursor()
+        c.execute("""
+            WITH ids AS ({})
+            SELECT 'n', id, parent, pos_start, pos_end
+            FROM node WHERE id IN ids
+            UNION ALL
+            SELECT 't', id, name, NULL, NULL
+            FROM node_tag WHERE id IN ids
+            UNION ALL
+            SELECT 'a', id, name, data, NULL
+            FROM node_attr WHERE id IN ids
+            UNION ALL
+            SELECT 'd', id, name, NULL, NULL
+            FROM node_data WHERE id IN ids
+            UNION ALL
+            SELECT 'b', id, name, length, NULL
+            FROM node_bindata_meta WHERE id IN ids
+            ORDER BY 2
+        """.format(stmt), args)
+        res = []
+        node = None
+        for kind, raw_id, a, b, d in c:
+            raw_id = bytes(raw_id)
+            if node is None or node.id.bytes != raw_id:
+                node = Node(id=NodeID(raw_id), tags=set(), attr={},
+                            data=set(), bindata={})
+                res.append(node)
+            if kind == 'n':
+                node.parent = NodeID(bytes(a)) if a else NodeID.root_id
+                node.pos_start = db_pos_decode(b)
+                node.pos_end = db_pos_decode(d)
+            elif kind == 't':
+                node.tags.add(a)
+            elif kind == 'a':
+                node.attr[a] = self._load(b)
+            elif kind == 'd':
+                node.data.add(a)
+            else:
+                node.bindata[a] = b
+        return res
+
     def begin(self):
         if six.PY3:
             assert not self.db.in_transaction
 
+    def _remove_files(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.bindata_dir, name))
+            except OSError:
+                # Already gone, or still mapped on Windows - the file is
+                # unused either way.
+                pass
+
     def commit(self):
         self.db.commit()
+        self._files_created = []
+        dropped, self._files_dropped = self._files_dropped, []
+        self._remove_files(dropped)
 
     def rollback(self):
         self.db.rollback()
+        for reader in self._page_readers:
+            reader.stale = True
+        self._files_dropped = []
+        created, self._files_created = self._files_created, []
+        self._remove_files(created)
 
     def close(self):
         self.db.close()
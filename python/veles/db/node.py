@@ -43,8 +43,8 @@ class DbNode(object):
 
     def _add_sub_list(self, sub):
         try:
-            nids = self.tracker.get_list_raw(self.id, sub.tags, sub.pos_filter)
-            dbnodes = {self.tracker.get_cached_node(x) for x in nids}
+            dbnodes = set(self.tracker.get_cached_list(
+                self.id, sub.tags, sub.pos_filter))
             self.list_subs[sub] = dbnodes
             sub.list_changed([dbnode.node for dbnode in dbnodes], [])
         except VelesException as e:
@@ -78,9 +78,11 @@ class DbNode(object):
         self.bindata_subs[sub.key].add(sub)
         if self.node is None:
             sub.error(ObjectGoneError())
-        else:
+        elif sub.needs_data:
             sub.bindata_changed(self.tracker.get_bindata(
                 self.id, sub.key, sub.start, sub.end))
+        else:
+            sub.bindata_changed(None)
 
     def _del_sub_bindata(self, sub):
         self.bindata_subs[sub.key].remove(sub)
@@ -68,9 +68,13 @@ class BaseSubscriberData(BaseSubscriber):
 class BaseSubscriberBinData(BaseSubscriber):
     """
     A subscriber of node binary data modifications.  ``bindata_changed`` will
-    be called whenever the given bindara range is changed.
+    be called whenever the given bindara range is changed.  Subclasses that
+    don't use the new data can set ``needs_data`` to False - they then get
+    None instead, and the range isn't read.
     """
 
+    needs_data = True
+
     def __init__(self, tracker, node, key, start, end):
         self.node = node
         self.key = key
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import weakref
 
 try:
@@ -20,6 +21,7 @@ except ImportError:
     from backports.functools_lru_cache import lru_cache
 
 from veles.schema.nodeid import NodeID
+from veles.data.bindata import BinData
 from veles.proto import operation, check
 from veles.proto.node import Node, PosFilter
 from veles.proto.exceptions import (
@@ -27,6 +29,7 @@ from veles.proto.exceptions import (
     ObjectExistsError,
     ParentCycleError,
     PreconditionFailedError,
+    SchemaError,
 )
 
 from .subscriber import (
@@ -68,16 +71,42 @@ class DbTracker(object):
         try:
             return self.nodes[nid]
         except KeyError:
-            node = self.db.get(nid)
-            if not node:
-                res = DbNode(self, nid, None, None)
-            else:
-                parent = self.get_cached_node(node.parent)
-                assert parent.node is not None or parent.id == NodeID.root_id
-                res = DbNode(self, nid, node, parent)
-            self.nodes[nid] = res
+            return self._load_nodes([nid])[0]
+
+    def _load_nodes(self, nids):
+        """
+        Returns DbNodes for the given ids, loading the ones not in
+        self.nodes (and their missing ancestors) from the database with
+        one batch of queries per tree level.
+        """
+        loaded = {}
+        todo = {nid for nid in nids if nid not in self.nodes}
+        while todo:
+            found = self.db.get_many(todo)
+            for nid in todo:
+                loaded[nid] = found.get(nid)
+            todo = {
+                node.parent for node in found.values()
+                if node.parent not in self.nodes and
+                node.parent not in loaded
+            }
+
+        def make(nid):
+            res = self.nodes.get(nid)
+            if res is None:
+                node = loaded[nid]
+                if not node:
+                    res = DbNode(self, nid, None, None)
+                else:
+                    parent = make(node.parent)
+                    assert (parent.node is not None or
+                            parent.id == NodeID.root_id)
+                    res = DbNode(self, nid, node, parent)
+                self.nodes[nid] = res
             return res
 
+        return [make(nid) for nid in nids]
+
     def get(self, nid):
         dbnode = self.get_cached_node(nid)
         if dbnode.node is None:
@@ -96,6 +125,34 @@ class DbTracker(object):
             raise ObjectGoneError()
         return self.db.get_bindata(nid, key, start, end)
 
+    def get_bindata_pages(self, nid, key, start=0, end=None):
+        """
+        Returns a range of bindata as a tuple of (size, pages), where pages
+        is a lazy iterator of memoryviews (see DbBackend.iter_bindata)
+        totalling size octets.  If the data changes before the iterator is
+        done, it may raise BinDataChangedError.
+        """
+        dbnode = self.get_cached_node(nid)
+        if dbnode.node is None:
+            raise ObjectGoneError()
+        pages = self.db.iter_bindata(nid, key, start, end)
+        total = dbnode.node.bindata.get(key, 0)
+        stop = total if end is None else min(end, total)
+        return max(stop - start, 0), pages
+
+    def get_bindata_hash(self, nid, key, start=0, end=None):
+        """
+        Returns the SHA-256 hash of a range of bindata (as checked by
+        CheckBinDataHash), reading it a page at a time.
+        """
+        dbnode = self.get_cached_node(nid)
+        if dbnode.node is None:
+            raise ObjectGoneError()
+        res = hashlib.sha256()
+        for page in self.db.iter_bindata(nid, key, start, end):
+            res.update(page)
+        return res.digest()
+
     def get_list_raw(self, parent, tags=frozenset(), pos_filter=PosFilter()):
         if parent != NodeID.root_id:
             dbnode = self.get_cached_node(parent)
@@ -105,10 +162,41 @@ class DbTracker(object):
 
     def get_list(self, parent, tags=frozenset(), pos_filter=PosFilter()):
         return [
-            self.get_cached_node(nid).node
-            for nid in self.get_list_raw(parent, tags, pos_filter)
+            dbnode.node
+            for dbnode in self.get_cached_list(parent, tags, pos_filter)
         ]
 
+    def get_tagged(self, tags, pos_filter=PosFilter()):
+        """
+        Returns all nodes with the given tags, regardless of their parent.
+        """
+        return [
+            dbnode.node
+            for dbnode in self._load_nodes(
+                list(self.db.list_tagged(tags, pos_filter)))
+        ]
+
+    def get_cached_list(self, parent, tags=frozenset(),
+                        pos_filter=PosFilter()):
+        """
+        Returns DbNodes of the listed nodes.  The nodes missing from
+        the cache are read from the database together with the list itself
+        (see DbBackend.list_nodes) and put into the cache.
+        """
+        dbparent = self.get_cached_node(parent)
+        if parent != NodeID.root_id and dbparent.node is None:
+            raise ObjectGoneError()
+        res = []
+        for node in self.db.list_nodes(parent, tags, pos_filter):
+            dbnode = self.nodes.get(node.id)
+            if dbnode is None:
+                dbnode = DbNode(self, node.id, node, dbparent)
+                self.nodes[node.id] = dbnode
+            res.append(dbnode)
+            # Go through the LRU cache as well, to keep recent nodes alive.
+            self.get_cached_node(node.id)
+        return res
+
     def _check_ok_gone(self, el):
         dbnode = self.get_cached_node(el.node)
         return dbnode.node is None
@@ -144,6 +232,10 @@ class DbTracker(object):
         data = self.get_bindata(el.node, el.key, el.start, el.end)
         return data == el.data
 
+    def _check_ok_bindata_hash(self, el):
+        res = self.get_bindata_hash(el.node, el.key, el.start, el.end)
+        return res == el.hash
+
     def _check_ok_trigger(self, el):
         node = self.get(el.node)
         return node.triggers.get(el.key) == el.state
@@ -163,6 +255,7 @@ class DbTracker(object):
             check.CheckData: self._check_ok_data,
             check.CheckBinDataSize: self._check_ok_bindata_size,
             check.CheckBinData: self._check_ok_bindata,
+            check.CheckBinDataHash: self._check_ok_bindata_hash,
             check.CheckTrigger: self._check_ok_trigger,
             check.CheckList: self._check_ok_list,
         }
@@ -295,6 +388,24 @@ class DbTracker(object):
             else:
                 del dbnode.node.bindata[op.key]
 
+    def _op_transform_bindata(self, xact, op, dbnode):
+        if dbnode.node is None:
+            raise ObjectGoneError()
+        raw = self.db.get_bindata(dbnode.id, op.key, op.start, op.end)
+        try:
+            src = BinData.from_raw_data(op.transform.width, raw)
+            res = op.transform.apply(src)
+        except ValueError as e:
+            raise SchemaError(str(e))
+        if res.octets() != len(raw):
+            raise SchemaError('transform changes size of data')
+        self._op_set_bindata(xact, operation.OperationSetBinData(
+            node=op.node,
+            key=op.key,
+            start=op.start,
+            data=res.raw_data,
+        ), dbnode)
+
     def _op_add_trigger(self, xact, op, dbnode):
         if dbnode.node is None:
             raise ObjectGoneError()
@@ -321,6 +432,8 @@ class DbTracker(object):
                 operation.OperationSetAttr: self._op_set_attr,
                 operation.OperationSetData: self._op_set_data,
                 operation.OperationSetBinData: self._op_set_bindata,
+                operation.OperationTransformBinData:
+                    self._op_transform_bindata,
                 operation.OperationAddTrigger: self._op_add_trigger,
                 operation.OperationDelTrigger: self._op_del_trigger,
             }
@@ -58,8 +58,11 @@ class Transaction(object):
             for sub in self.bindata_subs:
                 if sub in self.gone_subs:
                     continue
-                data = self.tracker.get_bindata(
-                    sub.node, sub.key, sub.start, sub.end)
+                if sub.needs_data:
+                    data = self.tracker.get_bindata(
+                        sub.node, sub.key, sub.start, sub.end)
+                else:
+                    data = None
                 sub.bindata_changed(data)
         else:
             # Whoops.  Undo changes.
@@ -92,6 +92,17 @@ class CheckBinData(Check):
     data = fields.Binary()
 
 
+class CheckBinDataHash(Check):
+    object_type = 'bindata_hash'
+
+    node = fields.NodeID()
+    key = fields.String()
+    start = fields.SmallUnsignedInteger()
+    end = fields.SmallUnsignedInteger(optional=True)
+    # SHA-256 of the range - like CheckBinData, without carrying the data.
+    hash = fields.Binary()
+
+
 class CheckTrigger(Check):
     object_type = 'trigger'
 
@@ -14,8 +14,17 @@
 
 from __future__ import unicode_literals
 
+import math
+import struct
+
 from veles.schema import model, fields, enumeration
-from veles.data.repack import Repacker
+from veles.data.bindata import BinData
+from veles.data.repack import Repacker, repack_many, to_uint64
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class FieldSignMode(enumeration.EnumModel):
@@ -40,24 +49,236 @@ class FieldStringEncoding(enumeration.EnumModel):
     utf16 = 'utf16'
 
 
+def _join_values(raw_values):
+    """
+    Concatenates a list of BinData instances of the same width.  Returns
+    the concatenation and a list of offsets where each of the values
+    starts, followed by the total length.
+    """
+    widths = set(x.width for x in raw_values)
+    if len(widths) != 1:
+        raise ValueError('raw values have mismatched widths')
+    offsets = [0]
+    for x in raw_values:
+        offsets.append(offsets[-1] + len(x))
+    data = BinData.from_raw_data(
+        widths.pop(), b''.join(x.raw_data for x in raw_values))
+    return data, offsets
+
+
+def _split_values(values, offsets):
+    return [values[a:b] for a, b in zip(offsets, offsets[1:])]
+
+
 class FieldType(model.PolymorphicModel):
-    pass
+    """
+    Describes how to interpret the raw value of a field.
+    """
+
+    def decode(self, raw_value):
+        """
+        Decodes a raw value (a BinData instance) into Python values -
+        a list of numbers or a string, depending on the type.  Subclasses
+        override at least one of ``decode`` and ``decode_many``.
+        """
+        return self.decode_many([raw_value])[0]
+
+    def decode_many(self, raw_values):
+        """
+        Decodes a list of raw values of the same width at once, returning
+        a list of the results of ``decode``.  The types defined here decode
+        the values together, as one array, which is much faster than
+        decoding them one by one.
+        """
+        return [self.decode(x) for x in raw_values]
 
 
 class FieldTypeFixed(FieldType):
+    """
+    Fixed-point numbers (incl. integers).  The raw value is an unsigned
+    or two's complement integer, scaled by 2 ** ``shift``.  Values with
+    negative shift (which are fractions) are decoded to floats, the rest
+    to ints.
+    """
+
+    object_type = 'fixed'
+
     shift = fields.SmallInteger()
     sign_mode = fields.Enum(FieldSignMode)
 
+    def decode_many(self, raw_values):
+        if not raw_values:
+            return []
+        data, offsets = _join_values(raw_values)
+        width = data.width
+        sign = 1 << (width - 1)
+        signed = self.sign_mode == FieldSignMode.signed
+        shift = self.shift
+        if numpy is not None and width <= 64:
+            x = to_uint64(data)
+            if signed:
+                # Sign-extend with a mask: (x ^ sign) - sign.
+                x = x.view(numpy.int64)
+                if width < 64:
+                    x = (x ^ numpy.int64(sign)) - numpy.int64(sign)
+            if shift < 0:
+                values = numpy.ldexp(x.astype(numpy.float64), shift).tolist()
+            elif shift and width + shift < 64:
+                values = (x << x.dtype.type(shift)).tolist()
+            else:
+                values = x.tolist()
+                if shift:
+                    values = [v << shift for v in values]
+        else:
+            values = list(data)
+            if signed:
+                values = [v - ((v & sign) << 1) for v in values]
+            if shift < 0:
+                values = [math.ldexp(v, shift) for v in values]
+            elif shift:
+                values = [v << shift for v in values]
+        return _split_values(values, offsets)
+
 
 class FieldTypeFloat(FieldType):
+    """
+    IEEE 754 floating-point numbers, in 32-bit or 64-bit elements.
+    If ``complex`` is set, pairs of elements (real part first) are decoded
+    to complex numbers.
+    """
+
+    object_type = 'float'
+
     mode = fields.Enum(FieldFloatMode)
     complex = fields.Boolean()
 
+    def decode_many(self, raw_values):
+        if not raw_values:
+            return []
+        data, offsets = _join_values(raw_values)
+        size = 32 if self.mode == FieldFloatMode.ieee754_single else 64
+        if data.width != size:
+            raise ValueError('float field needs {}-bit elements'.format(size))
+        if self.complex:
+            if any(x % 2 for x in offsets):
+                raise ValueError('complex float field has an odd number '
+                                 'of elements')
+            offsets = [x // 2 for x in offsets]
+        if numpy is not None:
+            dtype = {
+                (32, False): '<f4',
+                (64, False): '<f8',
+                (32, True): '<c8',
+                (64, True): '<c16',
+            }[size, self.complex]
+            values = numpy.frombuffer(data.raw_data, dtype=dtype).tolist()
+        else:
+            values = list(struct.unpack(
+                '<{}{}'.format(len(data), 'f' if size == 32 else 'd'),
+                data.raw_data))
+            if self.complex:
+                values = [complex(re, im)
+                          for re, im in zip(values[::2], values[1::2])]
+        return _split_values(values, offsets)
+
 
 class FieldTypeString(FieldType):
+    """
+    Strings, one per raw value.  Trailing zero elements are trimmed
+    in ``zero_padded`` mode, and everything from the first zero element
+    on in ``zero_terminated`` mode.  With ``raw`` encoding, elements are
+    Unicode code points; ``utf8`` needs 8-bit and ``utf16`` needs 16-bit
+    elements (code units).  Invalid data is decoded to U+FFFD replacement
+    characters.
+    """
+
+    object_type = 'string'
+
     mode = fields.Enum(FieldStringMode)
     encoding = fields.Enum(FieldStringEncoding)
 
+    def _ends(self, data, offsets):
+        """
+        Returns the end of each string (as an index into ``data``),
+        after trimming zeros.
+        """
+        starts = offsets[:-1]
+        ends = offsets[1:]
+        if self.mode == FieldStringMode.raw or not len(data):
+            return ends
+        ope = data.octets_per_element()
+        if numpy is not None and ope in (1, 2, 4, 8):
+            # Find the zeros of all strings at once: reduce the positions
+            # of the zeros (or of the non-zeros, for padding) over each
+            # string's range.  Empty strings cannot be reduced over,
+            # so they are patched up afterwards.
+            x = data.to_numpy()
+            idx = numpy.arange(len(x))
+            nonempty = [i for i, (a, b) in enumerate(zip(starts, ends))
+                        if a != b]
+            reduce_at = numpy.array([starts[i] for i in nonempty],
+                                    dtype=numpy.intp)
+            if self.mode == FieldStringMode.zero_terminated:
+                pos = numpy.where(x == 0, idx, len(x))
+                found = numpy.minimum.reduceat(pos, reduce_at).tolist()
+            else:
+                pos = numpy.where(x != 0, idx + 1, 0)
+                found = numpy.maximum.reduceat(pos, reduce_at).tolist()
+            res = list(starts)
+            for i, end in zip(nonempty, found):
+                res[i] = min(max(end, starts[i]), ends[i])
+            return res
+        raw = data.raw_data
+        zero = b'\0' * ope
+        res = []
+        for a, b in zip(starts, ends):
+            if self.mode == FieldStringMode.zero_terminated:
+                pos = a * ope
+                while True:
+                    pos = raw.find(zero, pos, b * ope)
+                    if pos < 0 or pos % ope == 0:
+                        break
+                    pos += 1
+                res.append(b if pos < 0 else pos // ope)
+            else:
+                size = len(raw[a * ope:b * ope].rstrip(b'\0'))
+                res.append(a + (size + ope - 1) // ope)
+        return res
+
+    def decode_many(self, raw_values):
+        if not raw_values:
+            return []
+        data, offsets = _join_values(raw_values)
+        width = data.width
+        ends = self._ends(data, offsets)
+        if self.encoding == FieldStringEncoding.raw:
+            if width <= 8:
+                text = data.raw_data.decode('latin-1')
+            else:
+                # Go through UTF-32, replacing values out of Unicode range
+                # (surrogates are replaced by the decoder).
+                if numpy is not None and width <= 64:
+                    x = to_uint64(data)
+                    raw = numpy.where(
+                        x < 0x110000, x, 0xfffd).astype('<u4').tobytes()
+                else:
+                    raw = struct.pack('<{}I'.format(len(data)), *[
+                        x if x < 0x110000 else 0xfffd for x in data])
+                text = raw.decode('utf-32-le', 'replace')
+            # One character per element, so the strings can be cut
+            # straight from the decoded text.
+            return [text[a:b] for a, b in zip(offsets, ends)]
+        raw = data.raw_data
+        if self.encoding == FieldStringEncoding.utf8:
+            if width != 8:
+                raise ValueError('utf8 string field needs 8-bit elements')
+            return [raw[a:b].decode('utf-8', 'replace')
+                    for a, b in zip(offsets, ends)]
+        if width != 16:
+            raise ValueError('utf16 string field needs 16-bit elements')
+        return [raw[a * 2:b * 2].decode('utf-16-le', 'replace')
+                for a, b in zip(offsets, ends)]
+
 
 class ChunkDataItem(model.PolymorphicModel):
     pass
@@ -94,3 +315,15 @@ class ChunkDataItemComputed(ChunkDataItem):
 class ChunkDataItemPad(ChunkDataItem):
     pos_start = fields.Integer()
     pos_end = fields.Integer()
+
+
+def decode_fields(src, items):
+    """
+    Computes the raw values of many fields over one source BinData.
+    ``items`` is a sequence of objects with ``pos_start``, ``repack``
+    and ``num_elements`` attributes (like ChunkDataItemField).  Returns
+    a list of raw values, in the same order - see ``repack_many``.
+    """
+    return repack_many(src, [
+        (item.repack, item.pos_start, item.num_elements) for item in items
+    ])
@@ -0,0 +1,49 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from veles.data.repack import Repacker
+from veles.schema import model, fields
+from veles.schema.plugin import QuerySignature
+
+from .chunk import FieldType
+
+
+class DecodeBinDataParams(model.Model):
+    key = fields.String()
+    # Index of the first source element (of repack.from_width bits).
+    start = fields.SmallUnsignedInteger(default=0)
+    repack = fields.Object(Repacker)
+    type = fields.Object(FieldType)
+    num_elements = fields.SmallUnsignedInteger()
+    count = fields.SmallUnsignedInteger(default=1)
+    # Distance between records, in source elements.  Defaults to
+    # the repack size of num_elements (ie. records right after each other).
+    stride = fields.SmallUnsignedInteger(optional=True)
+
+
+class DecodeBinDataResult(model.Model):
+    values = fields.List(fields.Any())
+
+
+# Decodes a column of ``count`` fields from a node's binary data: each
+# is ``num_elements`` elements repacked with ``repack`` from ``start +
+# i * stride`` and decoded to ``type`` (see FieldType.decode).  Complex
+# numbers are returned as [real, imaginary] pairs.
+decode_bindata = QuerySignature(
+    'decode_bindata',
+    fields.Object(DecodeBinDataParams),
+    fields.Object(DecodeBinDataResult),
+)
@@ -91,6 +91,11 @@ class WritePastEndError(VelesException):
     msg = "Data written past the end of object"
 
 
+class BinDataChangedError(VelesException):
+    code = 'bindata_changed'
+    msg = "Binary data changed while being read"
+
+
 class SchemaError(VelesException):
     code = 'schema_error'
     msg = "Schema violation"
@@ -12,10 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import struct
+
 import msgpack
 import six
 
 from veles.data.bindata import BinData
+from veles.data.packed import PackedBinData
 from veles.compatibility import pep487
 from veles.schema import nodeid
 from veles.compatibility.int_bytes import int_to_bytes, int_from_bytes
@@ -25,6 +28,21 @@ from veles.util.bigint import bigint_encode, bigint_decode
 EXT_NODE_ID = 0
 EXT_BINDATA = 1
 EXT_BIGINT = 2
+# Payload: 4-octet width, 8-octet element count, then packed raw data.
+EXT_PACKED_BINDATA = 3
+
+
+def pack_bin_header(size):
+    """
+    Returns the msgpack header of a binary string of a given size - it can
+    be written out followed by the data itself, instead of packing
+    the whole string.
+    """
+    if size < 0x100:
+        return struct.pack('>BB', 0xc4, size)
+    if size < 0x10000:
+        return struct.pack('>BH', 0xc5, size)
+    return struct.pack('>BI', 0xc6, size)
 
 
 class MsgpackWrapper(pep487.NewObject):
@@ -40,7 +58,13 @@ class MsgpackWrapper(pep487.NewObject):
             return msgpack.ExtType(EXT_NODE_ID, obj.bytes)
         if isinstance(obj, BinData):
             width = int_to_bytes(obj.width, 4, 'little')
-            return msgpack.ExtType(EXT_BINDATA, width + obj.raw_data)
+            return msgpack.ExtType(
+                EXT_BINDATA, b''.join([width, obj.raw_view]))
+        if isinstance(obj, PackedBinData):
+            header = (int_to_bytes(obj.width, 4, 'little') +
+                      int_to_bytes(len(obj), 8, 'little'))
+            return msgpack.ExtType(
+                EXT_PACKED_BINDATA, b''.join([header, obj.raw_view]))
         if isinstance(obj, six.integer_types):
             return msgpack.ExtType(EXT_BIGINT, bigint_encode(obj))
         raise TypeError('Object of unknown type {}'.format(obj))
@@ -52,6 +76,10 @@ class MsgpackWrapper(pep487.NewObject):
         elif code == EXT_BINDATA:
             width = int_from_bytes(data[:4], 'little')
             return BinData.from_raw_data(width, data[4:])
+        elif code == EXT_PACKED_BINDATA:
+            width = int_from_bytes(data[:4], 'little')
+            size = int_from_bytes(data[4:12], 'little')
+            return PackedBinData.from_raw_data(width, data[12:], size)
         elif code == EXT_BIGINT:
             return bigint_decode(data)
         return msgpack.ExtType(code, data)
@@ -16,6 +16,7 @@ from __future__ import unicode_literals
 
 from veles.schema import model, fields
 from veles.schema.nodeid import NodeID
+from veles.data.transform import Transform
 
 
 class Operation(model.PolymorphicModel):
@@ -87,6 +88,15 @@ class OperationSetBinData(Operation):
     truncate = fields.Boolean(default=False)
 
 
+class OperationTransformBinData(Operation):
+    object_type = 'transform_bindata'
+
+    key = fields.String()
+    start = fields.SmallUnsignedInteger(default=0)
+    end = fields.SmallUnsignedInteger(optional=True)
+    transform = fields.Object(Transform)
+
+
 class OperationAddTrigger(Operation):
     object_type = 'add_trigger'
 
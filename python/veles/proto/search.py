@@ -0,0 +1,68 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+from veles.schema import model, fields
+from veles.schema.plugin import QuerySignature
+
+from .node import Node, PosFilter
+
+
+class FindBinDataParams(model.Model):
+    key = fields.String()
+    pattern = fields.BinData()
+    mask = fields.BinData(optional=True)
+    start = fields.SmallUnsignedInteger(default=0)
+    end = fields.SmallUnsignedInteger(optional=True)
+    max_results = fields.SmallUnsignedInteger(optional=True)
+
+
+class FindBinDataResult(model.Model):
+    offsets = fields.List(fields.SmallUnsignedInteger())
+    # Where to resume the search if it stopped at max_results.
+    next = fields.SmallUnsignedInteger(optional=True)
+
+
+# Searches a node's binary data for a BinData pattern (see
+# BinData.finditer).  The data is interpreted as elements of the pattern's
+# width, counted from ``start``, and the offsets are returned in octets.
+# Results are returned in batches of at most ``max_results`` - to get
+# the following ones, run the query again with ``start`` set to ``next``.
+find_bindata = QuerySignature(
+    'find_bindata',
+    fields.Object(FindBinDataParams),
+    fields.Object(FindBinDataResult),
+)
+
+
+class ListTaggedParams(model.Model):
+    tags = fields.Set(fields.String())
+    pos_filter = fields.Object(PosFilter, default=PosFilter())
+
+
+class ListTaggedResult(model.Model):
+    nodes = fields.List(fields.Object(Node))
+
+
+# Lists all nodes that have the given tags (and match the position
+# filter), regardless of their parents.  The query can be run on any
+# existing node - it doesn't affect the result.  The result is not
+# refreshed when other nodes get the tags - run the query again to pick
+# them up.
+list_tagged = QuerySignature(
+    'list_tagged',
+    fields.Object(ListTaggedParams),
+    fields.Object(ListTaggedResult),
+)
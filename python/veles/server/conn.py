@@ -41,6 +41,7 @@ from veles.async_conn.subscriber import (
 from veles.async_conn.conn import AsyncConnection
 
 from .query import QueryManager
+from . import decode, search
 
 logger = logging.getLogger('veles.server')
 
@@ -86,6 +87,8 @@ class AsyncLocalConnection(AsyncConnection):
         self.query_subs = {}
         self.connections_subs = set()
         super().__init__()
+        self.register_plugin(search)
+        self.register_plugin(decode)
 
     def _connections(self):
         return [
@@ -137,6 +140,13 @@ class AsyncLocalConnection(AsyncConnection):
         except VelesException as e:
             return bad_future(e)
 
+    def get_bindata_pages(self, nid, key, start, end):
+        try:
+            return done_future(
+                self.tracker.get_bindata_pages(nid, key, start, end))
+        except VelesException as e:
+            return bad_future(e)
+
     def get_list(self, parent, tags=frozenset(), pos_filter=PosFilter()):
         try:
             return done_future(self.tracker.get_list(parent, tags, pos_filter))
@@ -0,0 +1,52 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from veles.async_conn.plugin import query
+from veles.data.bindata import BinData
+from veles.data.repack import repack_many
+from veles.proto import decode
+from veles.proto.exceptions import SchemaError
+
+
+def _dump(value):
+    if isinstance(value, complex):
+        return [value.real, value.imag]
+    return value
+
+
+@query(decode.decode_bindata, set())
+async def decode_bindata(conn, nid, params, tracer):
+    repacker = params.repack
+    ope = (repacker.from_width + 7) // 8
+    stride = params.stride
+    if stride is None:
+        stride = repacker.repack_size(params.num_elements)
+    size = repacker.repack_size(params.num_elements)
+    if params.count:
+        size += (params.count - 1) * stride
+    start = params.start * ope
+    raw = await tracer.get_bindata(nid, params.key, start, start + size * ope)
+    try:
+        src = BinData.from_raw_data(repacker.from_width, raw)
+        raw_values = repack_many(src, [
+            (repacker, i * stride, params.num_elements)
+            for i in range(params.count)
+        ])
+        values = params.type.decode_many(raw_values)
+    except ValueError as e:
+        raise SchemaError(str(e))
+    return decode.DecodeBinDataResult(values=[
+        [_dump(x) for x in value] if isinstance(value, list) else value
+        for value in values
+    ])
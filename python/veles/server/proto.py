@@ -287,6 +287,14 @@ class ServerProto(asyncio.Protocol):
         self.client_type = None
         self.quit_on_close = False
         self.cid = None
+        # Flow control - set while the transport's buffer is full, and
+        # a future waiting for it to drain.
+        self.paused = False
+        self.drain_waiter = None
+        # Serializes chunked replies - other messages sent in the meantime
+        # are queued here, so that they don't end up inside one.
+        self.chunks_lock = asyncio.Lock()
+        self.queued = None
 
     def connection_made(self, transport):
         self.transport = transport
@@ -367,7 +375,29 @@ class ServerProto(asyncio.Protocol):
                 err=err,
             ))
 
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self._wake_drain_waiter()
+
+    def _wake_drain_waiter(self):
+        waiter, self.drain_waiter = self.drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def drain(self):
+        """
+        Waits until the transport's buffer drains below its high-water mark
+        (or the connection is lost).
+        """
+        if self.paused and not self.transport.is_closing():
+            self.drain_waiter = asyncio.get_event_loop().create_future()
+            await self.drain_waiter
+
     def connection_lost(self, ex):
+        self._wake_drain_waiter()
         for qid, sub in self.subs.items():
             sub.cancel()
         for handler in self.phids.values():
@@ -387,7 +417,61 @@ class ServerProto(asyncio.Protocol):
             loop.stop()
 
     def send_msg(self, msg):
-        self.transport.write(self.packer.pack(msg.dump()))
+        data = self.packer.pack(msg.dump())
+        if self.queued is not None:
+            self.queued.append(data)
+        else:
+            self.transport.write(data)
+
+    async def send_msg_chunks(self, msg, field, size, chunks):
+        """
+        Like send_msg, but the given Binary field of the message is sent
+        as ``size`` octets of data from an iterable of bytes-like chunks,
+        which are written out one by one instead of being joined first.
+        After each chunk, waits for the transport's buffer to drain, so
+        that only a few chunks are in memory at a time.
+
+        The first chunk is fetched before anything is written, so that
+        errors up to that point propagate with the stream intact.  Once
+        the message has been started, it can't be taken back - if
+        the chunks fail or don't add up to ``size``, the connection is
+        aborted instead of sending a broken message.
+        """
+        data = msg.dump()
+        del data[field]
+        chunks = iter(chunks)
+        async with self.chunks_lock:
+            chunk = next(chunks, None)
+            self.queued = []
+            done = False
+            try:
+                self.transport.write(
+                    self.packer.pack_map_header(len(data) + 1))
+                for k, v in data.items():
+                    self.transport.write(self.packer.pack(k))
+                    self.transport.write(self.packer.pack(v))
+                self.transport.write(self.packer.pack(field))
+                self.transport.write(msgpackwrap.pack_bin_header(size))
+                left = size
+                while chunk is not None and len(chunk) <= left:
+                    self.transport.write(chunk)
+                    left -= len(chunk)
+                    await self.drain()
+                    if self.transport.is_closing():
+                        return
+                    chunk = next(chunks, None)
+                if chunk is not None or left:
+                    logger.error('Chunks of a %s message don\'t match its '
+                                 'size.', msg.object_type)
+                else:
+                    done = True
+            finally:
+                queued, self.queued = self.queued, None
+                if done:
+                    for data in queued:
+                        self.transport.write(data)
+                else:
+                    self.transport.abort()
 
     async def do_request(self, msg, req):
         try:
@@ -538,18 +622,20 @@ class ServerProto(asyncio.Protocol):
             raise SubscriptionInUseError()
         if not msg.sub:
             try:
-                data = await self.conn.get_bindata(
+                size, pages = await self.conn.get_bindata_pages(
                     msg.id, msg.key, msg.start, msg.end)
-            except VelesException as err:
-                self.send_msg(messages.MsgQueryError(
+                await self.send_msg_chunks(messages.MsgGetBinDataReply(
                     qid=msg.qid,
-                    err=err,
-                ))
-            else:
-                self.send_msg(messages.MsgGetBinDataReply(
-                    qid=msg.qid,
-                    data=data
-                ))
+                    data=b''
+                ), 'data', size, pages)
+            except VelesException as err:
+                # If the reply was already started, the connection has
+                # been aborted instead.
+                if not self.transport.is_closing():
+                    self.send_msg(messages.MsgQueryError(
+                        qid=msg.qid,
+                        err=err,
+                    ))
         else:
             self.subs[msg.qid] = SubscriberBinData(
                 self.conn, msg.id, msg.key, msg.start, msg.end, self, msg.qid)
@@ -79,6 +79,28 @@ class CheckSubscriberBinData(BaseSubscriberBinData):
         self.manager.invalidate()
 
 
+class CheckSubscriberBinDataHash(BaseSubscriberBinData):
+    # Any write to the range is enough to rerun the query - that's cheaper
+    # than reading and hashing the whole range to see if it changed.
+    needs_data = False
+
+    def __init__(self, tracker, check, manager):
+        self.manager = manager
+        # The first call comes from the registration - the check has just
+        # been verified by the query.
+        self.armed = False
+        super().__init__(
+            tracker, check.node, check.key, check.start, check.end)
+        self.armed = True
+
+    def bindata_changed(self, data):
+        if self.armed:
+            self.manager.invalidate()
+
+    def error(self, err):
+        self.manager.invalidate()
+
+
 class CheckSubscriberList(BaseSubscriberList):
     def __init__(self, tracker, check, manager):
         self.check = check
@@ -151,6 +173,9 @@ class QueryManager:
             elif isinstance(ch, check.CheckBinData):
                 sub = CheckSubscriberBinData(self.conn, ch, self)
                 self.check_subs.add(sub)
+            elif isinstance(ch, check.CheckBinDataHash):
+                sub = CheckSubscriberBinDataHash(self.conn, ch, self)
+                self.check_subs.add(sub)
             elif isinstance(ch, check.CheckList):
                 sub = CheckSubscriberList(self.conn, ch, self)
                 self.check_subs.add(sub)
@@ -0,0 +1,74 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+
+from veles.async_conn.plugin import query
+from veles.data.search import SearchPattern
+from veles.proto import check, search
+from veles.proto.exceptions import SchemaError
+
+
+@query(search.find_bindata, set())
+async def find_bindata(conn, nid, params, tracer):
+    pattern = params.pattern
+    mask = params.mask
+    if mask is not None:
+        if mask.width != pattern.width:
+            raise SchemaError('search mask has mismatched width')
+        mask = mask.raw_view
+    try:
+        pattern = SearchPattern(
+            pattern.octets_per_element(), pattern.raw_view, mask)
+    except ValueError as e:
+        raise SchemaError(str(e))
+    # The range is searched a page at a time, and only up to the match
+    # after the last one returned - a search resumed from ``next`` doesn't
+    # read anything before it.
+    _, pages = conn.tracker.get_bindata_pages(
+        nid, params.key, params.start, params.end)
+    digest = hashlib.sha256()
+    scanned = params.start
+
+    def scan():
+        nonlocal scanned
+        for page in pages:
+            digest.update(page)
+            scanned += len(page)
+            yield page
+
+    result = search.FindBinDataResult(offsets=[])
+    end = params.end
+    for pos in pattern.search(scan()):
+        if len(result.offsets) == params.max_results:
+            result.next = params.start + pos
+            end = scanned
+            break
+        result.offsets.append(params.start + pos)
+    # The result depends on the contents of the searched part, which is
+    # checked by its hash (the data itself could be huge).
+    tracer.checks.append(check.CheckBinDataHash(
+        node=nid,
+        key=params.key,
+        start=params.start,
+        end=end,
+        hash=digest.digest(),
+    ))
+    return result
+
+
+@query(search.list_tagged, set())
+async def list_tagged(conn, nid, params, tracer):
+    return search.ListTaggedResult(
+        nodes=conn.tracker.get_tagged(params.tags, params.pos_filter))
@@ -0,0 +1,127 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks for BinData construction and validation, comparing the bulk
+code paths with the element-by-element implementation they replaced,
+and for splicing BinData and RopeBinData.
+Not collected by the test runner - run it with::
+
+    python -m veles.tests.data.bench_bindata [--size N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import array
+import operator
+import timeit
+
+from six.moves import range
+
+from veles.compatibility.int_bytes import int_to_bytes
+from veles.data.bindata import BinData
+from veles.data.rope import RopeBinData
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def old_init(width, data):
+    """
+    The original ``BinData.__init__`` packing loop.
+    """
+    ope = (width + 7) // 8
+    res = bytearray()
+    for x in data:
+        x = operator.index(x)
+        if x >= (1 << width) or x < 0:
+            raise ValueError('BinData element out of range for width')
+        res += int_to_bytes(x, ope, 'little')
+    return res
+
+
+def old_check_unused_bits(width, data):
+    """
+    The original unused bits check from ``BinData.from_raw_data``.
+    """
+    ope = (width + 7) // 8
+    to_check = data[ope-1::ope]
+    correct = range(1 << (width % 8))
+    if not all(x in correct for x in to_check):
+        raise ValueError('raw data with non-zero unused bits')
+
+
+def bench(name, func, number):
+    best = min(timeit.repeat(func, number=1, repeat=number))
+    print('{:<40} {:10.4f} s'.format(name, best))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000000,
+                        help='number of elements')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs (best one is reported)')
+    args = parser.parse_args()
+
+    width = 12
+    elements = [x * 0x9e3779b1 % (1 << width) for x in range(args.size)]
+    arr = array.array('H', elements)
+    raw = BinData(width, elements).raw_data
+    print('{} elements, {}-bit'.format(args.size, width))
+
+    old = bench('old __init__ (list)',
+                lambda: old_init(width, elements), args.repeat)
+    bench('__init__ (list)',
+          lambda: BinData(width, elements), args.repeat)
+    bench('__init__ (array.array)',
+          lambda: BinData(width, arr), args.repeat)
+    if numpy is not None:
+        nparr = numpy.array(elements, dtype=numpy.uint16)
+        new = bench('__init__ (numpy)',
+                    lambda: BinData(width, nparr), args.repeat)
+        bench('from_numpy (zero-copy)',
+              lambda: BinData.from_numpy(width, nparr), args.repeat)
+        print('speedup: {:.0f}x'.format(old / new))
+
+    old = bench('old from_raw_data check',
+                lambda: old_check_unused_bits(width, bytearray(raw)),
+                args.repeat)
+    new = bench('from_raw_data',
+                lambda: BinData.from_raw_data(width, raw), args.repeat)
+    print('speedup: {:.0f}x'.format(old / new))
+
+    def splice(data, count):
+        patch = BinData(width, [1, 2, 3])
+        for i in range(count):
+            pos = i * 7919 % len(data)
+            data[pos:pos + 2] = patch
+
+    count = 100
+    print('{} splices'.format(count))
+    old = bench('BinData',
+                lambda: splice(BinData.from_raw_data(width, raw), count),
+                args.repeat)
+    new = bench('RopeBinData',
+                lambda: splice(RopeBinData.from_raw_data(width, raw), count),
+                args.repeat)
+    print('speedup: {:.0f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
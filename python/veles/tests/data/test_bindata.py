@@ -12,9 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from veles.data import search
 from veles.data.bindata import BinData
+from veles.data.repack import Endian, Repacker
 
 
 class TestBinData(unittest.TestCase):
@@ -170,6 +182,42 @@ class TestBinData(unittest.TestCase):
         with self.assertRaises(ValueError):
             BinData(8, [-1])
 
+    def test_init_bulk(self):
+        data = [x * 0x10101 % 0x1000 for x in range(1000)]
+        ref = bytearray()
+        for x in data:
+            ref += bytearray([x & 0xff, x >> 8])
+        self.assertEqual(BinData(12, data).raw_data, bytes(ref))
+        self.assertEqual(BinData(12, iter(data)).raw_data, bytes(ref))
+        self.assertEqual(BinData(12, array.array('H', data)).raw_data,
+                         bytes(ref))
+        self.assertEqual(BinData(12, array.array('l', data)).raw_data,
+                         bytes(ref))
+        self.assertEqual(list(BinData(8, array.array('H', [1, 2, 0xff]))),
+                         [1, 2, 0xff])
+        self.assertEqual(list(BinData(4, array.array('i', [1, 2]))), [1, 2])
+        self.assertEqual(list(BinData(8, array.array('b', [1, 2]))), [1, 2])
+        a = BinData(19, (x * 0x123 for x in range(100)))
+        self.assertEqual(list(a), [x * 0x123 for x in range(100)])
+        self.assertEqual(a.raw_data[3:6], b'\x23\x01\x00')
+        b = BinData(40, [0x123456789a, 1])
+        self.assertEqual(b.raw_data, b'\x9a\x78\x56\x34\x12\x01\0\0\0\0')
+        c = BinData(72, [0x112233445566778899, 1])
+        self.assertEqual(list(c), [0x112233445566778899, 1])
+        self.assertEqual(BinData(64, [(1 << 64) - 1])[0], (1 << 64) - 1)
+        with self.assertRaises(ValueError):
+            BinData(12, array.array('H', [0x1000]))
+        with self.assertRaises(ValueError):
+            BinData(12, array.array('h', [-1]))
+        with self.assertRaises(ValueError):
+            BinData(8, array.array('H', [0x100]))
+        with self.assertRaises(ValueError):
+            BinData(64, [1 << 64])
+        with self.assertRaises(ValueError):
+            BinData(40, [0, -1])
+        with self.assertRaises(TypeError):
+            BinData(12, array.array('d', [1.0]))
+
     def test_from_raw_8(self):
         a = BinData.from_raw_data(8, b'\x01\x02\x03\x05\x08')
         self.assertEqual(a.width, 8)
@@ -373,3 +421,303 @@ class TestBinData(unittest.TestCase):
             a + 'zlew'
         with self.assertRaises(TypeError):
             'zlew' + a
+
+    def test_raw_view(self):
+        a = BinData(12, [0x123, 0x456])
+        v = a.raw_view
+        self.assertIsInstance(v, memoryview)
+        self.assertEqual(v, b'\x23\x01\x56\x04')
+        if sys.version_info >= (3, 8):
+            self.assertTrue(v.readonly)
+            with self.assertRaises(TypeError):
+                v[0] = 0
+        a[0] = 0x321
+        self.assertEqual(v, b'\x21\x03\x56\x04')
+        self.assertEqual(hash(a), hash(BinData(12, [0x321, 0x456])))
+
+    def test_buffer(self):
+        a = BinData(16, [0x1234, 0x5678])
+        self.assertEqual(bytes(a.__buffer__(0)), b'\x34\x12\x78\x56')
+        w = a.__buffer__(1)
+        self.assertFalse(w.readonly)
+        w[0] = 0x35
+        self.assertEqual(a[0], 0x1235)
+        if sys.version_info >= (3, 12):
+            self.assertEqual(bytes(memoryview(a)), b'\x35\x12\x78\x56')
+            self.assertEqual(bytes(a), b'\x35\x12\x78\x56')
+
+    def test_slice_view(self):
+        a = BinData(16, range(10))
+        b = a[2:5]
+        self.assertEqual(b, BinData(16, [2, 3, 4]))
+        raw = a._raw_data
+        # Writing to the owner doesn't leak into the view...
+        a[2] = 0x1234
+        self.assertEqual(b, BinData(16, [2, 3, 4]))
+        self.assertEqual(a[2], 0x1234)
+        # ...and vice versa.
+        c = a[5:]
+        c[0] = 0x4321
+        self.assertEqual(a[5], 5)
+        self.assertEqual(c[:2], BinData(16, [0x4321, 6]))
+        c[1:1] = BinData(16, [7, 7])
+        self.assertEqual(a[6], 6)
+        self.assertEqual(len(c), 7)
+        del b, c
+        # No copies once views are gone.
+        raw = a._raw_data
+        a[0] = 1
+        self.assertIs(a._raw_data, raw)
+        # Views of views share the top owner.
+        d = a[1:]
+        e = d[1:]
+        self.assertIs(e._owner, a)
+        a[2] = 0
+        self.assertEqual(e[0], 0x1234)
+        self.assertEqual(a[1:0], BinData(16))
+        self.assertEqual(a[1:0]._owner, a)
+        # Equal views are tracked separately.
+        f = a[3:4]
+        g = a[3:4]
+        del f
+        a[3] = 7
+        self.assertEqual(g[0], 3)
+
+    def test_slice_strided(self):
+        a = BinData(8, range(10))
+        b = a[1::3]
+        self.assertEqual(b, BinData(8, [1, 4, 7]))
+        self.assertEqual(hash(b), hash(BinData(8, [1, 4, 7])))
+        self.assertEqual(b.raw_data, b'\x01\x04\x07')
+        self.assertEqual(b[::-1], BinData(8, [7, 4, 1]))
+        self.assertEqual(b + a[:1], BinData(8, [1, 4, 7, 0]))
+        a[0:1] = b
+        self.assertEqual(a[:3], BinData(8, [1, 4, 7]))
+        b[1] = 0x55
+        self.assertEqual(b, BinData(8, [1, 0x55, 7]))
+        self.assertEqual(a[:3], BinData(8, [1, 4, 7]))
+        c = BinData(24, range(10))
+        self.assertEqual(c[8:1:-3], BinData(24, [8, 5, 2]))
+        self.assertEqual(c[::-4], BinData(24, [9, 5, 1]))
+        self.assertEqual(c[::4], BinData(24, [0, 4, 8]))
+        c[::-4] = BinData(24, [0x123456, 0x654321, 0xabcdef])
+        self.assertEqual(c[1], 0xabcdef)
+        self.assertEqual(c[5], 0x654321)
+        self.assertEqual(c[9], 0x123456)
+        self.assertEqual(c[0], 0)
+        # Splicing strided views, including single-element ones.
+        a = BinData(8, range(20))
+        d = a[::2]
+        d[1:1] = BinData(8, [0x63])
+        self.assertEqual(d, BinData(8, [0, 0x63] + list(range(2, 20, 2))))
+        e = a[::9][:1]
+        e[:] = BinData(8, [1, 2])
+        self.assertEqual(e, BinData(8, [1, 2]))
+        self.assertEqual(a[:3], BinData(8, [0, 1, 2]))
+        f = a[::9][:1]
+        self.assertEqual(f + a[1:2], BinData(8, [0, 1]))
+        del d, e, f
+
+    def test_find(self):
+        a = BinData(12, [1, 2, 3, 0x102, 0x203, 1, 2, 3, 1, 2])
+        self.assertEqual(a.find([1, 2]), 0)
+        self.assertEqual(a.find([1, 2], 1), 5)
+        self.assertEqual(a.find([1, 2], 1, 6), -1)
+        self.assertEqual(a.find([1, 2], -2), 8)
+        # 0x102, 0x203 has 0x01, 0x02 at an odd raw data offset.
+        self.assertEqual(a.find([0x201]), -1)
+        self.assertEqual(list(a.finditer(BinData(12, [1, 2]))), [0, 5, 8])
+        self.assertEqual(list(a.finditer([2], mask=[0xff])), [1, 3, 6, 9])
+        self.assertEqual(list(a.finditer([1, 0, 3], mask=[0xfff, 0, 0xfff])),
+                         [0, 5])
+        self.assertEqual(list(a.finditer([0, 0], mask=[0, 0])),
+                         [0, 2, 4, 6, 8])
+        b = BinData(8, b'aaaa')
+        self.assertEqual(list(b.finditer(b'aa')), [0, 2])
+        # Matches must not run past the end of the data.
+        c = BinData(8, [2, 9])
+        self.assertEqual(c.find([2, 0, 0, 0], mask=[0xff, 0, 0, 0]), -1)
+        self.assertEqual(c.find([9, 0], mask=[0xff, 0]), -1)
+        self.assertEqual(c.find([2, 9, 0]), -1)
+        with self.assertRaises(ValueError):
+            a.find([])
+        with self.assertRaises(ValueError):
+            a.find(BinData(8, [1]))
+        with self.assertRaises(ValueError):
+            a.find([1], mask=[1, 2])
+
+    def test_find_chunks(self):
+        old_chunk = search.SEARCH_CHUNK
+        search.SEARCH_CHUNK = 5
+        try:
+            a = BinData(16, [x % 7 for x in range(100)])
+            self.assertEqual(list(a.finditer([5, 6, 0])),
+                             list(range(5, 98, 7)))
+            mask = [0xffff, 0, 0xffff]
+            self.assertEqual(list(a.finditer([5, 0, 0], mask=mask)),
+                             list(range(5, 98, 7)))
+            # Patterns longer than the chunks.
+            pattern = [5, 6, 0, 1, 2, 3, 4]
+            self.assertEqual(list(a.finditer(pattern)),
+                             list(range(5, 93, 7)))
+        finally:
+            search.SEARCH_CHUNK = old_chunk
+
+    def test_from_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'data.bin')
+            contents = bytes(bytearray(x * 7 & 0xff for x in range(0x12345)))
+            with open(path, 'wb') as f:
+                f.write(contents)
+            a = BinData.from_file(8, path)
+            self.assertEqual(len(a), 0x12345)
+            self.assertEqual(a.raw_data, contents)
+            b = BinData.from_file(16, path, offset=0x10001, length=0x100)
+            self.assertEqual(b, BinData.from_raw_data(
+                16, contents[0x10001:0x10201]))
+            self.assertEqual(b[1:3], BinData.from_raw_data(
+                16, contents[0x10003:0x10007]))
+            r = Repacker(Endian.BIG, 8, 12)
+            self.assertEqual(r.repack(a, 0x11111, 4), r.repack(
+                BinData.from_raw_data(8, contents[0x11111:0x11117])))
+            v = b[2:4]
+            b[0] = 0x1234
+            self.assertEqual(b[0], 0x1234)
+            self.assertEqual(v, BinData.from_raw_data(
+                16, contents[0x10005:0x10009]))
+            b[1:2] = BinData(16, [1, 2])
+            self.assertEqual(b[:3], BinData(16, [0x1234, 1, 2]))
+            self.assertEqual(len(b), 0x101)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), contents)
+            self.assertEqual(BinData.from_file(8, path, 0x12345), BinData(8))
+            self.assertEqual(
+                BinData.from_file(24, path, 0x12345 - 0x30).octets(), 0x30)
+            with self.assertRaises(ValueError):
+                BinData.from_file(16, path)
+            with self.assertRaises(ValueError):
+                BinData.from_file(8, path, 0x12346)
+            with self.assertRaises(ValueError):
+                BinData.from_file(8, path, 0x12340, 6)
+            with self.assertRaises(ValueError):
+                BinData.from_file(7, path)
+            with self.assertRaises(ValueError):
+                BinData.from_file(8, path, -1)
+            del a, b
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+@unittest.skipIf(numpy is None, 'NumPy not available')
+class TestBinDataNumpy(unittest.TestCase):
+    def test_to_numpy(self):
+        a = BinData(12, [0x123, 0x456, 0x789])
+        b = a.to_numpy()
+        self.assertEqual(b.dtype, numpy.dtype('<u2'))
+        self.assertEqual(list(b), [0x123, 0x456, 0x789])
+        self.assertFalse(b.flags.writeable)
+        with self.assertRaises(ValueError):
+            b[0] = 0x321
+        c = a.to_numpy(writable=True)
+        c[0] = 0x321
+        self.assertEqual(a[0], 0x321)
+        self.assertEqual(b[0], 0x321)
+        a[1] = 0x654
+        self.assertEqual(c[1], 0x654)
+        self.assertEqual(list(numpy.asarray(a)), [0x321, 0x654, 0x789])
+        for width, dtype in [(1, '<u1'), (8, '<u1'), (16, '<u2'),
+                             (32, '<u4'), (57, '<u8'), (64, '<u8')]:
+            self.assertEqual(BinData(width, 3).to_numpy().dtype,
+                             numpy.dtype(dtype))
+
+    def test_init(self):
+        arr = numpy.array([1, 2, 0x3ff], dtype='<u2')
+        a = BinData(10, arr)
+        self.assertEqual(a, BinData(10, [1, 2, 0x3ff]))
+        arr[0] = 5
+        self.assertEqual(a[0], 1)
+        b = BinData(19, numpy.arange(1000, dtype='i4') * 0x123)
+        self.assertEqual(list(b), [x * 0x123 for x in range(1000)])
+        with self.assertRaises(ValueError):
+            BinData(10, numpy.array([0x400]))
+        with self.assertRaises(ValueError):
+            BinData(10, numpy.array([-1]))
+
+    def test_to_numpy_odd(self):
+        a = BinData(19, [0x12345, 0x6789a])
+        b = a.to_numpy()
+        self.assertEqual(b.dtype.names, ('octets',))
+        self.assertEqual(b.shape, (2,))
+        self.assertEqual(b['octets'].tolist(),
+                         [[0x45, 0x23, 0x01], [0x9a, 0x78, 0x06]])
+        self.assertEqual(BinData.from_numpy(19, b), a)
+
+    def test_from_numpy_odd(self):
+        a = BinData.from_numpy(19, numpy.array([0x12345, 1], dtype='u4'))
+        self.assertEqual(a, BinData(19, [0x12345, 1]))
+        self.assertEqual(a.raw_data, b'\x45\x23\x01\x01\x00\x00')
+        b = BinData.from_numpy(40, numpy.array([0x123456789a], dtype='i8'))
+        self.assertEqual(b, BinData(40, [0x123456789a]))
+        c = BinData.from_numpy(72, numpy.array([(1 << 64) - 1, 1],
+                                               dtype='u8'))
+        self.assertEqual(c, BinData(72, [(1 << 64) - 1, 1]))
+        d = BinData.from_numpy(24, numpy.arange(10, dtype='u2')[::3])
+        self.assertEqual(d, BinData(24, [0, 3, 6, 9]))
+        self.assertEqual(len(BinData.from_numpy(24, numpy.array([], 'u1'))),
+                         0)
+        with self.assertRaises(ValueError):
+            BinData.from_numpy(19, numpy.array([1 << 19], dtype='u4'))
+        with self.assertRaises(ValueError):
+            BinData.from_numpy(72, numpy.array([-1], dtype='i8'))
+
+    def test_from_numpy(self):
+        arr = numpy.array([1, 2, 0x3ff], dtype='<u2')
+        a = BinData.from_numpy(10, arr)
+        self.assertEqual(a, BinData(10, [1, 2, 0x3ff]))
+        arr[0] = 5
+        self.assertEqual(a[0], 5)
+        a[1] = 6
+        self.assertEqual(arr[1], 6)
+        a[1:2] = BinData(10, [7, 8])
+        self.assertEqual(a, BinData(10, [5, 7, 8, 0x3ff]))
+        self.assertEqual(list(arr), [5, 6, 0x3ff])
+        b = BinData.from_numpy(10, numpy.array([1, 2, 3], dtype='>u4'))
+        self.assertEqual(b, BinData(10, [1, 2, 3]))
+        c = BinData.from_numpy(8, numpy.array([1, 2, 3], dtype='i8'))
+        self.assertEqual(c, BinData(8, [1, 2, 3]))
+        d = BinData.from_numpy(16, numpy.arange(10, dtype='<u2')[::3])
+        self.assertEqual(d, BinData(16, [0, 3, 6, 9]))
+        ro = numpy.array([1, 2], dtype='u1')
+        ro.flags.writeable = False
+        e = BinData.from_numpy(8, ro)
+        e[0] = 3
+        self.assertEqual(e, BinData(8, [3, 2]))
+        self.assertEqual(list(ro), [1, 2])
+        # Slices of memory shared with an array are copies.
+        arr = numpy.array([1, 2, 3], dtype='u1')
+        h = BinData.from_numpy(8, arr)
+        i = h[:]
+        j = h[::2]
+        arr[0] = 9
+        self.assertEqual(h[0], 9)
+        self.assertEqual(i, BinData(8, [1, 2, 3]))
+        self.assertEqual(j, BinData(8, [1, 3]))
+        k = BinData(8, [1, 2, 3])
+        w = k.to_numpy(writable=True)
+        m = k[1:]
+        w[1] = 7
+        self.assertEqual(k[1], 7)
+        self.assertEqual(m, BinData(8, [2, 3]))
+        with self.assertRaises(ValueError):
+            BinData.from_numpy(10, numpy.array([0x400], dtype='<u2'))
+        with self.assertRaises(ValueError):
+            BinData.from_numpy(10, numpy.array([-1], dtype='<i2'))
+        with self.assertRaises(ValueError):
+            BinData.from_numpy(8, numpy.zeros((2, 2), dtype='u1'))
+        with self.assertRaises(TypeError):
+            BinData.from_numpy(8, numpy.array([1.0]))
+        with self.assertRaises(ValueError):
+            BinData.from_numpy(
+                19, numpy.array([((0, 0, 8),)],
+                                dtype=BinData(19).to_numpy().dtype))
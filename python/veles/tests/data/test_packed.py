@@ -0,0 +1,120 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from veles.data.bindata import BinData
+from veles.data.packed import PackedBinData
+from veles.data.repack import Endian, Repacker
+
+
+class TestPackedBinData(unittest.TestCase):
+    def test_simple(self):
+        a = PackedBinData(3, [1, 2, 3, 4, 5])
+        self.assertEqual(a.width, 3)
+        self.assertEqual(len(a), 5)
+        self.assertEqual(a.octets(), 2)
+        self.assertEqual(a.raw_data, b'\xd1\x58')
+        self.assertEqual(list(a), [1, 2, 3, 4, 5])
+        self.assertEqual(a[0], 1)
+        self.assertEqual(a[2], 3)
+        self.assertEqual(a[-1], 5)
+        self.assertEqual(str(a), '1 2 3 4 5')
+        self.assertEqual(repr(a),
+                         'PackedBinData.from_spaced_hex(3, \'1 2 3 4 5\')')
+        self.assertEqual(a.to_bindata(), BinData(3, [1, 2, 3, 4, 5]))
+        self.assertEqual(a, PackedBinData.from_bindata(a.to_bindata()))
+        self.assertEqual(hash(a), hash(PackedBinData(3, [1, 2, 3, 4, 5])))
+        self.assertNotEqual(a, PackedBinData(3, [1, 2, 3, 4]))
+        self.assertNotEqual(a, a.to_bindata())
+        self.assertEqual(PackedBinData(5, 3).raw_data, b'\0\0')
+        self.assertEqual(list(PackedBinData(5, 3)), [0, 0, 0])
+
+    def test_repack_layout(self):
+        for width in range(1, 8):
+            data = [(x * 0x9e3779b1 >> 7) % (1 << width) for x in range(77)]
+            a = PackedBinData(width, data)
+            r = Repacker(Endian.LITTLE, 8, width)
+            raw = BinData.from_raw_data(8, a.raw_data)
+            self.assertEqual(r.repack(raw, 0, len(data)), BinData(width, data))
+            self.assertEqual(list(a), data)
+            self.assertEqual([a[i] for i in range(len(data))], data)
+            self.assertEqual(a.octets(), (77 * width + 7) // 8)
+
+    def test_chunks(self):
+        data = BinData(3, [x % 7 for x in range(3 * 0x80000 + 5)])
+        a = PackedBinData.from_bindata(data)
+        self.assertEqual(len(a), len(data))
+        self.assertEqual(a.to_bindata(), data)
+        self.assertEqual(a[0x80000 - 1:0x80000 + 3].to_bindata(),
+                         data[0x80000 - 1:0x80000 + 3])
+
+    def test_setitem(self):
+        data = [x % 32 for x in range(50)]
+        a = PackedBinData(5, data)
+        for i in range(50):
+            a[i] = 31 - data[i]
+            data[i] = 31 - data[i]
+            self.assertEqual(list(a), data)
+        a[-1] = 7
+        self.assertEqual(a[49], 7)
+        with self.assertRaises(ValueError):
+            a[0] = 32
+        with self.assertRaises(ValueError):
+            a[0] = -1
+        with self.assertRaises(IndexError):
+            a[50] = 1
+        with self.assertRaises(IndexError):
+            a[-51]
+        with self.assertRaises(TypeError):
+            a['zlew']
+
+    def test_slices(self):
+        data = [x % 4 for x in range(20)]
+        a = PackedBinData(2, data)
+        for start in range(-22, 22, 3):
+            for stop in range(-22, 22, 5):
+                for stride in (1, 2, 3, -1, -4):
+                    self.assertEqual(list(a[start:stop:stride]),
+                                     data[start:stop:stride])
+        a[2:5] = PackedBinData(2, [3])
+        del data[3:5]
+        data[2] = 3
+        self.assertEqual(list(a), data)
+        a[::-2] = BinData(2, [1] * 9)
+        data[::-2] = [1] * 9
+        self.assertEqual(list(a), data)
+        with self.assertRaises(TypeError):
+            a[:] = [1, 2]
+        with self.assertRaises(ValueError):
+            a[:] = BinData(3, [1])
+        self.assertEqual(list(a + PackedBinData(2, [1, 2])), data + [1, 2])
+
+    def test_from_raw_data(self):
+        a = PackedBinData.from_raw_data(1, b'\x05', 3)
+        self.assertEqual(list(a), [1, 0, 1])
+        with self.assertRaises(ValueError):
+            PackedBinData.from_raw_data(1, b'\x09', 3)
+        with self.assertRaises(ValueError):
+            PackedBinData.from_raw_data(1, b'\x01\x00', 3)
+        with self.assertRaises(ValueError):
+            PackedBinData(8)
+        with self.assertRaises(ValueError):
+            PackedBinData(0)
+        with self.assertRaises(ValueError):
+            PackedBinData(1, [2])
+        with self.assertRaises(ValueError):
+            PackedBinData(2, BinData(3, []))
+        with self.assertRaises(TypeError):
+            PackedBinData.from_bindata([1, 2])
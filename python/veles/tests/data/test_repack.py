@@ -15,6 +15,7 @@
 import unittest
 
 from veles.data.bindata import BinData
+from veles.data import repack
 from veles.data.repack import Endian, Repacker
 
 
@@ -223,3 +224,99 @@ class TestRepacker(unittest.TestCase):
         a = BinData.from_spaced_hex(8, '11 22 33 44 55 66 77 88 99 aa')
         b = r.repack(a, 1, 2)
         self.assertEqual(b, BinData.from_spaced_hex(23, '223344 667788'))
+
+    def test_plan_cache(self):
+        r1 = Repacker(Endian.BIG, 8, 23, low_pad=9)
+        r2 = Repacker(Endian.BIG, 8, 23, low_pad=9)
+        self.assertIs(r1._plan, r2._plan)
+        self.assertIsNot(r1._plan, Repacker(Endian.BIG, 8, 23)._plan)
+
+    def test_view(self):
+        a = BinData(8, [1, 2, 3, 4, 5, 6, 7, 8, 9])
+        r = Repacker(Endian.LITTLE, 8, 32)
+        self.assertTrue(r._plan.view)
+        b = r.repack(a, 1)
+        self.assertEqual(b, BinData(32, [0x05040302, 0x09080706]))
+        a[1] = 0xff
+        b[1] = 0
+        self.assertEqual(b, BinData(32, [0x05040302, 0]))
+        self.assertEqual(a[6], 7)
+        self.assertFalse(Repacker(Endian.BIG, 8, 32)._plan.view)
+        self.assertFalse(Repacker(Endian.LITTLE, 8, 24, low_pad=8)._plan.view)
+
+    def test_paths(self):
+        # Compare the generic executors with the octet column one.
+        for endian in Endian:
+            for fw, tw, hp, lp in [
+                    (8, 32, 0, 0), (16, 24, 8, 0), (24, 16, 0, 16),
+                    (64, 8, 0, 0)]:
+                r = Repacker(endian, fw, tw, high_pad=hp, low_pad=lp)
+                a = BinData(fw, [
+                    x * 0x9e3779b97f4a7c15 % (1 << fw)
+                    for x in range(50)
+                ])
+                expected = r.repack(a, 3)
+                num = len(expected)
+                rs = r.repack_size(num)
+                units = -(-rs // r._plan.spu)
+                self.assertEqual(r._repack_ints(a, 3, num, units),
+                                 expected)
+                if repack.numpy is not None:
+                    self.assertEqual(
+                        r._repack_numpy(a, 3, num, rs, units), expected)
+
+    def test_repack_iter(self):
+        for endian in Endian:
+            for fw, tw, hp in [(8, 12, 0), (12, 8, 0), (8, 32, 0),
+                               (24, 7, 2), (5, 64, 1)]:
+                r = Repacker(endian, fw, tw, high_pad=hp)
+                a = BinData(fw, [
+                    x * 0x9e3779b97f4a7c15 % (1 << fw) for x in range(200)
+                ])
+                expected = r.repack(a)
+                for step in [1, 7, 13, 64, 500]:
+                    chunks = [a[i:i + step] for i in range(0, len(a), step)]
+                    res = list(r.repack_iter(chunks))
+                    self.assertTrue(all(len(x) for x in res))
+                    self.assertEqual(
+                        BinData(tw, [x for b in res for x in b]), expected)
+                    raw = a.raw_data
+                    chunks = [raw[i:i + step]
+                              for i in range(0, len(raw), step)]
+                    res = list(r.repack_iter(chunks))
+                    self.assertEqual(
+                        BinData(tw, [x for b in res for x in b]), expected)
+        r = Repacker(Endian.LITTLE, 16, 8)
+        self.assertEqual(list(r.repack_iter([])), [])
+        with self.assertRaises(ValueError):
+            list(r.repack_iter([BinData(8, [1])]))
+        with self.assertRaises(ValueError):
+            list(r.repack_iter([b'abc']))
+        with self.assertRaises(ValueError):
+            list(r.repack_iter([b'abc', BinData(16, [1])]))
+
+    def test_repack_many(self):
+        a = BinData(8, [x * 0x9e3779b1 % 256 for x in range(300)])
+        repackers = [
+            Repacker(Endian.LITTLE, 8, 8),
+            Repacker(Endian.BIG, 8, 16),
+            Repacker(Endian.LITTLE, 8, 12),
+            Repacker(Endian.BIG, 8, 23, high_pad=1),
+            Repacker(Endian.LITTLE, 8, 1),
+        ]
+        items = [
+            (repackers[i % len(repackers)], i * 7 % 250, i % 4)
+            for i in range(100)
+        ]
+        items.append((repackers[2], 10, None))
+        res = repack.repack_many(a, items)
+        self.assertEqual(len(res), len(items))
+        for (r, start, num), val in zip(items, res):
+            self.assertEqual(val, r.repack(a, start, num))
+        self.assertEqual(repack.repack_many(a, []), [])
+        with self.assertRaises(ValueError):
+            repack.repack_many(a, [(repackers[1], 299, 1)])
+        with self.assertRaises(ValueError):
+            repack.repack_many(a, [(Repacker(Endian.LITTLE, 16, 8), 0, 1)])
+        with self.assertRaises(TypeError):
+            repack.repack_many([1, 2, 3], items)
@@ -0,0 +1,150 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import unittest
+
+from veles.data import rope
+from veles.data.bindata import BinData
+from veles.data.rope import RopeBinData
+
+
+class TestRopeBinData(unittest.TestCase):
+    def test_simple(self):
+        a = RopeBinData(12, [1, 2, 0x345, 4])
+        self.assertEqual(a.width, 12)
+        self.assertEqual(len(a), 4)
+        self.assertEqual(a.octets_per_element(), 2)
+        self.assertEqual(a.octets(), 8)
+        self.assertEqual(list(a), [1, 2, 0x345, 4])
+        self.assertEqual(a[2], 0x345)
+        self.assertEqual(a[-1], 4)
+        self.assertEqual(a.raw_data, b'\x01\x00\x02\x00\x45\x03\x04\x00')
+        self.assertEqual(bytes(a.raw_view), a.raw_data)
+        self.assertEqual(str(a), '001 002 345 004')
+        self.assertEqual(repr(a),
+                         'RopeBinData.from_spaced_hex(12, '
+                         '\'001 002 345 004\')')
+        self.assertEqual(a.to_bindata(), BinData(12, [1, 2, 0x345, 4]))
+        self.assertEqual(a, RopeBinData.from_bindata(a.to_bindata()))
+        self.assertEqual(a, RopeBinData.from_raw_data(12, a.raw_data))
+        self.assertEqual(hash(a), hash(RopeBinData(12, [1, 2, 0x345, 4])))
+        self.assertNotEqual(a, RopeBinData(12, [1, 2, 0x345]))
+        self.assertNotEqual(a, RopeBinData(16, [1, 2, 0x345, 4]))
+        self.assertNotEqual(a, a.to_bindata())
+        self.assertEqual(list(RopeBinData(8, 3)), [0, 0, 0])
+        self.assertEqual(len(RopeBinData(8)), 0)
+        self.assertEqual(RopeBinData(8).raw_data, b'')
+        with self.assertRaises(IndexError):
+            a[4]
+        with self.assertRaises(IndexError):
+            a[-5]
+        with self.assertRaises(ValueError):
+            a[0] = 0x1000
+        with self.assertRaises(ValueError):
+            RopeBinData(8, BinData(9, []))
+        with self.assertRaises(TypeError):
+            a[1:2] = [1]
+        with self.assertRaises(ValueError):
+            a[1:2] = BinData(8, [1])
+
+    def test_edit(self):
+        a = RopeBinData(8, b'abcdef')
+        a.insert(3, BinData(8, b'XY'))
+        self.assertEqual(a.raw_data, b'abcXYdef')
+        a.insert(100, RopeBinData(8, b'!'))
+        self.assertEqual(a.raw_data, b'abcXYdef!')
+        a.insert(-100, BinData(8, b'<'))
+        self.assertEqual(a.raw_data, b'<abcXYdef!')
+        del a[4:6]
+        self.assertEqual(a.raw_data, b'<abcdef!')
+        del a[-1]
+        self.assertEqual(a.raw_data, b'<abcdef')
+        del a[::2]
+        self.assertEqual(a.raw_data, b'ace')
+        a[1:2] = BinData(8, b'BBB')
+        self.assertEqual(a.raw_data, b'aBBBe')
+        a[::-2] = BinData(8, b'123')
+        self.assertEqual(a.raw_data, b'3B2B1')
+        a[0] = 0x30
+        self.assertEqual(a.raw_data, b'0B2B1')
+        b = a[1:4]
+        self.assertEqual(b, RopeBinData(8, b'B2B'))
+        self.assertEqual(a[::-1], RopeBinData(8, b'1B2B0'))
+        self.assertEqual(a + b, RopeBinData(8, b'0B2B1B2B'))
+        self.assertEqual(a + BinData(8, b'.'), RopeBinData(8, b'0B2B1.'))
+        # Slices share data, but modifications are independent.
+        b[0] = 0x41
+        self.assertEqual(a.raw_data, b'0B2B1')
+        self.assertEqual(b.raw_data, b'A2B')
+        # So does the source BinData.
+        c = BinData(8, b'xyz')
+        d = RopeBinData(8, c)
+        c[0] = 0x21
+        d[1] = 0x21
+        self.assertEqual(c.raw_data, b'!yz')
+        self.assertEqual(d.raw_data, b'x!z')
+
+    def test_random(self):
+        old_leaf = rope.LEAF_OCTETS
+        rope.LEAF_OCTETS = 16
+        try:
+            rnd = random.Random(1234)
+            model = bytearray(rnd.getrandbits(8) for _ in range(1000))
+            a = RopeBinData.from_raw_data(16, bytes(model))
+            for _ in range(500):
+                op = rnd.randrange(4)
+                start = rnd.randrange(len(model) // 2 + 1)
+                stop = rnd.randrange(start, len(model) // 2 + 1)
+                if op == 0:
+                    new = bytearray(
+                        rnd.getrandbits(8) for _ in range(rnd.randrange(40)))
+                    new = new[:len(new) & ~1]
+                    a[start:stop] = BinData.from_raw_data(16, bytes(new))
+                    model[start * 2:stop * 2] = new
+                elif op == 1:
+                    del a[start:stop]
+                    del model[start * 2:stop * 2]
+                elif op == 2:
+                    self.assertEqual(a[start:stop].raw_data,
+                                     bytes(model[start * 2:stop * 2]))
+                elif start < len(a):
+                    a[start] = 0x1234
+                    model[start * 2:start * 2 + 2] = b'\x34\x12'
+                self.assertEqual(len(a), len(model) // 2)
+            self.assertEqual(a.raw_data, bytes(model))
+            self.assertEqual(b''.join(c.raw_data for c in a.chunks()),
+                             bytes(model))
+        finally:
+            rope.LEAF_OCTETS = old_leaf
+
+    def test_balance(self):
+        old_leaf = rope.LEAF_OCTETS
+        rope.LEAF_OCTETS = 1
+        try:
+            a = RopeBinData(8)
+            for i in range(1024):
+                a.insert(i // 2, BinData(8, [i & 0xff]))
+            self.assertEqual(len(a), 1024)
+            # AVL trees are at most ~1.44 log2(n) high.
+            self.assertLessEqual(a._root.height, 15)
+            self.assertEqual(len(list(a.chunks())), 1024)
+            b = a
+            for i in range(10):
+                b = b + b
+            self.assertEqual(len(b), 1024 << 10)
+            self.assertLessEqual(b._root.height, 25)
+            self.assertEqual(b[0x12345], a[0x345])
+        finally:
+            rope.LEAF_OCTETS = old_leaf
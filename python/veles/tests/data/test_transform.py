@@ -0,0 +1,94 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import unittest
+
+from veles.compatibility.int_bytes import int_to_bytes, int_from_bytes
+from veles.data import transform
+from veles.data.bindata import BinData
+from veles.data.transform import Transform, TransformOp
+
+
+class TestTransform(unittest.TestCase):
+    def check_width(self, width):
+        rnd = random.Random(width)
+        mask = (1 << width) - 1
+        data = [rnd.getrandbits(width) for _ in range(100)]
+        key = [rnd.getrandbits(width) for _ in range(7)]
+        src = BinData(width, data)
+
+        def check(op, func, **kwargs):
+            res = Transform(op, width, **kwargs).apply(src)
+            self.assertEqual(list(res), [
+                func(x, key[i % len(key)]) for i, x in enumerate(data)
+            ])
+
+        kbd = BinData(width, key)
+        check(TransformOp.XOR, lambda x, k: x ^ k, key=kbd)
+        check(TransformOp.AND, lambda x, k: x & k, key=kbd)
+        check(TransformOp.OR, lambda x, k: x | k, key=kbd)
+        check(TransformOp.ADD, lambda x, k: (x + k) & mask, key=kbd)
+        check(TransformOp.SUB, lambda x, k: (x - k) & mask, key=kbd)
+        check(TransformOp.XOR, lambda x, k: x ^ key[0],
+              key=BinData(width, key[:1]))
+        for c in [0, 1, width // 2, width - 1, width, width + 3]:
+            r = c % width
+            check(TransformOp.ROTL,
+                  lambda x, k: (x << r | x >> (width - r)) & mask, count=c)
+            check(TransformOp.ROTR,
+                  lambda x, k: (x >> r | x << (width - r)) & mask, count=c)
+        if width % 8 == 0:
+            ope = width // 8
+            check(TransformOp.BYTESWAP, lambda x, k: int_from_bytes(
+                int_to_bytes(x, ope, 'little'), 'big'))
+        else:
+            with self.assertRaises(ValueError):
+                Transform(TransformOp.BYTESWAP, width).apply(src)
+        if width <= 12:
+            for tw in [5, 8, 20]:
+                table = [rnd.getrandbits(tw) for _ in range(1 << width)]
+                check(TransformOp.LOOKUP, lambda x, k: table[x],
+                      key=BinData(tw, table))
+
+    def test_widths(self):
+        old_numpy = transform.numpy
+        try:
+            for numpy in {old_numpy, None}:
+                transform.numpy = numpy
+                for width in [1, 3, 8, 12, 16, 24, 32, 33, 64, 72]:
+                    self.check_width(width)
+        finally:
+            transform.numpy = old_numpy
+
+    def test_simple(self):
+        a = BinData(8, b'Hello')
+        t = Transform(TransformOp.XOR, 8, key=BinData(8, b'\x20'))
+        self.assertEqual(t.apply(a), BinData(8, b'hELLO'))
+        self.assertEqual(t.apply(BinData(8)), BinData(8))
+        self.assertEqual(a, BinData(8, b'Hello'))
+        t = Transform(TransformOp.LOOKUP, 1, key=BinData(1, [1, 0]))
+        self.assertEqual(t.apply(BinData(1, [0, 1, 1])), BinData(1, [1, 0, 0]))
+        with self.assertRaises(TypeError):
+            t.apply(b'abc')
+        with self.assertRaises(ValueError):
+            t.apply(a)
+        with self.assertRaises(ValueError):
+            Transform(TransformOp.XOR, 8).apply(a)
+        with self.assertRaises(ValueError):
+            Transform(TransformOp.XOR, 8, key=BinData(8)).apply(a)
+        with self.assertRaises(ValueError):
+            Transform(TransformOp.XOR, 8, key=BinData(9, [1])).apply(a)
+        with self.assertRaises(ValueError):
+            Transform(TransformOp.LOOKUP, 8, key=BinData(8, [1])).apply(a)
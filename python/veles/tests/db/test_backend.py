@@ -14,17 +14,20 @@
 
 from __future__ import unicode_literals
 
+import hashlib
 import unittest
 import tempfile
 import os.path
+import sqlite3
 
 import six
 
-from veles.db.backend import DbBackend
+from veles.db.backend import (
+    DbBackend, DB_VERSION, DB_BINDATA_CODECS, db_bigint_encode)
 from veles.data.bindata import BinData
-from veles.proto.node import Node
+from veles.proto.node import Node, PosFilter
 from veles.schema.nodeid import NodeID
-from veles.proto.exceptions import WritePastEndError
+from veles.proto.exceptions import BinDataChangedError, WritePastEndError
 
 from veles.tests.proto.test_pos_filter import (
     NODES as LIST_NODES,
@@ -97,6 +100,417 @@ class TestDbBackend(unittest.TestCase):
                 pass
             os.rmdir(d)
 
+    def test_migrate(self):
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, 'x.db')
+        try:
+            db = DbBackend(path)
+            node = Node(id=NodeID(), tags={'my_tag'}, pos_start=3,
+                        pos_end=5)
+            db.create(node)
+            db.set_bindata(node.id, 'b', 0, b'x' * 0x10010)
+            node.bindata = {'b': 0x10010}
+            db.close()
+            # Turn it into a version 2 database.
+            raw = sqlite3.connect(path)
+            raw.execute('DROP INDEX node_tag_name')
+            raw.execute('DROP TABLE node_pos')
+            raw.execute('DROP TABLE node_pos_key')
+            raw.execute('DROP TABLE node_bindata_meta')
+            raw.execute('UPDATE node SET pos_start = ?, pos_end = ?', (
+                db_bigint_encode(3), db_bigint_encode(5)))
+            raw.execute('pragma user_version = 2')
+            raw.commit()
+            raw.close()
+            db = DbBackend(path)
+            self.assertEqual(db.get(node.id), node)
+            self.assertEqual(db.list_tagged({'my_tag'}), {node.id})
+            self.assertEqual(
+                db.list(NodeID.root_id, pos_filter=PosFilter(end_from=4)),
+                {node.id})
+            self.assertEqual(
+                db.db.execute('SELECT COUNT(*) FROM node_pos').fetchone()[0],
+                1)
+            self.assertEqual(db.db.execute("""
+                SELECT typeof(pos_start), typeof(pos_end) FROM node
+            """).fetchall(), [('integer', 'integer')])
+            self.assertEqual(
+                db.db.execute('pragma user_version').fetchone()[0],
+                DB_VERSION)
+            self.assertEqual(db.db.execute("""
+                SELECT name FROM sqlite_master WHERE name = 'node_tag_name'
+            """).fetchall(), [('node_tag_name',)])
+            db.close()
+            for version in [1, DB_VERSION + 1]:
+                raw = sqlite3.connect(path)
+                raw.execute('pragma user_version = {}'.format(version))
+                raw.commit()
+                raw.close()
+                with self.assertRaises(ValueError):
+                    DbBackend(path)
+        finally:
+            try:
+                os.unlink(path)
+            except Exception:
+                pass
+            os.rmdir(d)
+
+    def test_bindata_patch(self):
+        db = DbBackend(None)
+        node = Node(id=NodeID())
+        db.create(node)
+        ref = bytearray()
+        page = 0x10000
+        for i, (start, size, truncate) in enumerate([
+            (0, page * 3 + 0x123, False),
+            (5, 1, False),
+            (page - 2, 4, False),
+            (page * 2 + 7, page + 0x200, False),
+            (page * 3 + 0x200, 0x10, True),
+            (0x40, page * 2, False),
+            (page * 2 + 0x10, 0, True),
+            (page * 2, page * 2, False),
+            (page * 4, 0, True),
+            (page + 3, 0x20, True),
+            (page + 0x23, page, False),
+        ]):
+            data = bytes(bytearray((i * 37 + x) & 0xff for x in range(size)))
+            db.set_bindata(node.id, 'x', start, data, truncate=truncate)
+            ref[start:start + size] = data
+            if truncate:
+                del ref[start + size:]
+            self.assertEqual(db.get_bindata(node.id, 'x'), bytes(ref))
+            self.assertEqual(db.get(node.id).bindata, {'x': len(ref)})
+        # Small patches don't replace the page rows.
+        query = 'SELECT page, rowid FROM node_bindata ORDER BY page'
+        rows = db.db.execute(query).fetchall()
+        db.set_bindata(node.id, 'x', page + 0x10, b'abc')
+        ref[page + 0x10:page + 0x13] = b'abc'
+        self.assertEqual(db.get_bindata(node.id, 'x'), bytes(ref))
+        self.assertEqual(db.db.execute(query).fetchall(), rows)
+        # And can be rolled back.
+        db.set_bindata(node.id, 'x', page + 0x20, b'ZZ', commit=False)
+        db.rollback()
+        self.assertEqual(db.get_bindata(node.id, 'x'), bytes(ref))
+
+    def test_iter_bindata(self):
+        db = DbBackend(None)
+        node = Node(id=NodeID())
+        db.create(node)
+        data = bytes(bytearray(x & 0xff for x in range(0x28000)))
+        db.set_bindata(node.id, 'x', 0, data)
+        pages = list(db.iter_bindata(node.id, 'x', 0x100, 0x20100))
+        self.assertEqual([len(x) for x in pages], [0xff00, 0x10000, 0x100])
+        self.assertTrue(all(isinstance(x, memoryview) for x in pages))
+        self.assertEqual(b''.join(pages), data[0x100:0x20100])
+        pages = db.iter_bindata(node.id, 'x', 0x18000)
+        self.assertEqual(b''.join(pages), data[0x18000:])
+        self.assertEqual(list(db.iter_bindata(node.id, 'x', 5, 5)), [])
+        self.assertEqual(list(db.iter_bindata(node.id, 'y')), [])
+        with self.assertRaises(ValueError):
+            db.iter_bindata(node.id, 'x', 5, 4)
+        # Changing the data fails iterators that haven't read all of it,
+        # other keys and finished iterators are not affected.
+        db.set_bindata(node.id, 'y', 0, b'abc')
+        it = db.iter_bindata(node.id, 'x', 0x8000)
+        self.assertEqual(next(it), data[0x8000:0x10000])
+        other = db.iter_bindata(node.id, 'y')
+        done = db.iter_bindata(node.id, 'x', 0x20000)
+        self.assertEqual(next(done), data[0x20000:])
+        db.set_bindata(node.id, 'x', 0x20000, b'zz')
+        with self.assertRaises(BinDataChangedError):
+            next(it)
+        self.assertEqual(list(done), [])
+        self.assertEqual(b''.join(other), b'abc')
+        it = db.iter_bindata(node.id, 'x')
+        db.set_bindata(node.id, 'y', 0, b'xyz', commit=False)
+        db.rollback()
+        with self.assertRaises(BinDataChangedError):
+            list(it)
+        it = db.iter_bindata(node.id, 'x')
+        db.delete(node.id)
+        with self.assertRaises(BinDataChangedError):
+            list(it)
+
+    def test_repage(self):
+        db = DbBackend(None, bindata_page_size=0x100)
+        node = Node(id=NodeID())
+        db.create(node)
+        data = bytearray(x * 7 & 0xff for x in range(0x4321))
+        db.set_bindata(node.id, 'a', 0, bytes(data))
+        db.set_bindata(node.id, 'b', 0, b'b' * 0x300)
+
+        def pages(key):
+            return db.db.execute("""
+                SELECT COUNT(*) FROM node_bindata WHERE name = ?
+            """, (key,)).fetchone()[0]
+
+        self.assertEqual(pages('a'), 0x44)
+        steps = db.repage_bindata(node.id, 'a', 0x1000, batch_size=0x1000)
+        self.assertEqual(next(steps), 0x1000)
+        self.assertEqual(db.get_bindata(node.id, 'a'), data)
+        self.assertEqual(next(steps), 0x2000)
+        # A write in the meantime makes it start over.
+        db.set_bindata(node.id, 'a', 0x10, b'xyz')
+        data[0x10:0x13] = b'xyz'
+        self.assertEqual(pages('a'), 0x44)
+        self.assertEqual(list(steps), [0x1000, 0x2000, 0x3000, 0x4000,
+                                       0x4321])
+        self.assertEqual(pages('a'), 5)
+        self.assertEqual(db.get_bindata(node.id, 'a'), data)
+        self.assertEqual(db.get_bindata(node.id, 'a', 0xff0, 0x2010),
+                         data[0xff0:0x2010])
+        self.assertEqual(db.get_bindata_page_sizes(), {
+            (node.id, 'a'): 0x1000,
+            (node.id, 'b'): 0x100,
+        })
+        # New layout works for writes and further repaging.
+        db.set_bindata(node.id, 'a', 0x4000, b'q' * 0x2000)
+        data[0x4000:] = b'q' * 0x2000
+        db.set_bindata(node.id, 'a', 0x5fff, b'', truncate=True)
+        del data[0x5fff:]
+        self.assertEqual(db.get_bindata(node.id, 'a'), data)
+        self.assertEqual(list(db.repage_bindata(node.id, 'a', 0x10000)),
+                         [0x5fff])
+        self.assertEqual(pages('a'), 1)
+        self.assertEqual(db.get_bindata(node.id, 'a'), data)
+        self.assertEqual(db.get(node.id).bindata, {'a': 0x5fff, 'b': 0x300})
+        self.assertEqual(list(db.repage_bindata(node.id, 'c', 0x10)), [])
+        with self.assertRaises(ValueError):
+            list(db.repage_bindata(node.id, 'a', 0))
+        # Resuming with another codec starts over.
+        steps = db.repage_bindata(node.id, 'b', 0x80, batch_size=0x80)
+        self.assertEqual(next(steps), 0x80)
+        steps = db.repage_bindata(node.id, 'b', 0x80, codec='zlib',
+                                  batch_size=0x80)
+        self.assertEqual(list(steps), [0x80, 0x100, 0x180, 0x200, 0x280,
+                                       0x300])
+        self.assertEqual(db.db.execute("""
+            SELECT DISTINCT codec FROM node_bindata WHERE name = 'b'
+        """).fetchall(), [('zlib',)])
+        # Without commits, the conversion can be rolled back.
+        self.assertEqual(
+            list(db.repage_bindata(node.id, 'b', 0x100, commit=False)),
+            [0x300])
+        db.rollback()
+        self.assertEqual(db.get_bindata_page_sizes()[node.id, 'b'], 0x80)
+        self.assertEqual(db.get_bindata(node.id, 'b'), b'b' * 0x300)
+
+    def test_bindata_codecs(self):
+        page = 0x1000
+        rand = b''.join(hashlib.sha256(str(x).encode()).digest()
+                        for x in range(page * 2 // 32))
+        for codec in [None] + sorted(DB_BINDATA_CODECS):
+            db = DbBackend(None, bindata_page_size=page, bindata_codec=codec)
+            node = Node(id=NodeID())
+            db.create(node)
+            data = bytearray(page * 3) + b'abcd' * page + rand
+            data += bytearray(0x123)
+            db.set_bindata(node.id, 'x', 0, bytes(data))
+
+            def codecs():
+                return [x for x, in db.db.execute("""
+                    SELECT codec FROM node_bindata ORDER BY page
+                """)]
+
+            self.assertEqual(codecs(), ['zero'] * 3 + [codec] * 4 +
+                             [None, None, 'zero'])
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            self.assertEqual(db.get_bindata(node.id, 'x', 0x2ffe, 0x3003),
+                             data[0x2ffe:0x3003])
+            for pos, patch in [(0x10, b'xyz'), (0x3ffe, b'1234'),
+                               (page * 9 + 0x120, b'tail')]:
+                db.set_bindata(node.id, 'x', pos, patch)
+                data[pos:pos + len(patch)] = patch
+            db.set_bindata(node.id, 'x', page * 5 + 3, bytes(page),
+                           truncate=True)
+            del data[page * 5 + 3:]
+            data += bytes(page)
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            self.assertEqual(db.get(node.id).bindata, {'x': len(data)})
+            if codec is not None:
+                self.assertTrue(db._page_cache)
+        db = DbBackend(None, bindata_page_size=page)
+        db.create(node)
+        db.set_bindata(node.id, 'x', 0, b'abcd' * page)
+        self.assertEqual(list(db.repage_bindata(node.id, 'x', page,
+                                                codec='zlib')), [page * 4])
+        self.assertEqual(codecs(), ['zlib'] * 4)
+        db.set_bindata(node.id, 'x', page * 4, b'abcd' * page)
+        self.assertEqual(codecs(), ['zlib'] * 8)
+        self.assertEqual(db.get_bindata(node.id, 'x'), b'abcd' * page * 2)
+        with self.assertRaises(ValueError):
+            DbBackend(None, bindata_codec='rot13')
+
+    def test_bindata_dedup(self):
+        page = 0x1000
+        db = DbBackend(None, bindata_page_size=page, bindata_codec='zlib',
+                       bindata_dedup=True)
+        image = b''.join(hashlib.sha256(str(x).encode()).digest()
+                         for x in range(page * 8 // 32))
+        image += bytes(page)
+        nodes = [Node(id=NodeID()) for _ in range(3)]
+        for i, node in enumerate(nodes):
+            db.create(node)
+            data = bytearray(image)
+            data[i * page + 5] ^= 1
+            db.set_bindata(node.id, 'x', 0, bytes(data))
+
+        def store():
+            return dict(db.db.execute("""
+                SELECT refs, COUNT(*) FROM bindata_page GROUP BY refs
+            """).fetchall())
+
+        # 5 pages shared by all images, 3 shared by two, 3 unique ones.
+        self.assertEqual(store(), {3: 5, 2: 3, 1: 3})
+        data = bytearray(image)
+        data[5] ^= 1
+        self.assertEqual(db.get_bindata(nodes[0].id, 'x'), data)
+        # Patching a shared page only affects one node.
+        db.set_bindata(nodes[0].id, 'x', page * 7 + 1, b'abc')
+        data[page * 7 + 1:page * 7 + 4] = b'abc'
+        self.assertEqual(db.get_bindata(nodes[0].id, 'x'), data)
+        self.assertEqual(store(), {3: 4, 2: 4, 1: 4})
+        self.assertEqual(db.get_bindata(nodes[1].id, 'x', page * 7),
+                         image[page * 7:])
+        db.set_bindata(nodes[1].id, 'x', page * 4, b'', truncate=True)
+        self.assertEqual(store(), {3: 1, 2: 6, 1: 5})
+        self.assertEqual(list(db.repage_bindata(nodes[2].id, 'x', page * 2)),
+                         [len(image)])
+        data = bytearray(image)
+        data[page * 2 + 5] ^= 1
+        self.assertEqual(db.get_bindata(nodes[2].id, 'x'), data)
+        for node in nodes:
+            db.delete(node.id)
+        self.assertEqual(store(), {})
+
+    def test_bindata_files(self):
+        with self.assertRaises(ValueError):
+            DbBackend(None, bindata_file_size=0x1000)
+        d = tempfile.mkdtemp()
+        path = os.path.join(d, 'x.db')
+        files = path + '.bindata'
+        try:
+            db = DbBackend(path, bindata_page_size=0x100,
+                           bindata_file_size=0x1000,
+                           bindata_file_chunk=0x400)
+            node = Node(id=NodeID())
+            db.create(node)
+            data = bytearray(b'abcd' * 0x3ff)
+            db.set_bindata(node.id, 'x', 0, bytes(data))
+            db.set_bindata(node.id, 'y', 0, b'small')
+            self.assertEqual(db.db.execute("""
+                SELECT COUNT(*) FROM node_bindata WHERE name = 'y'
+            """).fetchall(), [(1,)])
+
+            def chunks():
+                return dict(db.db.execute("""
+                    SELECT chunk, file FROM node_bindata_file
+                """).fetchall())
+
+            # Growing past the threshold moves the data to files.
+            db.set_bindata(node.id, 'x', len(data), b'efgh')
+            data += b'efgh'
+            self.assertEqual(db.db.execute("""
+                SELECT COUNT(*) FROM node_bindata
+            """).fetchall(), [(1,)])
+            old_chunks = chunks()
+            self.assertEqual(sorted(old_chunks), [0, 1, 2, 3])
+            self.assertEqual(sorted(os.listdir(files)),
+                             sorted(old_chunks.values()))
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            pages = list(db.iter_bindata(node.id, 'x', 0x350, 0x550))
+            self.assertEqual([len(p) for p in pages], [0xb0, 0x100, 0x50])
+            self.assertIsInstance(pages[0], memoryview)
+            self.assertEqual(b''.join(pages), data[0x350:0x550])
+            self.assertEqual(db.get(node.id).bindata, {'x': 0x1000, 'y': 5})
+
+            # Writes only replace the chunks they touch, views of the old
+            # ones stay valid.
+            old = bytes(data)
+            db.set_bindata(node.id, 'x', 0x3fe, b'zzzz')
+            data[0x3fe:0x402] = b'zzzz'
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            self.assertEqual(b''.join(pages), old[0x350:0x550])
+            new_chunks = chunks()
+            self.assertEqual(
+                [i for i in range(4) if old_chunks[i] != new_chunks[i]],
+                [0, 1])
+            self.assertEqual(len(os.listdir(files)), 4)
+
+            # A partly consumed iterator keeps reading the data from before
+            # a write, even if the files it reads are removed.
+            old = bytes(data)
+            it = db.iter_bindata(node.id, 'x', 0x300)
+            first = next(it)
+            db.set_bindata(node.id, 'x', 0x600, b'yyyy')
+            data[0x600:0x604] = b'yyyy'
+            db.set_bindata(node.id, 'x', 0xc00, b'w' * 0x10)
+            data[0xc00:0xc10] = b'w' * 0x10
+            self.assertEqual(len(os.listdir(files)), 4)
+            self.assertEqual(bytes(first) + b''.join(it), old[0x300:])
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            del it, first
+
+            db.set_bindata(node.id, 'x', 0x800, b'q', truncate=True)
+            data[0x800:] = b'q'
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            self.assertEqual(sorted(chunks()), [0, 1, 2])
+            self.assertEqual(len(os.listdir(files)), 3)
+            db.set_bindata(node.id, 'x', 0x801, b'r' * 0x400)
+            data += b'r' * 0x400
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            self.assertEqual(db.get_bindata(node.id, 'x', 0xbff), b'rr')
+            self.assertEqual(list(db.repage_bindata(node.id, 'x', 0x80)), [])
+
+            # Uncommitted files are dropped on rollback.
+            db.set_bindata(node.id, 'x', 0, b'rr', commit=False)
+            self.assertEqual(len(os.listdir(files)), 5)
+            db.rollback()
+            self.assertEqual(len(os.listdir(files)), 4)
+            self.assertEqual(db.get_bindata(node.id, 'x'), data)
+            db.close()
+
+            db = DbBackend(path)
+            self.assertEqual(db.get_bindata(node.id, 'x', 0x7fe, 0x802),
+                             b'cdqr')
+            db.set_bindata(node.id, 'x', 0, b'', truncate=True)
+            self.assertEqual(os.listdir(files), [])
+            self.assertEqual(db.get(node.id).bindata, {'y': 5})
+            db.set_bindata(node.id, 'x', 0, b'a' * 0x1000)
+            db.delete(node.id)
+            self.assertEqual(os.listdir(files), [])
+            db.close()
+        finally:
+            for name in os.listdir(files):
+                os.unlink(os.path.join(files, name))
+            os.rmdir(files)
+            os.unlink(path)
+            os.rmdir(d)
+
+    def test_bindata_meta(self):
+        db = DbBackend(None)
+        node = Node(id=NodeID())
+        db.create(node)
+
+        def meta():
+            return db.db.execute("""
+                SELECT name, length FROM node_bindata_meta
+            """).fetchall()
+
+        db.set_bindata(node.id, 'a', 0, b'x' * 0x20000)
+        db.set_bindata(node.id, 'a', 0x1fff0, b'y' * 0x20)
+        db.set_bindata(node.id, 'b', 0, b'z')
+        self.assertEqual(sorted(meta()), [('a', 0x20010), ('b', 1)])
+        db.set_bindata(node.id, 'a', 0x100, b'', truncate=True)
+        self.assertEqual(db.get(node.id).bindata, {'a': 0x100, 'b': 1})
+        db.set_bindata(node.id, 'a', 0, b'', truncate=True)
+        self.assertEqual(meta(), [('b', 1)])
+        with self.assertRaises(WritePastEndError):
+            db.set_bindata(node.id, 'a', 1, b'x')
+        db.delete(node.id)
+        self.assertEqual(meta(), [])
+
     def test_delete(self):
         db = DbBackend(None)
         node = Node(id=NodeID(),
@@ -432,6 +846,15 @@ class TestDbBackend(unittest.TestCase):
         self.assertEqual(n2.bindata['three'], 0x1234)
         correct = b'\x11' * 0x1234
         self.assertEqual(db.get_bindata(node.id, 'three'), correct)
+        raw = BinData(8, b'\x44' * 0x23456).raw_view
+        db.set_bindata(node.id, 'three', start=0x1000, data=raw[0x10:])
+        correct = b'\x11' * 0x1000 + b'\x44' * 0x23446
+        self.assertEqual(db.get_bindata(node.id, 'three'), correct)
+        db.set_bindata(node.id, 'three', start=0x12,
+                       data=bytearray(b'\x55' * 0x10000))
+        correct = (b'\x11' * 0x12 + b'\x55' * 0x10000 +
+                   b'\x44' * (0x23446 + 0x1000 - 0x10012))
+        self.assertEqual(db.get_bindata(node.id, 'three'), correct)
         with self.assertRaises(TypeError):
             db.set_bindata(node.id, b'zlew', 0, b'zlew')
         with self.assertRaises(TypeError):
@@ -447,6 +870,33 @@ class TestDbBackend(unittest.TestCase):
         with self.assertRaises(TypeError):
             db.get_bindata(node.id, 123)
 
+    def test_get_many(self):
+        db = DbBackend(None)
+        nodes = [
+            Node(id=NodeID(), tags={'t{}'.format(i % 3)},
+                 attr={'a': i}, pos_start=i, pos_end=i << 70)
+            for i in range(1200)
+        ]
+        for n in nodes:
+            db.create(n, commit=False)
+        db.set_data(nodes[5].id, 'd', [1, 2])
+        db.set_bindata(nodes[5].id, 'b', 0, b'x' * 0x12345)
+        db.set_bindata(nodes[7].id, 'c', 0, b'abc')
+        missing = NodeID()
+        res = db.get_many([n.id for n in nodes] + [missing])
+        self.assertEqual(len(res), len(nodes))
+        self.assertNotIn(missing, res)
+        for n in nodes:
+            self.assertEqual(res[n.id], db.get(n.id))
+        self.assertEqual(res[nodes[5].id].data, {'d'})
+        self.assertEqual(res[nodes[5].id].bindata, {'b': 0x12345})
+        self.assertEqual(res[nodes[7].id].bindata, {'c': 3})
+        self.assertEqual(res[nodes[8].id].attr, {'a': 8})
+        self.assertEqual(res[nodes[8].id].pos_end, 8 << 70)
+        self.assertEqual(db.get_many([]), {})
+        with self.assertRaises(TypeError):
+            db.get_many([b'abc'])
+
     def test_list_simple(self):
         db = DbBackend(None)
         n1 = Node(id=NodeID(), tags={'aaa', 'bbb'})
@@ -473,6 +923,90 @@ class TestDbBackend(unittest.TestCase):
         self.assertEqual(set(db.list(n1_1.id)), set())
         self.assertEqual(set(db.list(n1_2.id)), set())
 
+    def test_list_nodes(self):
+        db = DbBackend(None)
+        n1 = Node(id=NodeID(), tags={'aaa'}, pos_start=1, pos_end=2)
+        n2 = Node(id=NodeID(), tags={'aaa', 'bbb'}, attr={'x': [1, 'y']})
+        n1_1 = Node(id=NodeID(), parent=n1.id, tags={'aaa'})
+        n3 = Node(id=NodeID())
+        for n in [n1, n2, n1_1, n3]:
+            db.create(n)
+        db.set_data(n2.id, 'd', 7)
+        db.set_bindata(n2.id, 'b', 0, b'x' * 0x10010)
+        db.set_bindata(n3.id, 'b', 0, b'x')
+        for parent, tags in [
+            (NodeID.root_id, set()),
+            (NodeID.root_id, {'aaa'}),
+            (NodeID.root_id, {'aaa', 'bbb'}),
+            (NodeID.root_id, {'ccc'}),
+            (n1.id, set()),
+            (n1_1.id, set()),
+        ]:
+            res = db.list_nodes(parent, tags)
+            self.assertEqual(len(res), len(db.list(parent, tags)))
+            for node in res:
+                self.assertEqual(node, db.get(node.id))
+        res = {n.id: n for n in db.list_nodes(NodeID.root_id)}
+        self.assertEqual(res[n2.id].bindata, {'b': 0x10010})
+        self.assertEqual(res[n2.id].data, {'d'})
+        self.assertEqual(res[n3.id].bindata, {'b': 1})
+        self.assertEqual(res[n1.id].pos_end, 2)
+        self.assertEqual(
+            db.list_nodes(NodeID.root_id, pos_filter=PosFilter(start_from=1)),
+            [res[n1.id]])
+
+    def test_list_tags(self):
+        db = DbBackend(None)
+        p1 = Node(id=NodeID())
+        p2 = Node(id=NodeID(), tags={'common'})
+        db.create(p1)
+        db.create(p2)
+        nodes = []
+        for i in range(300):
+            tags = {'common'}
+            if i % 50 == 0:
+                tags.add('rare')
+            if i % 3 == 0:
+                tags.add('third')
+            n = Node(id=NodeID(), parent=p1.id if i % 2 else p2.id,
+                     tags=tags, pos_start=i)
+            db.create(n, commit=False)
+            nodes.append(n)
+        db.commit()
+
+        def expected(parent, tags, pos_filter=PosFilter()):
+            return {
+                n.id for n in nodes + [p1, p2]
+                if (parent is None or n.parent == parent) and
+                tags <= n.tags and
+                (pos_filter.start_from is None or
+                 n.pos_start is not None and
+                 n.pos_start >= pos_filter.start_from)
+            }
+
+        for tags in [set(), {'common'}, {'rare'}, {'third'},
+                     {'common', 'rare'}, {'rare', 'third'}, {'missing'},
+                     {'common', 'missing'}]:
+            for pos_filter in [PosFilter(), PosFilter(start_from=100)]:
+                for parent in [NodeID.root_id, p1.id, p2.id]:
+                    self.assertEqual(db.list(parent, tags, pos_filter),
+                                     expected(parent, tags, pos_filter))
+                if tags:
+                    self.assertEqual(db.list_tagged(tags, pos_filter),
+                                     expected(None, tags, pos_filter))
+        # The rarest tag drives the query.
+        self.assertEqual(
+            db._pick_list_driver(p1.id, {'common', 'rare'}, PosFilter()),
+            'rare')
+        self.assertEqual(
+            db._pick_list_driver(None, {'common', 'third'}, PosFilter()),
+            'third')
+        self.assertEqual(
+            db._pick_list_driver(NodeID.root_id, {'common'}, PosFilter()),
+            None)
+        with self.assertRaises(TypeError):
+            db.list(None)
+
     def test_list_pos(self):
         db = DbBackend(None)
         for node in LIST_NODES:
@@ -484,3 +1018,99 @@ class TestDbBackend(unittest.TestCase):
                     self.assertIn(i, res)
                 else:
                     self.assertNotIn(i, res)
+
+    def test_pos_storage(self):
+        db = DbBackend(None)
+        positions = [
+            None, -(1 << 70), -(1 << 63) - 1, -(1 << 63), -5, 0,
+            (1 << 63) - 1, 1 << 63, 1 << 70,
+        ]
+        nodes = []
+        for pos_start in positions:
+            for pos_end in positions:
+                n = Node(id=NodeID(), pos_start=pos_start, pos_end=pos_end)
+                db.create(n, commit=False)
+                nodes.append(n)
+        db.commit()
+        for n in nodes[:10]:
+            self.assertEqual(db.get(n.id), n)
+        self.assertEqual(db.db.execute("""
+            SELECT typeof(pos_start), COUNT(*) FROM node GROUP BY 1
+        """).fetchall(), [
+            ('blob', 36), ('integer', 36), ('null', 9),
+        ])
+        for val in positions[1:]:
+            for fil, match in [
+                (PosFilter(start_from=val),
+                 lambda n: n.pos_start is not None and n.pos_start >= val),
+                (PosFilter(start_to=val),
+                 lambda n: n.pos_start is None or n.pos_start <= val),
+                (PosFilter(end_from=val),
+                 lambda n: n.pos_end is None or n.pos_end >= val),
+                (PosFilter(end_to=val),
+                 lambda n: n.pos_end is not None and n.pos_end <= val),
+            ]:
+                self.assertEqual(db.list(NodeID.root_id, pos_filter=fil),
+                                 {n.id for n in nodes if match(n)})
+
+    def test_list_intervals(self):
+        db = DbBackend(None)
+        p1 = Node(id=NodeID())
+        p2 = Node(id=NodeID())
+        db.create(p1)
+        db.create(p2)
+        nodes = []
+        for i in range(500):
+            start = i * 0x10 + (1 << 64 if i % 7 == 0 else 0)
+            pos_start = None if i % 11 == 0 else start
+            pos_end = None if i % 13 == 0 else start + i % 5 * 0x10
+            n = Node(id=NodeID(), parent=p1.id if i % 3 else p2.id,
+                     pos_start=pos_start, pos_end=pos_end)
+            db.create(n, commit=False)
+            nodes.append(n)
+        db.commit()
+        # Move and delete some nodes to exercise the index maintenance.
+        for n in nodes[:20]:
+            n.pos_start = None if n.pos_start is None else n.pos_start + 1
+            db.set_pos(n.id, n.pos_start, n.pos_end)
+        for n in nodes[20:40]:
+            n.parent = p2.id if n.parent == p1.id else p1.id
+            db.set_parent(n.id, n.parent)
+        for n in nodes[40:50]:
+            db.delete(n.id)
+        nodes = nodes[50:] + nodes[:40] + [p1, p2]
+
+        def matches(n, fil):
+            start = n.pos_start
+            end = n.pos_end
+            return ((fil.start_from is None or
+                     start is not None and start >= fil.start_from) and
+                    (fil.start_to is None or
+                     start is None or start <= fil.start_to) and
+                    (fil.end_from is None or
+                     end is None or end >= fil.end_from) and
+                    (fil.end_to is None or
+                     end is not None and end <= fil.end_to))
+
+        for fil in [
+            PosFilter(start_to=0x100, end_from=0x100),
+            PosFilter(start_to=0x1001, end_from=0x1000),
+            PosFilter(start_to=(1 << 64) + 0x1000,
+                      end_from=(1 << 64) + 0x1000),
+            PosFilter(start_from=0x1000, end_to=0x1020),
+            PosFilter(start_from=1 << 64),
+            PosFilter(end_to=0x30),
+        ]:
+            for parent in [NodeID.root_id, p1.id, p2.id]:
+                self.assertEqual(
+                    db.list(parent, pos_filter=fil),
+                    {n.id for n in nodes
+                     if n.parent == parent and matches(n, fil)})
+            self.assertEqual(
+                db.list_tagged(set(), fil),
+                {n.id for n in nodes if matches(n, fil)})
+        # Overlap queries are driven by the R*Tree.
+        fil = PosFilter(start_to=0x1001, end_from=0x1000)
+        self.assertIsInstance(db._pick_list_driver(p1.id, set(), fil), tuple)
+        self.assertEqual(db._pick_list_driver(p1.id, set(), PosFilter()),
+                         None)
@@ -0,0 +1,110 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import unittest
+
+from veles.data.bindata import BinData
+from veles.data.transform import Transform, TransformOp
+from veles.db.tracker import DbTracker
+from veles.proto import operation
+from veles.proto.exceptions import SchemaError, ObjectGoneError
+from veles.schema.nodeid import NodeID
+
+
+class TestDbTracker(unittest.TestCase):
+    def test_get_list(self):
+        tracker = DbTracker(None)
+        parent = NodeID()
+        tracker.transaction([], [
+            operation.OperationCreate(node=parent),
+        ] + [
+            operation.OperationCreate(
+                node=NodeID(), parent=parent, attr={'i': i})
+            for i in range(1000)
+        ])
+        tracker.nodes.clear()
+        tracker.get_cached_node.cache_clear()
+        statements = []
+        tracker.db.db.set_trace_callback(statements.append)
+        res = tracker.get_list(parent)
+        # The parent and the list with all the listed nodes - not a query
+        # per node.
+        self.assertLess(len(statements), 10)
+        self.assertEqual(sorted(n.attr['i'] for n in res), list(range(1000)))
+        self.assertTrue(all(n.parent == parent for n in res))
+
+    def test_transform_bindata(self):
+        tracker = DbTracker(None)
+        nid = NodeID()
+        data = bytes(bytearray(x & 0xff for x in range(0x12345)))
+        tracker.transaction([], [
+            operation.OperationCreate(node=nid, bindata={'a': data}),
+        ])
+        op = operation.OperationTransformBinData(
+            node=nid,
+            key='a',
+            start=0x10,
+            end=0x10010,
+            transform=Transform(TransformOp.XOR, 16,
+                                key=BinData(16, [0x1234, 0xffff])),
+        )
+        self.assertEqual(operation.Operation.load(op.dump()), op)
+        tracker.transaction([], [op])
+        res = tracker.get_bindata(nid, 'a')
+        self.assertEqual(len(res), 0x12345)
+        self.assertEqual(res[:0x10], data[:0x10])
+        self.assertEqual(res[0x10010:], data[0x10010:])
+        self.assertEqual(res[0x10:0x14], b'\x24\x03\xed\xec')
+        self.assertEqual(res[0x1000c:0x10010], b'\x38\x1f\xf1\xf0')
+        tracker.transaction([], [operation.OperationTransformBinData(
+            node=nid,
+            key='a',
+            start=0x12340,
+            transform=Transform(TransformOp.ADD, 8, key=BinData(8, [1])),
+        )])
+        self.assertEqual(tracker.get_bindata(nid, 'a', 0x1233f),
+                         b'\x3f\x41\x42\x43\x44\x45')
+        with self.assertRaises(SchemaError):
+            tracker.transaction([], [operation.OperationTransformBinData(
+                node=nid,
+                key='a',
+                transform=Transform(TransformOp.ROTL, 16, count=3),
+            )])
+        with self.assertRaises(SchemaError):
+            tracker.transaction([], [operation.OperationTransformBinData(
+                node=nid,
+                key='a',
+                end=4,
+                transform=Transform(TransformOp.LOOKUP, 1,
+                                    key=BinData(16, [1, 0])),
+            )])
+        self.assertEqual(tracker.get_bindata(nid, 'a', 0, 0x10), data[:0x10])
+
+    def test_get_bindata_pages(self):
+        tracker = DbTracker(None)
+        nid = NodeID()
+        data = bytes(bytearray(x & 0xff for x in range(0x12345)))
+        tracker.transaction([], [
+            operation.OperationCreate(node=nid, bindata={'a': data}),
+        ])
+        for start, end in [(0, None), (0x10, 0x10010), (0x12000, 0x20000),
+                           (0x20000, None), (7, 7)]:
+            size, pages = tracker.get_bindata_pages(nid, 'a', start, end)
+            res = b''.join(pages)
+            self.assertEqual(res, data[start:end])
+            self.assertEqual(size, len(res))
+        with self.assertRaises(ObjectGoneError):
+            tracker.get_bindata_pages(NodeID(), 'a')
@@ -0,0 +1,151 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import struct
+import unittest
+
+from veles.data.bindata import BinData
+from veles.data.repack import Endian, Repacker
+from veles.proto import chunk
+from veles.proto.chunk import (
+    FieldSignMode, FieldFloatMode, FieldStringMode, FieldStringEncoding,
+    FieldType, FieldTypeFixed, FieldTypeFloat, FieldTypeString,
+)
+
+
+class TestFieldType(unittest.TestCase):
+    def for_numpy(self, func):
+        """
+        Runs a test both with NumPy (if available) and without it.
+        """
+        func()
+        if chunk.numpy is not None:
+            numpy = chunk.numpy
+            chunk.numpy = None
+            try:
+                func()
+            finally:
+                chunk.numpy = numpy
+
+    def test_load(self):
+        t = FieldType.load({
+            'object_type': 'fixed',
+            'shift': 0,
+            'sign_mode': 'signed',
+        })
+        self.assertIsInstance(t, FieldTypeFixed)
+        self.assertEqual(FieldType.load(t.dump()), t)
+
+    def test_fixed(self):
+        def check():
+            u = FieldTypeFixed(shift=0, sign_mode=FieldSignMode.unsigned)
+            s = FieldTypeFixed(shift=0, sign_mode=FieldSignMode.signed)
+            a = BinData(12, [0, 1, 0x7ff, 0x800, 0xfff])
+            self.assertEqual(u.decode(a), [0, 1, 0x7ff, 0x800, 0xfff])
+            self.assertEqual(s.decode(a), [0, 1, 0x7ff, -0x800, -1])
+            b = BinData(64, [1 << 63, (1 << 64) - 1])
+            self.assertEqual(u.decode(b), [1 << 63, (1 << 64) - 1])
+            self.assertEqual(s.decode(b), [-1 << 63, -1])
+            c = BinData(24, [0xffffff, 3])
+            self.assertEqual(s.decode(c), [-1, 3])
+            d = BinData(72, [1 << 71])
+            self.assertEqual(s.decode(d), [-1 << 71])
+            s.shift = 4
+            self.assertEqual(s.decode(a), [0, 0x10, 0x7ff0, -0x8000, -0x10])
+            self.assertEqual(s.decode(b), [-1 << 67, -0x10])
+            s.shift = -2
+            self.assertEqual(s.decode(a), [0, 0.25, 511.75, -512.0, -0.25])
+            self.assertEqual(
+                s.decode_many([a[:2], a[2:2], a[2:]]),
+                [[0, 0.25], [], [511.75, -512.0, -0.25]])
+            self.assertEqual(s.decode_many([]), [])
+            with self.assertRaises(ValueError):
+                s.decode_many([a, c])
+        self.for_numpy(check)
+
+    def test_float(self):
+        def check():
+            vals = [1.5, -2.0, 0.0, 1e10]
+            single = BinData.from_raw_data(32, struct.pack('<4f', *vals))
+            double = BinData.from_raw_data(64, struct.pack('<4d', *vals))
+            t = FieldTypeFloat(mode=FieldFloatMode.ieee754_single,
+                               complex=False)
+            self.assertEqual(t.decode(single), vals)
+            self.assertEqual(t.decode_many([single[:1], single[1:]]),
+                             [vals[:1], vals[1:]])
+            with self.assertRaises(ValueError):
+                t.decode(double)
+            t.mode = FieldFloatMode.ieee754_double
+            self.assertEqual(t.decode(double), vals)
+            t.complex = True
+            self.assertEqual(t.decode(double), [1.5 - 2j, 1e10j])
+            self.assertEqual(t.decode_many([double[:2], double[2:]]),
+                             [[1.5 - 2j], [1e10j]])
+            with self.assertRaises(ValueError):
+                t.decode(double[:3])
+        self.for_numpy(check)
+
+    def test_string(self):
+        def check():
+            t = FieldTypeString(mode=FieldStringMode.raw,
+                                encoding=FieldStringEncoding.raw)
+            a = BinData.from_raw_data(8, b'ab\0c\0\0')
+            self.assertEqual(t.decode(a), 'ab\0c\0\0')
+            t.mode = FieldStringMode.zero_padded
+            self.assertEqual(t.decode(a), 'ab\0c')
+            t.mode = FieldStringMode.zero_terminated
+            self.assertEqual(t.decode(a), 'ab')
+            vals = [a, a[:0], a[2:], a[3:], BinData(8, [0xe9])]
+            self.assertEqual(t.decode_many(vals),
+                             ['ab', '', '', 'c', '\xe9'])
+            t.mode = FieldStringMode.zero_padded
+            self.assertEqual(t.decode_many(vals),
+                             ['ab\0c', '', '\0c', 'c', '\xe9'])
+            w = BinData(21, [0x41, 0x1f600, 0x110000, 0xd800, 0])
+            self.assertEqual(t.decode(w), 'A\U0001f600��')
+            t.encoding = FieldStringEncoding.utf8
+            u = BinData.from_raw_data(8, 'zaż\xf3ł\0\0'.encode('utf-8'))
+            self.assertEqual(t.decode_many([u, u[:3]]), ['zażół', 'za�'])
+            with self.assertRaises(ValueError):
+                t.decode(w)
+            t.encoding = FieldStringEncoding.utf16
+            t.mode = FieldStringMode.zero_terminated
+            u = BinData.from_raw_data(16, 'AĀ\0B'.encode('utf-16-le'))
+            self.assertEqual(t.decode_many([u, u[1:], u[3:]]),
+                             ['AĀ', 'Ā', 'B'])
+            with self.assertRaises(ValueError):
+                t.decode(a)
+        self.for_numpy(check)
+
+
+class TestDecodeFields(unittest.TestCase):
+    def test_decode_fields(self):
+        class Item(object):
+            def __init__(self, pos_start, repack, num_elements):
+                self.pos_start = pos_start
+                self.repack = repack
+                self.num_elements = num_elements
+
+        src = BinData(8, range(64))
+        r16 = Repacker(Endian.BIG, 8, 16)
+        r8 = Repacker(Endian.LITTLE, 8, 8)
+        items = [Item(i * 4, r16, 1) for i in range(16)]
+        items += [Item(i * 4 + 2, r8, 2) for i in range(16)]
+        res = chunk.decode_fields(src, items)
+        for item, val in zip(items, res):
+            self.assertEqual(val, item.repack.repack(
+                src, item.pos_start, item.num_elements))
+        self.assertEqual(res[1], BinData(16, [0x0405]))
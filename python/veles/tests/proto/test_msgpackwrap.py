@@ -0,0 +1,51 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from veles.data.bindata import BinData
+from veles.data.packed import PackedBinData
+from veles.proto.msgpackwrap import MsgpackWrapper, pack_bin_header
+from veles.schema.nodeid import NodeID
+
+
+class TestMsgpackWrapper(unittest.TestCase):
+    def roundtrip(self, obj):
+        wrapper = MsgpackWrapper()
+        wrapper.unpacker.feed(wrapper.packer.pack(obj))
+        return wrapper.unpacker.unpack()
+
+    def test_ext(self):
+        nid = NodeID()
+        self.assertEqual(self.roundtrip(nid), nid)
+        self.assertEqual(self.roundtrip(1 << 100), 1 << 100)
+        a = BinData(12, [0x123, 0x456])
+        self.assertEqual(self.roundtrip(a), a)
+
+    def test_packed(self):
+        a = PackedBinData(1, [1, 0, 1, 1] * 1000 + [1])
+        wrapper = MsgpackWrapper()
+        packed = wrapper.packer.pack(a)
+        self.assertLess(len(packed), 520)
+        b = self.roundtrip(a)
+        self.assertIsInstance(b, PackedBinData)
+        self.assertEqual(b, a)
+        self.assertEqual(self.roundtrip(PackedBinData(7)), PackedBinData(7))
+
+    def test_bin_header(self):
+        wrapper = MsgpackWrapper()
+        for size in [0, 0xff, 0x100, 0xffff, 0x10000]:
+            data = b'x' * size
+            packed = pack_bin_header(size) + data
+            self.assertEqual(packed, wrapper.packer.pack(data))
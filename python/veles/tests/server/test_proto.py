@@ -0,0 +1,210 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import unittest
+
+import six
+
+from veles.db.backend import DbBackend
+from veles.proto import messages, msgpackwrap, operation
+from veles.proto.exceptions import BinDataChangedError, ObjectGoneError
+from veles.schema.nodeid import NodeID
+
+if six.PY3:
+    import asyncio
+
+    from veles.server.conn import AsyncLocalConnection
+    from veles.server.proto import ServerProto
+
+
+class FakeTransport(object):
+    """
+    Collects the written data, and pauses the protocol while more than
+    ``limit`` octets of it are waiting to be flushed.
+    """
+
+    def __init__(self, proto, limit=None):
+        self.proto = proto
+        self.limit = limit
+        self.writes = []
+        self.pending = 0
+        self.paused = False
+        self.closing = False
+
+    def write(self, data):
+        if self.closing:
+            return
+        self.writes.append(bytes(data))
+        self.pending += len(data)
+        if (self.limit is not None and self.pending > self.limit and
+                not self.paused):
+            self.paused = True
+            self.proto.pause_writing()
+
+    def flush(self):
+        self.pending = 0
+        if self.paused:
+            self.paused = False
+            self.proto.resume_writing()
+
+    def is_closing(self):
+        return self.closing
+
+    def abort(self):
+        self.closing = True
+
+    def data(self):
+        return b''.join(self.writes)
+
+
+@unittest.skipIf(six.PY2, 'the server needs Python 3')
+class TestServerProto(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.conn = AsyncLocalConnection(
+            self.loop, DbBackend(None, bindata_page_size=0x100))
+        self.nid = NodeID()
+        self.data = bytes(bytearray(x * 7 & 0xff for x in range(0x1000)))
+        self.conn.tracker.transaction([], [
+            operation.OperationCreate(node=self.nid,
+                                      bindata={'x': self.data}),
+        ])
+        self.proto = ServerProto(self.conn, b'')
+        self.connect()
+
+    def connect(self, limit=None):
+        self.transport = FakeTransport(self.proto, limit)
+        self.proto.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_steps(self, num=10):
+        for _ in range(num):
+            self.loop.run_until_complete(asyncio.sleep(0))
+
+    def get_bindata(self, start, end):
+        return self.loop.create_task(self.proto.msg_get_bindata(
+            messages.MsgGetBinData(
+                qid=1, id=self.nid, key='x', start=start, end=end)))
+
+    def received(self):
+        unpacker = msgpackwrap.MsgpackWrapper().unpacker
+        unpacker.feed(self.transport.data())
+        return [messages.MsgpackMsg.load(x) for x in unpacker]
+
+    def test_get_bindata(self):
+        task = self.get_bindata(0x10, 0x310)
+        self.loop.run_until_complete(task)
+        self.assertEqual(self.received(), [
+            messages.MsgGetBinDataReply(qid=1, data=self.data[0x10:0x310]),
+        ])
+        # The pages are written one by one.
+        self.assertIn(self.data[0x100:0x200], self.transport.writes)
+        self.transport.writes = []
+        task = self.get_bindata(0x2000, 0x3000)
+        self.loop.run_until_complete(task)
+        self.assertEqual(self.received(), [
+            messages.MsgGetBinDataReply(qid=1, data=b''),
+        ])
+        self.transport.writes = []
+        self.nid = NodeID()
+        self.loop.run_until_complete(self.get_bindata(0, 1))
+        self.assertEqual(self.received(), [
+            messages.MsgQueryError(qid=1, err=ObjectGoneError()),
+        ])
+
+    def test_flow_control(self):
+        self.connect(limit=0xff)
+        other = messages.MsgGetBinDataReply(qid=2, data=b'other')
+        task = self.get_bindata(0x80, 0x380)
+        self.run_steps()
+        self.assertFalse(task.done())
+        self.assertEqual(self.transport.writes[-1], self.data[0x100:0x200])
+        # Other messages wait until the reply is done.
+        self.proto.send_msg(other)
+        self.assertNotIn(b'other', self.transport.data())
+        self.transport.flush()
+        self.run_steps()
+        self.assertFalse(task.done())
+        self.assertEqual(self.transport.writes[-1], self.data[0x200:0x300])
+        self.transport.flush()
+        self.loop.run_until_complete(task)
+        self.assertEqual(self.received(), [
+            messages.MsgGetBinDataReply(qid=1, data=self.data[0x80:0x380]),
+            other,
+        ])
+        # A closed connection stops the reply.
+        self.transport.writes = []
+        task = self.get_bindata(0, 0x300)
+        self.run_steps()
+        self.transport.abort()
+        self.proto.connection_lost(None)
+        self.loop.run_until_complete(task)
+        self.assertEqual(self.transport.writes[-1], self.data[:0x100])
+
+    def test_changed(self):
+        # A reply that can't be finished aborts the connection, instead of
+        # sending a broken message (or mixing old and new data).
+        self.connect(limit=0xff)
+        other = messages.MsgGetBinDataReply(qid=2, data=b'other')
+        task = self.get_bindata(0, 0x300)
+        self.run_steps()
+        self.proto.send_msg(other)
+        self.conn.tracker.transaction([], [
+            operation.OperationSetBinData(node=self.nid, key='x',
+                                          start=0x200, data=b'abc'),
+        ])
+        self.transport.limit = None
+        self.transport.flush()
+        self.loop.run_until_complete(task)
+        self.assertTrue(self.transport.closing)
+        self.assertEqual(self.transport.writes[-1], self.data[:0x100])
+        self.assertNotIn(b'other', self.transport.data())
+
+    def test_wrong_size(self):
+        msg = messages.MsgGetBinDataReply(qid=1, data=b'')
+        for chunks, ok in [
+            ([b'ab', b'cd'], True),
+            ([b'abcd'], True),
+            ([b'ab', b'c'], False),
+            ([b'abcd', b'e'], False),
+            ([b'abc', b'de'], False),
+        ]:
+            self.connect()
+            self.loop.run_until_complete(
+                self.proto.send_msg_chunks(msg, 'data', 4, chunks))
+            self.assertEqual(self.transport.closing, not ok)
+            if ok:
+                self.assertEqual(self.received(), [
+                    messages.MsgGetBinDataReply(qid=1, data=b'abcd'),
+                ])
+        # Errors from the first chunk leave the stream alone.
+
+        def failing():
+            raise BinDataChangedError()
+            yield b''
+
+        self.connect()
+        with self.assertRaises(BinDataChangedError):
+            self.loop.run_until_complete(
+                self.proto.send_msg_chunks(msg, 'data', 4, failing()))
+        self.assertFalse(self.transport.closing)
+        self.assertEqual(self.transport.writes, [])
+        self.proto.send_msg(msg)
+        self.assertEqual(self.received(), [msg])
@@ -0,0 +1,126 @@
+# Copyright 2017 CodiLime
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import unicode_literals
+
+import hashlib
+import unittest
+
+import six
+
+from veles.data.bindata import BinData
+from veles.db.backend import DbBackend
+from veles.proto import check, operation, search
+from veles.schema.nodeid import NodeID
+
+if six.PY3:
+    import asyncio
+
+    from veles.server.conn import AsyncLocalConnection
+    from veles.server.query import CheckSubscriberBinDataHash
+
+
+class Manager(object):
+    def __init__(self):
+        self.invalidated = 0
+
+    def invalidate(self):
+        self.invalidated += 1
+
+
+@unittest.skipIf(six.PY2, 'the server needs Python 3')
+class TestFindBinData(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.conn = AsyncLocalConnection(self.loop, DbBackend(None))
+        self.nid = NodeID()
+        # Default page size is 0x10000 - the matches straddle pages.
+        self.data = (b'\0' * 0xfffd + b'abc') * 3 + b'ab'
+        self.conn.tracker.transaction([], [
+            operation.OperationCreate(node=self.nid,
+                                      bindata={'a': self.data}),
+        ])
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def params(self, raw, width=8, mask=None, key='a', **kwargs):
+        return search.FindBinDataParams(
+            key=key,
+            pattern=BinData.from_raw_data(width, raw),
+            mask=None if mask is None else BinData.from_raw_data(width, mask),
+            **kwargs)
+
+    def find(self, *args, **kwargs):
+        checks = []
+        res = self.loop.run_until_complete(self.conn.get_query(
+            self.nid, search.find_bindata, self.params(*args, **kwargs),
+            checks))
+        return res, checks
+
+    def test_find(self):
+        for args, kwargs, offsets in [
+            ((b'abc',), {}, [0xfffd, 0x1fffd, 0x2fffd]),
+            ((b'abc',), {'start': 0xfffe}, [0x1fffd, 0x2fffd]),
+            ((b'abc',), {'start': 0xfffd, 'end': 0x1ffff}, [0xfffd]),
+            ((b'bc', 16), {}, [0xfffe, 0x1fffe, 0x2fffe]),
+            ((b'bc', 16), {'start': 1}, []),
+            ((b'a\0c', 8, b'\xff\0\xff'), {'start': 0x1fffc},
+             [0x1fffd, 0x2fffd]),
+            ((b'abc',), {'key': 'b'}, []),
+            ((b'abc',), {'start': 5, 'end': 5}, []),
+        ]:
+            res, _ = self.find(*args, **kwargs)
+            self.assertEqual(res.offsets, offsets)
+            self.assertEqual(res.next, None)
+
+    def test_batches(self):
+        # Each batch only reads up to the page with the match after it,
+        # and depends only on the data it read.
+        res, checks = self.find(b'abc', max_results=1)
+        self.assertEqual(res.offsets, [0xfffd])
+        self.assertEqual(res.next, 0x1fffd)
+        hash_check = checks[-1]
+        self.assertEqual(hash_check, check.CheckBinDataHash(
+            node=self.nid, key='a', start=0, end=0x20000,
+            hash=hashlib.sha256(self.data[:0x20000]).digest()))
+        res, checks = self.find(b'abc', max_results=1, start=res.next)
+        self.assertEqual(res.offsets, [0x1fffd])
+        self.assertEqual(res.next, 0x2fffd)
+        self.assertEqual(checks[-1].start, 0x1fffd)
+        res, checks = self.find(b'abc', max_results=1, start=res.next)
+        self.assertEqual(res.offsets, [0x2fffd])
+        self.assertEqual(res.next, None)
+        self.assertEqual(checks[-1].end, None)
+
+        # Only writes to the range read rerun a subscribed query.
+        manager = Manager()
+        sub = CheckSubscriberBinDataHash(self.conn, hash_check, manager)
+        tracker = self.conn.tracker
+        self.assertTrue(tracker.checks_ok([hash_check]))
+        tracker.transaction([], [
+            operation.OperationSetBinData(node=self.nid, key='a',
+                                          start=0x28000, data=b'abc'),
+        ])
+        self.assertTrue(tracker.checks_ok([hash_check]))
+        self.assertEqual(manager.invalidated, 0)
+        tracker.transaction([], [
+            operation.OperationSetBinData(node=self.nid, key='a',
+                                          start=0x100, data=b'abc'),
+        ])
+        self.assertFalse(tracker.checks_ok([hash_check]))
+        self.assertEqual(manager.invalidated, 1)
+        sub.cancel()